@@ -0,0 +1,104 @@
+"""
+Benchmark de HttpSession frente a llamadas sueltas de requests contra servidores
+stub locales (uno por servicio: portainer, dnsserver, nginxmanager).
+
+Uso (desde el directorio app):
+    python -m benchmarks.bench_http_session [llamadas_por_hilo] [hilos]
+"""
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from modules.helpers.http_session import HttpSession
+
+SERVICES = ['portainer', 'dnsserver', 'nginxmanager']
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_GET(self):
+        body = b'{"status": "ok"}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server() -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.connections = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run(servers, call, calls_per_thread: int, threads: int):
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(service):
+        url = f'http://127.0.0.1:{servers[service].server_address[1]}/api'
+        local = []
+        for _ in range(calls_per_thread):
+            start = time.perf_counter()
+            call(service, url)
+            local.append((time.perf_counter() - start) * 1000)
+        with lock:
+            latencies.extend(local)
+
+    for server in servers.values():
+        server.connections = 0
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(worker, [SERVICES[i % len(SERVICES)] for i in range(threads)]))
+    elapsed = time.perf_counter() - start
+
+    connections = sum(server.connections for server in servers.values())
+    return elapsed, latencies, connections
+
+
+def report(title, elapsed, latencies, connections):
+    print(f'{title}')
+    print(f'  llamadas:            {len(latencies)}')
+    print(f'  conexiones abiertas: {connections}')
+    print(f'  tiempo total:        {elapsed:.3f} s')
+    print(f'  latencia media:      {statistics.mean(latencies):.3f} ms')
+    print(f'  latencia p95:        {statistics.quantiles(latencies, n=20)[-1]:.3f} ms')
+
+
+def main():
+    calls_per_thread = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 6
+
+    servers = {service: start_stub_server() for service in SERVICES}
+    sessions = {service: HttpSession(service, pool_size=threads, timeout=5) for service in SERVICES}
+
+    report('requests.get (sin pool)', *run(
+        servers, lambda service, url: requests.get(url, timeout=5), calls_per_thread, threads))
+    report('HttpSession (pool keep-alive)', *run(
+        servers, lambda service, url: sessions[service].get(url), calls_per_thread, threads))
+
+    for server in servers.values():
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
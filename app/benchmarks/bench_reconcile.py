@@ -0,0 +1,73 @@
+"""
+Benchmark de ReconcileEngine frente a la comparación original con any(startswith)
+anidados, sobre stacks, registros y servidores fijos sintéticos. Comprueba además
+que ambos calculan el mismo plan.
+
+Uso (desde el directorio app):
+    python -m benchmarks.bench_reconcile [stacks] [dominios_por_stack] [huerfanos]
+"""
+import random
+import sys
+import time
+
+from modules.helpers.reconcile_engine import ReconcileEngine
+
+DOMAIN = 'example.com'
+
+
+def build_data(num_stacks: int, domains_per_stack: int, num_orphans: int):
+    random.seed(0)
+    stacks = [{'Name': f'stack{i}', 'Id': i} for i in range(num_stacks)]
+    items = [
+        {'domain': f"stack{i}-{j}-host-{8000 + j}.{DOMAIN}"}
+        for i in range(num_stacks)
+        # Uno de cada diez stacks no tiene dominios (hay que añadirlos)
+        if i % 10 != 0
+        for j in range(domains_per_stack)
+    ]
+    items += [{'domain': f'orphan{i}-1-host-80.{DOMAIN}'} for i in range(num_orphans)]
+    servers_fixed = [{'domain': f'fixed{i}.{DOMAIN}'} for i in range(20)]
+    items += [{'domain': f'fixed{i}.{DOMAIN}'} for i in range(0, 20, 2)]
+    random.shuffle(items)
+    return stacks, items, servers_fixed
+
+
+def naive_plan(stacks, items, servers_fixed):
+    return {
+        'stacks_to_add': [s for s in stacks if not any(d['domain'].startswith(s['Name']) for d in items)],
+        'items_to_delete': [
+            item for item in items
+            if not any(item['domain'].startswith(s['Name']) for s in stacks)
+            and not any(f['domain'].startswith(item['domain']) for f in servers_fixed)
+        ],
+        'servers_fixed_to_add': [f for f in servers_fixed if not any(f['domain'] == d['domain'] for d in items)]
+    }
+
+
+def measure(plan, *args):
+    start = time.perf_counter()
+    result = plan(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    num_stacks = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    domains_per_stack = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    num_orphans = int(sys.argv[3]) if len(sys.argv) > 3 else 1000
+    stacks, items, servers_fixed = build_data(num_stacks, domains_per_stack, num_orphans)
+
+    print(f'{len(stacks)} stacks, {len(items)} dominios, {len(servers_fixed)} servidores fijos')
+    naive, naive_time = measure(naive_plan, stacks, items, servers_fixed)
+    engine, engine_time = measure(ReconcileEngine.plan, stacks, items, servers_fixed)
+
+    for key in naive:
+        assert naive[key] == engine[key], f'Planes distintos en {key}'
+
+    print(f"plan: {len(engine['stacks_to_add'])} stacks a añadir, {len(engine['items_to_delete'])} dominios a eliminar, "
+          f"{len(engine['servers_fixed_to_add'])} servidores fijos a añadir")
+    print(f'any(startswith)  {naive_time * 1000:10.1f} ms')
+    print(f'ReconcileEngine  {engine_time * 1000:10.1f} ms  ({naive_time / engine_time:.0f}x)')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,5 @@
 import os
+import signal
 import sys
 import threading
 import time
@@ -25,8 +26,19 @@ if os.getenv('DEBUG') is None:
 manager = Manager()
 
 
+def shutdown(*_):
+    UtilsLog.info("Apagando aplicación...")
+    # atexit no se ejecuta con SIGTERM (docker stop) ni mientras siguen vivos los hilos no daemon de
+    # los monitores: se vuelcan a mano los accesos y las posiciones de los logs pendientes y se sale
+    # sin esperarlos (si no, al reiniciar se releerían las últimas líneas como accesos nuevos)
+    manager.common.last_accesses_to_stacks.flush()
+    manager.log_offset_store.flush(force=True)
+    os._exit(0)
+
+
 if __name__ == "__main__":
     threads = [
+        threading.Thread(target=lambda: manager.portainer_events.init(), daemon=True, name="PortainerEvents"),
         threading.Thread(target=lambda: MonitorStackSleep(manager).init(), daemon=False, name="MonitorStackSleep"),
         threading.Thread(target=lambda: MonitorStackAwake(manager).init(), daemon=False, name="MonitorStackAwake"),
         threading.Thread(target=lambda: MonitorDnsserverAndNginxManager(manager).init(), daemon=False, name="MonitorDnsserverAndNginxManager"),
@@ -35,6 +47,8 @@ if __name__ == "__main__":
         threading.Thread(target=lambda: MonitorStackBackup(manager).init(), daemon=False, name="MonitorStackBackup")
     ]
 
+    signal.signal(signal.SIGTERM, shutdown)
+
     for t in threads:
         t.start()
 
@@ -42,5 +56,4 @@ if __name__ == "__main__":
         while True:
             time.sleep(1)
     except KeyboardInterrupt:
-        UtilsLog.info("Apagando aplicación...")
-        sys.exit(0)
+        shutdown()
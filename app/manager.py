@@ -1,13 +1,19 @@
 import sys
+from concurrent.futures import ThreadPoolExecutor
 
 from dotenv import load_dotenv
 
+from modules.helpers.async_api import AsyncPortainerApi, AsyncDnsserverApi, AsyncNginxManagerApi
 from modules.helpers.common import Common
 from modules.helpers.conf import Conf
 from modules.helpers.dnsserver_api import DnsserverApi
+from modules.helpers.log_offset_store import LogOffsetStore
 from modules.helpers.nginx_manager_api import NginxManagerApi
 from modules.helpers.portainer_api import PortainerApi
+from modules.helpers.portainer_events import PortainerEvents
 from modules.helpers.rclone_api import RcloneApi
+from modules.helpers.sqlite import Sqlite
+from modules.helpers.stack_lifecycle_executor import StackLifecycleExecutor
 
 
 class Manager:
@@ -16,26 +22,40 @@ class Manager:
 
         conf = Conf.get_conf()
 
+        # Estado que debe sobrevivir a reinicios (posiciones de logs, ...); por defecto dentro
+        # de /app, que es el directorio montado como volumen
+        self.state_sqlite = Sqlite(conf.get('SQLITE_STATE_FILENAME', 'state.sqlite'))
+        self.log_offset_store = LogOffsetStore(self.state_sqlite)
+
         self.portainer_api = PortainerApi(
             endpoint=conf.get('PORTAINER_ENDPOINT'),
             username=conf.get('PORTAINER_USERNAME'),
             password=conf.get('PORTAINER_PASSWORD'),
             endpoint_id=conf.get('PORTAINER_ENDPOINT_ID')
         )
-        self.portainer_api.login()
+        self.portainer_events = PortainerEvents(self.portainer_api)
 
         self.dnsserver_api = DnsserverApi(
             endpoint=conf.get('DNSSERVER_ENDPOINT'),
             username=conf.get('DNSSERVER_USERNAME'),
             password=conf.get('DNSSERVER_PASSWORD')
         )
-        self.dnsserver_api.login()
 
         self.nginx_manager_api = NginxManagerApi(
             endpoint=conf.get('NGINXMANAGER_ENDPOINT'),
             username=conf.get('NGINXMANAGER_USERNAME'),
             password=conf.get('NGINXMANAGER_PASSWORD')
         )
-        self.nginx_manager_api.login()
+
+        # Login inicial de los tres servicios en paralelo; cada TokenManager programa después
+        # la renovación de su token antes de que caduque
+        apis = [self.portainer_api, self.dnsserver_api, self.nginx_manager_api]
+        with ThreadPoolExecutor(max_workers=len(apis)) as executor:
+            list(executor.map(lambda api: api.token_manager.ensure(), apis))
+
+        self.portainer_api_async = AsyncPortainerApi(self.portainer_api)
+        self.dnsserver_api_async = AsyncDnsserverApi(self.dnsserver_api)
+        self.nginx_manager_api_async = AsyncNginxManagerApi(self.nginx_manager_api)
+        self.stack_lifecycle_executor = StackLifecycleExecutor(self.portainer_api_async)
         self.rclone_api = RcloneApi()
         self.common = Common(self)
@@ -0,0 +1,90 @@
+import atexit
+import threading
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from modules.helpers.conf import Conf
+from modules.helpers.sqlite import Sqlite
+
+
+class ActivityRegistry:
+    """
+    Último acceso a cada stack. Se usa como un diccionario nombre de stack ->
+    datetime, es seguro entre hilos y se persiste en sqlite en segundo plano
+    (como mucho una escritura cada ACTIVITY_REGISTRY_FLUSH_INTERVAL_IN_SECONDS
+    con todos los cambios acumulados). Se carga al arrancar, de modo que tras un
+    reinicio no se consideran inactivos todos los stacks. Los listeners reciben
+    cada nuevo acceso (p.ej. para reprogramar la parada del stack).
+    """
+
+    def __init__(self, sqlite: Sqlite, flush_interval: float = None):
+        self.sqlite = sqlite
+        self.flush_interval = flush_interval if flush_interval is not None \
+            else Conf.get_conf().get('ACTIVITY_REGISTRY_FLUSH_INTERVAL_IN_SECONDS', 10)
+        self.sqlite.execute("""
+            CREATE TABLE IF NOT EXISTS stack_activity (
+                stack_name TEXT PRIMARY KEY,
+                last_access REAL NOT NULL
+            )
+        """)
+        self.last_accesses: Dict[str, datetime] = {
+            stack_name: datetime.fromtimestamp(last_access)
+            for stack_name, last_access in self.sqlite.fetchall("SELECT stack_name, last_access FROM stack_activity")
+        }
+        self.dirty: Dict[str, datetime] = {}
+        self._lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+        self.listeners: List[Callable[[str, datetime], None]] = []
+        atexit.register(self.flush)
+
+    def add_listener(self, listener: Callable[[str, datetime], None]):
+        self.listeners.append(listener)
+
+    def record(self, stack_name: str, when: datetime = None):
+        when = when if when is not None else datetime.now()
+        with self._lock:
+            last_access = self.last_accesses.get(stack_name)
+            if last_access is not None and last_access >= when:
+                return
+            self.last_accesses[stack_name] = when
+            self.dirty[stack_name] = when
+            if self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+        for listener in self.listeners:
+            listener(stack_name, when)
+
+    def flush(self):
+        with self._lock:
+            dirty, self.dirty = self.dirty, {}
+            self._timer = None
+        if dirty:
+            self.sqlite.executemany("""
+                INSERT INTO stack_activity (stack_name, last_access) VALUES (?, ?)
+                ON CONFLICT(stack_name) DO UPDATE SET last_access = excluded.last_access
+            """, [(stack_name, when.timestamp()) for stack_name, when in dirty.items()])
+
+    def get(self, stack_name: str, default: Optional[datetime] = None) -> Optional[datetime]:
+        with self._lock:
+            return self.last_accesses.get(stack_name, default)
+
+    def items(self) -> List[Tuple[str, datetime]]:
+        with self._lock:
+            return list(self.last_accesses.items())
+
+    def __getitem__(self, stack_name: str) -> datetime:
+        with self._lock:
+            return self.last_accesses[stack_name]
+
+    def __setitem__(self, stack_name: str, when: datetime):
+        self.record(stack_name, when)
+
+    def __contains__(self, stack_name: str) -> bool:
+        with self._lock:
+            return stack_name in self.last_accesses
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self.last_accesses)
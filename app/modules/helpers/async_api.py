@@ -0,0 +1,104 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Iterable, List, Optional
+
+from modules.helpers.dnsserver_api import DnsserverApi
+from modules.helpers.nginx_manager_api import NginxManagerApi
+from modules.helpers.portainer_api import PortainerApi
+
+
+class AsyncApi:
+    """
+    Variante asyncio de un cliente de servicio. Expone los mismos métodos
+    públicos que el cliente síncrono como corrutinas, de modo que se conservan
+    auto_login, la caché de inventario y el pool HTTP compartido. Las llamadas
+    se ejecutan en un pool de hilos del tamaño del pool de conexiones del
+    servicio, por lo que se pueden lanzar muchas a la vez desde un único bucle
+    de eventos.
+
+    No es un cliente asyncio nativo con los síncronos como envoltorio: los
+    monitores son hilos sin bucle de eventos y TokenManager, auto_login y
+    PortainerInventory se comparten entre ellos con locks de threading, lo que
+    obligaría a mantener dos implementaciones de cada cliente y una librería
+    HTTP asíncrona más. La concurrencia queda limitada por los hilos del pool,
+    que coinciden con las conexiones que el servicio admite a la vez, de modo
+    que más corrutinas no darían más peticiones simultáneas.
+    """
+
+    def __init__(self, api: Any, max_workers: int = None):
+        self.api = api
+        max_workers = max_workers if max_workers is not None else api.http.pool_size
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=type(api).__name__)
+
+    async def call(self, name: str, *args, **kwargs) -> Any:
+        """Ejecuta el método name del cliente síncrono en el pool de hilos"""
+        method = getattr(self.api, name)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(method, *args, **kwargs))
+
+    def __getattr__(self, name: str) -> Any:
+        # Solo se exponen los métodos públicos del cliente: un nombre mal escrito o un atributo
+        # que no es un método falla al acceder a él y no al esperar la corrutina
+        # Sin api (copy o pickle crean la instancia sin __init__) se recurriría a __getattr__ sin fin
+        api = self.__dict__.get('api')
+        if name.startswith('_') or api is None:
+            raise AttributeError(name)
+        attr = getattr(api, name)
+        if not callable(attr):
+            raise AttributeError(f'{type(api).__name__}.{name} no es un método')
+
+        @functools.wraps(attr)
+        async def method(*args, **kwargs):
+            return await self.call(name, *args, **kwargs)
+
+        return method
+
+    @staticmethod
+    async def gather(awaitables: Iterable[Awaitable], limit: Optional[int] = None) -> List[Any]:
+        """
+        Ejecuta las corrutinas de forma concurrente con un máximo opcional de
+        llamadas simultáneas. Las excepciones se devuelven como resultado.
+        """
+        if limit is None:
+            return await asyncio.gather(*awaitables, return_exceptions=True)
+
+        semaphore = asyncio.Semaphore(limit)
+
+        async def limited(awaitable: Awaitable):
+            async with semaphore:
+                return await awaitable
+
+        return await asyncio.gather(*(limited(a) for a in awaitables), return_exceptions=True)
+
+    @staticmethod
+    def run(awaitables: Iterable[Awaitable], limit: Optional[int] = None) -> List[Any]:
+        """Punto de entrada para los monitores, que se ejecutan en hilos sin bucle de eventos"""
+        return asyncio.run(AsyncApi.gather(awaitables, limit))
+
+
+class AsyncPortainerApi(AsyncApi):
+    def __init__(self, portainer_api: PortainerApi, max_workers: int = None):
+        super().__init__(portainer_api, max_workers)
+
+    async def start_stack_by_stack_id(self, stack_id) -> bool:
+        return await self.call('start_stack_by_stack_id', stack_id)
+
+    async def stop_stack_by_stack_id(self, stack_id) -> bool:
+        return await self.call('stop_stack_by_stack_id', stack_id)
+
+
+class AsyncDnsserverApi(AsyncApi):
+    def __init__(self, dnsserver_api: DnsserverApi, max_workers: int = None):
+        super().__init__(dnsserver_api, max_workers)
+
+    async def delete_record(self, domain: str) -> bool:
+        return await self.call('delete_record', domain)
+
+
+class AsyncNginxManagerApi(AsyncApi):
+    def __init__(self, nginx_manager_api: NginxManagerApi, max_workers: int = None):
+        super().__init__(nginx_manager_api, max_workers)
+
+    async def delete_proxy_by_id(self, id) -> bool:
+        return await self.call('delete_proxy_by_id', id)
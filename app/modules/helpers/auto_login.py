@@ -1,34 +1,106 @@
-import datetime
+import base64
 import functools
-from typing import Callable, Any
+import json
+import threading
+import time
+from typing import Callable, Any, Optional
+
+from modules.helpers.conf import Conf
+from modules.helpers.http_session import HttpSession
+from utils.utils_log import UtilsLog
+
+
+class TokenManager:
+    """
+    Gestiona el token de sesión de un cliente (PortainerApi, DnsserverApi,
+    NginxManagerApi). La caducidad se lee del claim 'exp' del JWT o, si el
+    token no es un JWT, se usa la duración de sesión indicada. El token se
+    renueva en segundo plano antes de caducar y, si varios hilos necesitan
+    renovarlo a la vez, solo uno hace login y el resto reutiliza el resultado.
+    """
+
+    def __init__(self, api: Any, session_ttl: float = 300):
+        self.api = api
+        self.session_ttl = session_ttl
+        self.refresh_margin = Conf.get_conf().get('AUTO_LOGIN_REFRESH_MARGIN_IN_SECONDS', 60)
+        self.expires_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+
+    @staticmethod
+    def get_jwt_expiration(token: str) -> Optional[float]:
+        try:
+            parts = token.split('.')
+            if len(parts) != 3:
+                return None
+            payload = parts[1] + '=' * (-len(parts[1]) % 4)
+            return float(json.loads(base64.urlsafe_b64decode(payload))['exp'])
+        except Exception:
+            return None
+
+    def is_valid(self) -> bool:
+        return self.api.token is not None \
+            and self.expires_at is not None \
+            and time.time() < self.expires_at - self.refresh_margin
+
+    def ensure(self) -> bool:
+        return self.is_valid() or self.refresh()
+
+    def refresh(self, stale_token: Optional[str] = None, force: bool = False) -> bool:
+        """
+        Hace login si hace falta. Con stale_token (respuesta 401 con ese token) solo
+        se hace login si ningún otro hilo lo ha renovado ya mientras se esperaba.
+        """
+        with self._lock:
+            if not force:
+                if stale_token is not None and self.api.token != stale_token and self.is_valid():
+                    return True
+                if stale_token is None and self.is_valid():
+                    return True
+
+            if not self.api.login():
+                self._schedule(30)
+                return False
+
+            expires_at = self.get_jwt_expiration(self.api.token)
+            self.expires_at = expires_at if expires_at is not None else time.time() + self.session_ttl
+            self._schedule(self.expires_at - self.refresh_margin - time.time())
+            return True
+
+    def _schedule(self, delay: float):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = threading.Timer(max(delay, 1), self._background_refresh)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _background_refresh(self):
+        UtilsLog.debug(f'{type(self.api).__name__}: renovando token en segundo plano')
+        self.refresh(force=True)
 
 
 def auto_login(func: Callable) -> Callable:
     """
-    Decorador que ejecuta login automáticamente si han pasado 5 minutos
-    desde el último login o si no hay token válido.
+    Decorador que garantiza un token válido antes de ejecutar la llamada (ver
+    TokenManager) y, si el servicio responde que el token no es válido (401),
+    renueva el token una única vez y repite la llamada.
     """
 
     @functools.wraps(func)
     def wrapper(self, *args, **kwargs) -> Any:
-        # Verificar si existe last_login_time, si no, inicializarlo
-        if not hasattr(self, 'last_login_time'):
-            self.last_login_time = None
-
-        # Verificar si necesita hacer login
-        needs_login = (
-                self.token is None or
-                self.last_login_time is None or
-                (datetime.datetime.now() - self.last_login_time).total_seconds() > 300  # 5 minutos = 300 segundos
-        )
-
-        if needs_login:
-            if self.login():
-                self.last_login_time = datetime.datetime.now()
-            else:
-                raise Exception("No se pudo realizar el login automático")
-
-        # Ejecutar la función original
-        return func(self, *args, **kwargs)
-
-    return wrapper
\ No newline at end of file
+        if not self.token_manager.ensure():
+            raise Exception("No se pudo realizar el login automático")
+
+        token = self.token
+        HttpSession.reset_unauthorized()
+        result = func(self, *args, **kwargs)
+
+        if HttpSession.was_unauthorized():
+            HttpSession.reset_unauthorized()
+            UtilsLog.info(f'{type(self).__name__} ({func.__name__}): token rechazado, renovando y reintentando')
+            if self.token_manager.refresh(stale_token=token):
+                result = func(self, *args, **kwargs)
+
+        return result
+
+    return wrapper
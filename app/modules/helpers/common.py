@@ -1,13 +1,18 @@
 import re
-import time
-from typing import TYPE_CHECKING, List
+import threading
+from datetime import datetime
+from typing import TYPE_CHECKING, Dict, List, Optional, Set, Tuple
 
+from modules.helpers.activity_registry import ActivityRegistry
+from modules.helpers.compose_resolver import ComposeResolver
 from modules.helpers.conf import Conf
 from modules.helpers.dnsserver_api import DnsserverDomainModel
 from modules.helpers.nginx_manager_api import NginxProxyModel
-from modules.helpers.portainer_api import PortainerStack, PortainerEndpoint
+from modules.helpers.portainer_api import PortainerStack, PortainerEndpoint, PortainerContainer, \
+    PortainerContainerPort
+from modules.helpers.portainer_events import DockerEvent
+from modules.helpers.protocol_cache import ProtocolCache
 from utils.utils_log import UtilsLog
-from utils.utils_network import UtilsNetwork
 
 if TYPE_CHECKING:
     from manager import Manager
@@ -17,8 +22,51 @@ class Common:
 
     def __init__(self, manager:  "Manager"):
         self.manager = manager
-        self.last_accesses_to_stacks = {}
+        self.last_accesses_to_stacks = ActivityRegistry(self.manager.state_sqlite)
+        self.protocol_cache = ProtocolCache(self.manager.state_sqlite)
+        self.compose_resolver = ComposeResolver(self.manager.portainer_api)
+        self.last_use_of_images: Dict[str, datetime] = {}
+        self.images_of_stacks: Dict[str, Set[str]] = {}
+        # Los escribe el hilo de PortainerEvents y los recorre MonitorClear
+        self._images_lock = threading.Lock()
         self.conf = Conf.get_conf()
+        self.nginxmanager_container_name_regex = re.compile(
+            rf"\b([a-zA-Z0-9]+-\d+)-[a-zA-Z0-9-]*\.{re.escape(self.conf.get('DOMAIN', ''))}\b"
+        )
+        self.manager.portainer_events.add_listener(self.on_docker_event)
+
+    def register_access_to_stack(self, stack_name: str):
+        now = datetime.now()
+        self.last_accesses_to_stacks.record(stack_name, now)
+        with self._images_lock:
+            for image_id in self.images_of_stacks.get(stack_name, ()):
+                self.last_use_of_images[image_id] = now
+
+    def register_images_of_stack(self, stack: PortainerStack):
+        with self._images_lock:
+            for container in stack['Containers']:
+                self.images_of_stacks.setdefault(stack['Name'], set()).add(container['ImageID'])
+
+    def get_images_usage(self) -> Tuple[Dict[str, datetime], Dict[str, Set[str]]]:
+        """Copia de last_use_of_images e images_of_stacks que se puede recorrer sin el lock"""
+        with self._images_lock:
+            return dict(self.last_use_of_images), {
+                stack_name: set(image_ids) for stack_name, image_ids in self.images_of_stacks.items()
+            }
+
+    def on_docker_event(self, event: DockerEvent):
+        # Arranque de contenedor: se anota el último uso de su imagen
+        if event.get('Type') != 'container' or event.get('Action') != 'start':
+            return
+        inventory = self.manager.portainer_api.inventory
+        container = inventory.find_container(event['Actor']['ID'])
+        if container is None:
+            return
+        stack = inventory.get_stack_by_resource_control_id(container['ResourceControlId'])
+        with self._images_lock:
+            self.last_use_of_images[container['ImageID']] = datetime.now()
+            if stack is not None:
+                self.images_of_stacks.setdefault(stack['Name'], set()).add(container['ImageID'])
 
     def dnsserver_add_domain_from_portainer_stack(self, stack: PortainerStack):
 
@@ -33,102 +81,122 @@ class Common:
             UtilsLog.error(f'No encontrado nombre de endpoint para identificador {stack["EndpointId"]}')
             return
 
-        # Si los contenedores son 0, entonces el stack está parado
-        is_stopped = False
-
-        # Si el auto_login no está arrancado (Status = 1 es arrancado), se arranca
-        if stack['Status'] != 1:
-            is_stopped = True
-            self.manager.portainer_api.start_stack_by_stack_id(stack['Id'])
-            if not self.manager.common.portainer_wait_start_stack(stack):
-                return
+        web_ports = self.get_stack_web_ports(stack, is_stopped=stack['Status'] != 1)
+        if web_ports is None:
+            return
 
+        for container, port, protocol in web_ports:
+            subdomain = f"{container['Names'][0][1:]}-{endpoint_name}-{port['PublicPort']}.{domain}"
+            if self.manager.dnsserver_api.add_record(domain=subdomain):
+                UtilsLog.info(f'Agregado dominio a dnsserver: {subdomain}')
+
+    def get_stack_web_ports(self, stack: PortainerStack, is_stopped: bool
+                            ) -> Optional[List[Tuple[PortainerContainer, PortainerContainerPort, str]]]:
+        """
+        Puertos publicados del stack que sirven http o https, con su protocolo.
+        Si el stack está parado se intenta primero sin arrancarlo: puertos y
+        nombres desde el docker-compose y protocolos desde la caché. Solo si
+        falta algo se arranca, se sondean sus puertos y se vuelve a parar.
+        """
         port_init = self.conf.get('PORT_INIT_HTTP_OR_HTTPS')
         end_init = self.conf.get('PORT_END_HTTP_OR_HTTPS')
 
-        # Volver a obtener el stack con los contenedores asociados
-        stack = self.manager.portainer_api.get_stack_with_containers(stack['Name'])
-
-        for container in stack['Containers']:
-            for port in container['Ports']:
-                if 'IP' not in port or 'PublicPort' not in port:
-                    continue
-                if not (port_init < port['PublicPort'] < end_init):
-                    continue
-
-                protocol = UtilsNetwork.check_protocol(port['IP'], port['PublicPort'])
-                if protocol not in ('http', 'https'):
-                    continue
+        if is_stopped:
+            static_stack = self.compose_resolver.resolve(stack)
+            if static_stack is not None:
+                # Sin host_ip el puerto queda en 0.0.0.0, que no sirve como destino: igual que al sondear
+                # el stack arrancado, no se considera web
+                container_ports = [
+                    (container, port)
+                    for container, port in self.get_container_ports_in_range(static_stack, port_init, end_init)
+                    if port['IP'] not in (None, '', '0.0.0.0')
+                ]
+                protocols = [
+                    self.protocol_cache.get(container['ImageID'], port['PrivatePort'])
+                    for container, port in container_ports
+                ]
+                if None not in protocols:
+                    return [
+                        (container, port, protocol)
+                        for (container, port), protocol in zip(container_ports, protocols)
+                        if protocol in ('http', 'https')
+                    ]
+                UtilsLog.info(f'{stack["Name"]}: protocolos desconocidos, se arranca el stack para sondear sus puertos')
 
-                subdomain = f"{container['Names'][0][1:]}-{endpoint_name}-{port['PublicPort']}.{domain}"
-                if self.manager.dnsserver_api.add_record(domain=subdomain):
-                    UtilsLog.info(f'Agregado dominio a dnsserver: {subdomain}')
+            self.manager.portainer_api.start_stack_by_stack_id(stack['Id'])
 
-        # El contenedor estaba parado, por lo que volvemos a pararlo de nuevo
-        if is_stopped:
-            self.manager.portainer_api.stop_stack_by_stack_id(stack['Id'])
+        try:
+            if is_stopped and not self.portainer_wait_start_stack(stack):
+                return None
+
+            # Volver a obtener el stack con los contenedores asociados
+            stack_with_containers = self.manager.portainer_api.get_stack_with_containers(stack['Name'])
+            container_ports = [] if stack_with_containers is None else \
+                self.get_container_ports_in_range(stack_with_containers, port_init, end_init)
+            protocols = self.protocol_cache.get_protocols(container_ports)
+        finally:
+            # El stack estaba parado, por lo que volvemos a pararlo de nuevo (también si no ha llegado a arrancar)
+            if is_stopped:
+                self.manager.portainer_api.stop_stack_by_stack_id(stack['Id'])
+
+        return [
+            (container, port, protocol)
+            for (container, port), protocol in zip(container_ports, protocols)
+            if protocol in ('http', 'https')
+        ]
+
+    @staticmethod
+    def get_container_ports_in_range(stack: PortainerStack, port_init: int, port_end: int
+                                     ) -> List[Tuple[PortainerContainer, PortainerContainerPort]]:
+        """Puertos publicados de los contenedores del stack dentro del rango (port_init, port_end)"""
+        return [
+            (container, port)
+            for container in stack['Containers']
+            for port in container['Ports']
+            if 'IP' in port and 'PublicPort' in port and port_init < port['PublicPort'] < port_end
+        ]
 
     def dnsserver_delete_domain(self, dnsserver_domain: DnsserverDomainModel):
         self.manager.dnsserver_api.delete_record(dnsserver_domain['domain'])
         UtilsLog.info(f"Eliminado dominio de dnsserver: {dnsserver_domain['domain']}")
 
+    async def dnsserver_delete_domain_async(self, dnsserver_domain: DnsserverDomainModel):
+        await self.manager.dnsserver_api_async.delete_record(dnsserver_domain['domain'])
+        UtilsLog.info(f"Eliminado dominio de dnsserver: {dnsserver_domain['domain']}")
+
     def nginxmanager_add_proxy_from_portainer_stack(self, stack: PortainerStack):
 
         domain = self.conf.get('DOMAIN')
         endpoints = self.manager.portainer_api.get_endpoints()
 
         # Si los contenedores son 0, entonces el stack está parado
-        is_stopped = False
-        if len(stack['Containers']) == 0:
-            is_stopped = True
-            self.manager.portainer_api.start_stack_by_stack_id(stack['Id'])
-            if not self.portainer_wait_start_stack(stack):
-                return
+        web_ports = self.get_stack_web_ports(stack, is_stopped=len(stack['Containers']) == 0)
+        if web_ports is None:
+            return
 
         certificate_id = self.manager.nginx_manager_api.get_certificate_id_by_name(domain)
-        port_init = self.conf.get('PORT_INIT_HTTP_OR_HTTPS')
-        end_init = self.conf.get('PORT_END_HTTP_OR_HTTPS')
-
-        # Volver a obtener el stack con los contenedores asociados
-        stack = self.manager.portainer_api.get_stack_with_containers(stack['Name'])
-
-        for container in stack['Containers']:
-            for port in container['Ports']:
-
-                if 'IP' not in port or 'PublicPort' not in port:
-                    continue
-                if not (port_init < port['PublicPort'] < end_init):
-                    continue
-
-                protocol = UtilsNetwork.check_protocol(port['IP'], port['PublicPort'])
-                if protocol not in ('http', 'https'):
-                    continue
-
-                endpoint_name = None
-                for endpoint in endpoints:
-                    if endpoint['Id'] == stack['EndpointId']:
-                        endpoint_name = endpoint['Name']
-
-                if endpoint_name is None:
-                    pass
-
-                subdomain = f"{container['Names'][0][1:]}-{endpoint_name}-{port['PublicPort']}.{domain}"
-                if self.manager.nginx_manager_api.add_proxy(
-                    subdomain=subdomain,
-                    protocol_nginx='https',
-                    protocol_target=protocol,
-                    ip=port["IP"],
-                    port=port["PublicPort"],
-                    certificate_id=certificate_id
-                ):
-                    UtilsLog.info(f'Agregado proxy a nginx proxy manager: {subdomain}')
-
-        # El contenedor estaba parado, por lo que volvemos a pararlo de nuevo
-        if is_stopped:
-            self.manager.portainer_api.stop_stack_by_stack_id(stack['Id'])
+        for container, port, protocol in web_ports:
+            endpoint_name = None
+            for endpoint in endpoints:
+                if endpoint['Id'] == stack['EndpointId']:
+                    endpoint_name = endpoint['Name']
+
+            if endpoint_name is None:
+                pass
+
+            subdomain = f"{container['Names'][0][1:]}-{endpoint_name}-{port['PublicPort']}.{domain}"
+            if self.manager.nginx_manager_api.add_proxy(
+                subdomain=subdomain,
+                protocol_nginx='https',
+                protocol_target=protocol,
+                ip=port["IP"],
+                port=port["PublicPort"],
+                certificate_id=certificate_id
+            ):
+                UtilsLog.info(f'Agregado proxy a nginx proxy manager: {subdomain}')
 
     def nginxmanager_extract_container_name_from_log(self, line):
-        match = re.search(r"\b([a-zA-Z0-9]+-\d+)-[a-zA-Z0-9-]*\.wg\.es\b", line)
+        match = self.nginxmanager_container_name_regex.search(line)
         if match:
             return match.group(1).strip()
         return None
@@ -136,6 +204,9 @@ class Common:
     def nginxmanager_delete_proxy(self, nginx_proxy: NginxProxyModel):
         self.manager.nginx_manager_api.delete_proxy_by_id(nginx_proxy['id'])
 
+    async def nginxmanager_delete_proxy_async(self, nginx_proxy: NginxProxyModel):
+        await self.manager.nginx_manager_api_async.delete_proxy_by_id(nginx_proxy['id'])
+
     def portainer_start_stack(self, stack):
         stack_id = stack["id"] if "id" in stack else stack['Id']
         self.manager.portainer_api.start_stack_by_stack_id(stack_id)
@@ -145,13 +216,9 @@ class Common:
         self.manager.portainer_api.stop_stack_by_stack_id(stack_id)
 
     def portainer_wait_start_stack(self, stack: PortainerStack) -> bool:
-        intentos_maximo = 10
-        intentos = 0
-        while intentos < intentos_maximo:
-            for container_started in self.manager.portainer_api.get_containers():
-                if container_started['ResourceControlId'] == stack['ResourceControlId']:
-                    return True
-            intentos += 1
-            time.sleep(1)
+        timeout = self.conf.get('PORTAINER_WAIT_START_STACK_DEADLINE_IN_SECONDS', 60)
+        if self.manager.portainer_api.wait_stack_ready(stack, timeout):
+            return True
+        UtilsLog.error(f'{stack["Name"]}: no ha arrancado (running/healthy) en {timeout} segundos')
         return False
 
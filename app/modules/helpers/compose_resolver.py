@@ -0,0 +1,204 @@
+import copy
+import re
+from typing import Dict, List, Optional, Set, Tuple
+
+import yaml
+
+from modules.helpers.portainer_api import PortainerApi, PortainerStack, PortainerContainer, \
+    PortainerContainerPort
+from utils.utils_log import UtilsLog
+
+# ${VAR}, ${VAR:-default}, ${VAR-default}, ${VAR:?error}, ${VAR?error}, ${VAR:+alt}, ${VAR+alt}, $VAR y $$;
+# el valor por defecto puede contener a su vez ${OTRA}
+INTERPOLATION_REGEX = re.compile(
+    r'\$(?:(\$)|\{([A-Za-z_][A-Za-z0-9_]*)(?:(:?[-?+])((?:\$\{[^{}]*\}|[^}])*))?\}|([A-Za-z_][A-Za-z0-9_]*))'
+)
+
+# Puerto o rango de puertos: 8080 o 8080-8090
+PORT_RANGE_REGEX = re.compile(r'^(\d+)(?:-(\d+))?$')
+
+
+class ComposeUnresolvable(Exception):
+    """El compose depende de algo que solo se conoce arrancando el stack"""
+
+
+class ComposeResolver:
+    """
+    Obtiene los contenedores y puertos publicados de un stack a partir de su
+    docker-compose (/stacks/{id}/file) y las variables de entorno del stack,
+    sin arrancarlo. Los nombres siguen la convención de docker compose:
+    container_name o <stack>-<servicio>-1. Si algo no se puede resolver de
+    forma estática (variables sin valor, réplicas, extends, puertos sin
+    publicar, imagen no descargada...) se devuelve None y hay que arrancarlo.
+    """
+
+    def __init__(self, portainer_api: PortainerApi):
+        self.portainer_api = portainer_api
+
+    def resolve(self, stack: PortainerStack) -> Optional[PortainerStack]:
+        content = self.portainer_api.get_stack_file(stack['Id'])
+        if content is None:
+            return None
+
+        try:
+            compose = yaml.safe_load(content)
+            env = {variable['name']: variable['value'] for variable in stack.get('Env') or []}
+            image_ids = self._get_image_ids()
+            containers = [
+                self._to_container(stack, service_name, service, env, image_ids)
+                for service_name, service in (compose.get('services') or {}).items()
+                if not service.get('profiles')
+            ]
+        except (yaml.YAMLError, AttributeError, TypeError, ValueError, ComposeUnresolvable) as e:
+            UtilsLog.debug(f'{stack["Name"]}: compose no resoluble sin arrancar el stack ({e})')
+            return None
+
+        stack = copy.deepcopy(stack)
+        stack['Containers'] = containers
+        return stack
+
+    def get_built_images(self, stack: PortainerStack) -> Optional[Set[str]]:
+        """
+        Imágenes (tal y como aparecen en RepoTags) que el stack construye en local
+        con build. None si no se puede saber.
+        """
+        content = self.portainer_api.get_stack_file(stack['Id'])
+        if content is None:
+            return None
+
+        try:
+            compose = yaml.safe_load(content)
+            env = {variable['name']: variable['value'] for variable in stack.get('Env') or []}
+            return {
+                self._normalize_image(
+                    self.interpolate(service.get('image'), env) or f"{stack['Name'].lower()}-{service_name}"
+                )
+                for service_name, service in (compose.get('services') or {}).items()
+                if 'build' in service
+            }
+        except (yaml.YAMLError, AttributeError, TypeError, ValueError, ComposeUnresolvable) as e:
+            UtilsLog.debug(f'{stack["Name"]}: no se pueden obtener las imágenes construidas ({e})')
+            return None
+
+    def _get_image_ids(self) -> Dict[str, str]:
+        return {
+            repo_tag: image['Id']
+            for image in self.portainer_api.get_images()
+            for repo_tag in image['RepoTags'] or []
+        }
+
+    @staticmethod
+    def _normalize_image(image: str) -> str:
+        """Referencia de imagen tal y como aparece en RepoTags"""
+        if '@' in image:
+            raise ComposeUnresolvable(f'imagen por digest {image}')
+        for prefix in ('docker.io/library/', 'docker.io/', 'library/'):
+            if image.startswith(prefix):
+                image = image[len(prefix):]
+                break
+        if ':' not in image.rsplit('/', 1)[-1]:
+            image += ':latest'
+        return image
+
+    @staticmethod
+    def interpolate(value, env: Dict[str, str]):
+        if not isinstance(value, str):
+            return value
+
+        def replace(match: re.Match) -> str:
+            escaped, name, operator, argument, bare_name = match.groups()
+            if escaped:
+                return '$'
+            name = name or bare_name
+            current = env.get(name)
+            is_set = current is not None and (current != '' or operator is None or not operator.startswith(':'))
+            if operator in ('-', ':-'):
+                return current if is_set else ComposeResolver.interpolate(argument, env)
+            if operator in ('+', ':+'):
+                return ComposeResolver.interpolate(argument, env) if is_set else ''
+            if current is None or (operator in ('?', ':?') and not is_set):
+                raise ComposeUnresolvable(f'variable {name} sin valor')
+            return current
+
+        return INTERPOLATION_REGEX.sub(replace, value)
+
+    @staticmethod
+    def _parse_port_range(value: str, entry) -> Tuple[Optional[int], Optional[int]]:
+        if value == '':
+            return None, None
+        match = PORT_RANGE_REGEX.match(value)
+        if match is None:
+            raise ValueError(f'puerto no válido {entry}')
+        start = int(match[1])
+        return start, int(match[2]) if match[2] else start
+
+    @staticmethod
+    def parse_ports(entry, env: Dict[str, str]) -> List[PortainerContainerPort]:
+        """Puertos publicados de una entrada de 'ports' en sintaxis corta o larga"""
+        if isinstance(entry, dict):
+            ip = ComposeResolver.interpolate(entry.get('host_ip'), env) or None
+            published = ComposeResolver.interpolate(entry.get('published'), env)
+            target = ComposeResolver.interpolate(entry.get('target'), env)
+            protocol = ComposeResolver.interpolate(entry.get('protocol'), env) or 'tcp'
+            published = '' if published is None else str(published)
+            target = str(target)
+        else:
+            # [ip:][publicado:]privado[/protocolo], con la ip IPv6 entre corchetes
+            value, _, protocol = str(ComposeResolver.interpolate(entry, env)).strip().partition('/')
+            ip = None
+            if value.startswith('['):
+                ip, _, value = value[1:].partition(']')
+                value = value[1:]
+            parts = value.split(':')
+            if len(parts) > 3 or (ip is not None and len(parts) != 2):
+                raise ValueError(f'puerto no válido {entry}')
+            target = parts[-1]
+            published = parts[-2] if len(parts) > 1 else ''
+            ip = parts[0] if len(parts) == 3 else ip
+            protocol = protocol or 'tcp'
+        published_start, published_end = ComposeResolver._parse_port_range(published, entry)
+        target_start, target_end = ComposeResolver._parse_port_range(target, entry)
+
+        if published_start is None:
+            raise ComposeUnresolvable(f'puerto {target_start} publicado en un puerto aleatorio')
+
+        if published_end - published_start != target_end - target_start:
+            raise ComposeUnresolvable(f'rango de puertos {published_start}-{published_end} no asignable')
+
+        return [
+            PortainerContainerPort(
+                IP=ip or '0.0.0.0',
+                PrivatePort=target_start + offset,
+                PublicPort=published_start + offset,
+                Type=protocol
+            )
+            for offset in range(published_end - published_start + 1)
+        ]
+
+    def _to_container(self, stack: PortainerStack, service_name: str, service: dict, env: Dict[str, str],
+                      image_ids: Dict[str, str]) -> PortainerContainer:
+        if 'extends' in service:
+            raise ComposeUnresolvable(f'{service_name} usa extends')
+        replicas = (service.get('deploy') or {}).get('replicas', service.get('scale', 1))
+        if int(self.interpolate(replicas, env)) != 1:
+            raise ComposeUnresolvable(f'{service_name} tiene varias réplicas')
+
+        name = self.interpolate(service.get('container_name'), env) or f"{stack['Name'].lower()}-{service_name}-1"
+        # Sin image, docker compose etiqueta la imagen construida como <stack>-<servicio>
+        image = self.interpolate(service.get('image'), env) or f"{stack['Name'].lower()}-{service_name}"
+        image = self._normalize_image(image)
+        if image not in image_ids:
+            raise ComposeUnresolvable(f'imagen {image} no descargada')
+
+        return PortainerContainer(
+            Id='',
+            Image=image,
+            ImageID=image_ids[image],
+            Names=[f'/{name}'],
+            Ports=[port for entry in service.get('ports') or [] for port in self.parse_ports(entry, env)],
+            ResourceControlId=stack['ResourceControlId'],
+            State='exited',
+            Health=None,
+            ExitCode=None,
+            Mounts=[]
+        )
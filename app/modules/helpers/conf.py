@@ -57,11 +57,13 @@ class Conf:
     def get_conf():
         return Conf()
 
-    def get(self, key: str) -> Optional[Union[str, float, int, bool, list, dict]]:
+    def get(self, key: str, default=None) -> Optional[Union[str, float, int, bool, list, dict]]:
         value = self.sqlite.get(key)
         value = value if value is not None else os.getenv(key, None)
         value = type_from_env(value)
         if value is None:
+            if default is not None:
+                return default
             UtilsLog.error(f'Conf (get): {key} no es válido')
         return value
 
@@ -6,8 +6,9 @@ import requests
 from glom import glom
 from urllib3.exceptions import InsecureRequestWarning
 
-from modules.helpers.auto_login import auto_login
+from modules.helpers.auto_login import auto_login, TokenManager
 from modules.helpers.conf import Conf
+from modules.helpers.http_session import HttpSession
 from utils.utils_log import UtilsLog
 
 requests.urllib3.disable_warnings(category=InsecureRequestWarning)
@@ -25,16 +26,28 @@ class DnsserverDomainModel(TypedDict):
 
 
 class DnsserverApi:
-    def __init__(self, endpoint: str=None, username: str=None, password: str=None):
+    def __init__(self, endpoint: str=None, username: str=None, password: str=None, timeout=None):
         self.conf = Conf.get_conf()
         self.endpoint = endpoint if endpoint is not None else self.conf.get('DNSSERVER_ENDPOINT')
         self.username = username if username is not None else self.conf.get('DNSSERVER_USERNAME')
         self.password = password if password is not None else self.conf.get('DNSSERVER_PASSWORD')
+        self.timeout = timeout if timeout is not None else self.conf.get('DNSSERVER_TIMEOUT', 30)
+        self.http = HttpSession.get_session('dnsserver', timeout=self.timeout, is_unauthorized=self._is_invalid_token)
         self.token = None
+        # El token de Technitium no es un JWT: caduca tras un tiempo de sesión configurable en el servidor
+        self.token_manager = TokenManager(self, session_ttl=self.conf.get('DNSSERVER_SESSION_TTL_IN_SECONDS', 1800))
+
+    @staticmethod
+    def _is_invalid_token(response: requests.Response) -> bool:
+        # Technitium responde 200 con status 'invalid-token' cuando la sesión ha caducado
+        try:
+            return response.json().get('status') == 'invalid-token'
+        except Exception:
+            return False
 
     def login(self) -> bool:
         url = self.endpoint + f'/user/login?'
-        response = requests.get(url, params={'user': self.username, 'pass':  self.password})
+        response = self.http.get(url, params={'user': self.username, 'pass':  self.password})
         try:
             data = response.json()
             if 'token' not in data:
@@ -51,7 +64,7 @@ class DnsserverApi:
         url = self.endpoint + f'/zones/records/add'
 
         try:
-            response = requests.get(url, params={
+            response = self.http.get(url, params={
                 'token': self.token,
                 'zone': self.conf.get('DOMAIN'),
                 'domain': domain,
@@ -73,7 +86,7 @@ class DnsserverApi:
     def delete_record(self, domain: str) -> bool:
         url = self.endpoint + f'/zones/records/delete'
         try:
-            response = requests.get(url, params={
+            response = self.http.get(url, params={
                 'token': self.token,
                 'zone': self.conf.get('DOMAIN'),
                 'domain': domain,
@@ -95,7 +108,7 @@ class DnsserverApi:
     def get_records(self, domain_and_zone: str) -> List[DnsserverDomainModel]:
         url = self.endpoint + f'/zones/records/get'
         try:
-            response = requests.get(url, params={
+            response = self.http.get(url, params={
                 'token': self.token,
                 'domain': domain_and_zone,
                 'zone': domain_and_zone,
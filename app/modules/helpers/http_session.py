@@ -0,0 +1,81 @@
+import threading
+from typing import Callable, Dict, Optional, Tuple, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import InsecureRequestWarning
+
+from modules.helpers.conf import Conf
+
+requests.urllib3.disable_warnings(category=InsecureRequestWarning)
+
+Timeout = Union[None, float, Tuple[float, float]]
+
+_DEFAULT_TIMEOUT = object()
+
+
+class HttpSession:
+    """
+    Sesión HTTP con pool de conexiones keep-alive compartida por servicio
+    (Portainer, Dnsserver, Nginx Proxy Manager). Todas las instancias de un
+    mismo servicio reutilizan las conexiones TCP/TLS abiertas.
+    """
+
+    _sessions: Dict[str, 'HttpSession'] = {}
+    _lock = threading.Lock()
+    # Marca por hilo de respuesta "token no válido", consultada por auto_login para reintentar
+    _state = threading.local()
+
+    def __init__(self, name: str, pool_size: int = None, timeout: Timeout = 30, verify: bool = True,
+                 is_unauthorized: Callable[[requests.Response], bool] = None):
+        self.name = name
+        self.pool_size = pool_size if pool_size is not None else Conf.get_conf().get('HTTP_POOL_SIZE', 10)
+        self.timeout = timeout
+        self.is_unauthorized = is_unauthorized if is_unauthorized is not None else lambda r: r.status_code == 401
+
+        # pool_block evita abrir conexiones extra (que se cerrarían al devolverse) cuando
+        # todos los hilos de los monitores piden conexión a la vez
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, pool_block=True)
+        self.session = requests.Session()
+        self.session.verify = verify
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    @staticmethod
+    def get_session(name: str, pool_size: int = None, timeout: Timeout = 30, verify: bool = True,
+                    is_unauthorized: Callable[[requests.Response], bool] = None) -> 'HttpSession':
+        with HttpSession._lock:
+            if name not in HttpSession._sessions:
+                HttpSession._sessions[name] = HttpSession(
+                    name, pool_size=pool_size, timeout=timeout, verify=verify, is_unauthorized=is_unauthorized
+                )
+            return HttpSession._sessions[name]
+
+    @staticmethod
+    def reset_unauthorized():
+        HttpSession._state.unauthorized = False
+
+    @staticmethod
+    def was_unauthorized() -> bool:
+        return getattr(HttpSession._state, 'unauthorized', False)
+
+    def request(self, method: str, url: str, timeout: Optional[Timeout] = _DEFAULT_TIMEOUT, **kwargs) -> requests.Response:
+        # timeout=None se respeta explícitamente (p.ej. descargas de imágenes en streaming)
+        if timeout is _DEFAULT_TIMEOUT:
+            timeout = self.timeout
+        response = self.session.request(method, url, timeout=timeout, **kwargs)
+        if self.is_unauthorized(response):
+            HttpSession._state.unauthorized = True
+        return response
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request('POST', url, **kwargs)
+
+    def delete(self, url: str, **kwargs) -> requests.Response:
+        return self.request('DELETE', url, **kwargs)
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,107 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from utils.utils_log import UtilsLog
+
+DOCKER_HUB_REGISTRY = 'docker.io'
+
+
+class ImagePullScheduler:
+    """
+    Planificador de descargas de imágenes en paralelo con un límite global y un
+    límite por registro. Las imágenes se atienden por prioridad del stack más
+    prioritario que las usa, y en cuanto todas las imágenes de un stack han
+    terminado se ejecuta su callback (p.ej. reiniciarlo) sin esperar al resto.
+    """
+
+    def __init__(self, pull: Callable[[str], Any], max_concurrency: int = 4, max_concurrency_per_registry: int = 2):
+        self.pull = pull
+        self.max_concurrency = max_concurrency
+        self.max_concurrency_per_registry = max_concurrency_per_registry
+        self.stacks: Dict[str, Set[str]] = {}
+        self.priorities: Dict[str, Tuple] = {}
+
+    @staticmethod
+    def get_registry(image_name: str) -> str:
+        first = image_name.split('/')[0]
+        if '/' in image_name and ('.' in first or ':' in first or first == 'localhost'):
+            return first
+        return DOCKER_HUB_REGISTRY
+
+    def add_stack(self, stack_name: str, priority: Tuple, image_names: List[str]):
+        self.stacks[stack_name] = set(image_names)
+        for image_name in image_names:
+            if image_name not in self.priorities or priority < self.priorities[image_name]:
+                self.priorities[image_name] = priority
+
+    def run(self, on_stack_done: Optional[Callable[[str, Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        results: Dict[str, Any] = {}
+        pending_by_stack = {name: set(images) for name, images in self.stacks.items()}
+        stacks_by_image: Dict[str, List[str]] = {}
+        for stack_name, image_names in self.stacks.items():
+            for image_name in image_names:
+                stacks_by_image.setdefault(image_name, []).append(stack_name)
+
+        queue = sorted(self.priorities, key=lambda image_name: (self.priorities[image_name], image_name))
+        running_by_registry: Dict[str, int] = {}
+        condition = threading.Condition()
+        callbacks = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix='ImagePullCallback')
+
+        def next_job() -> Optional[str]:
+            # Imagen más prioritaria cuyo registro tenga hueco libre
+            with condition:
+                while queue:
+                    for i, image_name in enumerate(queue):
+                        registry = self.get_registry(image_name)
+                        if running_by_registry.get(registry, 0) < self.max_concurrency_per_registry:
+                            del queue[i]
+                            running_by_registry[registry] = running_by_registry.get(registry, 0) + 1
+                            return image_name
+                    condition.wait()
+                return None
+
+        def worker():
+            while True:
+                image_name = next_job()
+                if image_name is None:
+                    return
+
+                try:
+                    result = self.pull(image_name)
+                except Exception as e:
+                    UtilsLog.error(f'ImagePullScheduler ({image_name}): {e}')
+                    result = None
+
+                stacks_done = []
+                with condition:
+                    registry = self.get_registry(image_name)
+                    running_by_registry[registry] -= 1
+                    results[image_name] = result
+                    for stack_name in stacks_by_image.get(image_name, []):
+                        pending_by_stack[stack_name].discard(image_name)
+                        if len(pending_by_stack[stack_name]) == 0:
+                            stacks_done.append(stack_name)
+                    condition.notify_all()
+
+                if on_stack_done is not None:
+                    for stack_name in stacks_done:
+                        stack_results = {name: results[name] for name in self.stacks[stack_name]}
+                        callbacks.submit(self._run_callback, on_stack_done, stack_name, stack_results)
+
+        num_workers = max(1, min(self.max_concurrency, len(queue)))
+        threads = [threading.Thread(target=worker, name=f'ImagePull-{i}', daemon=True) for i in range(num_workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        callbacks.shutdown(wait=True)
+
+        return results
+
+    @staticmethod
+    def _run_callback(on_stack_done: Callable, stack_name: str, stack_results: Dict[str, Any]):
+        try:
+            on_stack_done(stack_name, stack_results)
+        except Exception as e:
+            UtilsLog.error(f'ImagePullScheduler ({stack_name}): {e}')
@@ -0,0 +1,83 @@
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from modules.helpers.conf import Conf
+from modules.helpers.sqlite import Sqlite
+
+FileKey = Tuple[int, int]
+
+
+class LogOffsetStore:
+    """
+    Posición de lectura de cada fichero de log, identificado por (dispositivo,
+    inodo) para que sobreviva a reinicios y no se confunda con un fichero rotado
+    que reutiliza el nombre. Los cambios se acumulan en memoria y se escriben en
+    sqlite como mucho cada LOG_OFFSETS_FLUSH_INTERVAL_IN_SECONDS.
+    """
+
+    def __init__(self, sqlite: Sqlite, flush_interval: float = None):
+        self.sqlite = sqlite
+        self.flush_interval = flush_interval if flush_interval is not None \
+            else Conf.get_conf().get('LOG_OFFSETS_FLUSH_INTERVAL_IN_SECONDS', 5)
+        self.sqlite.execute("""
+            CREATE TABLE IF NOT EXISTS log_offsets (
+                device INTEGER NOT NULL,
+                inode INTEGER NOT NULL,
+                path TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (device, inode)
+            )
+        """)
+        self.offsets: Dict[FileKey, Tuple[str, int]] = {
+            (device, inode): (path, position)
+            for device, inode, path, position in self.sqlite.fetchall(
+                "SELECT device, inode, path, position FROM log_offsets"
+            )
+        }
+        self.dirty: Dict[FileKey, Tuple[str, int]] = {}
+        self.forgotten: set = set()
+        self.flushed_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def get(self, key: FileKey) -> Optional[int]:
+        with self._lock:
+            offset = self.offsets.get(key)
+            return offset[1] if offset is not None else None
+
+    def set(self, key: FileKey, path: str, position: int):
+        with self._lock:
+            if self.offsets.get(key) == (path, position):
+                return
+            self.offsets[key] = (path, position)
+            self.dirty[key] = (path, position)
+            self.forgotten.discard(key)
+
+    def forget(self, key: FileKey):
+        with self._lock:
+            self.offsets.pop(key, None)
+            self.dirty.pop(key, None)
+            self.forgotten.add(key)
+
+    def flush(self, force: bool = False):
+        with self._lock:
+            if not force and time.monotonic() - self.flushed_at < self.flush_interval:
+                return
+            if not self.dirty and not self.forgotten:
+                return
+            dirty, self.dirty = self.dirty, {}
+            forgotten, self.forgotten = self.forgotten, set()
+            self.flushed_at = time.monotonic()
+
+        now = time.time()
+        self.sqlite.executemany("""
+            INSERT INTO log_offsets (device, inode, path, position, updated_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(device, inode) DO UPDATE SET
+                path = excluded.path, position = excluded.position, updated_at = excluded.updated_at
+        """, [(key[0], key[1], path, position, now) for key, (path, position) in dirty.items()])
+        self.sqlite.executemany(
+            "DELETE FROM log_offsets WHERE device = ? AND inode = ?",
+            [(key[0], key[1]) for key in forgotten]
+        )
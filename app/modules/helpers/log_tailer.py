@@ -0,0 +1,268 @@
+import ctypes
+import ctypes.util
+import fnmatch
+import glob
+import os
+import select
+import struct
+import time
+from typing import BinaryIO, Dict, List, Optional
+
+from modules.helpers.log_offset_store import LogOffsetStore, FileKey
+from utils.utils_log import UtilsLog
+
+# Constantes de <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_INOTIFY_EVENT = struct.Struct('iIII')
+
+
+class LogTailer:
+    """
+    Sigue los ficheros de un directorio que cumplen un patrón (p.ej. los
+    access.log de Nginx Proxy Manager) y devuelve las líneas nuevas. Los
+    ficheros se mantienen abiertos y, en Linux, se usa inotify sobre el
+    directorio para despertar en cuanto se escriben, se crean o se mueven
+    ficheros. Si inotify no está disponible se consulta el tamaño de cada
+    fichero cada cierto tiempo, como hasta ahora.
+
+    Con read_lines=False no se leen ni se parten las líneas: solo se indica qué
+    ficheros han crecido y se avanza su posición hasta el final.
+
+    Con offset_store las posiciones se guardan por (dispositivo, inodo): tras un
+    reinicio se continúa donde se quedó, y un fichero truncado o rotado se vuelve
+    a leer desde el principio.
+    """
+
+    def __init__(self, directory: str, pattern: str, read_lines: bool = True,
+                 offset_store: Optional[LogOffsetStore] = None):
+        self.directory = directory
+        self.pattern = pattern
+        self.read_lines = read_lines
+        self.offset_store = offset_store
+        self.files: Dict[str, BinaryIO] = {}
+        self.file_keys: Dict[str, FileKey] = {}
+        self.file_positions: Dict[str, int] = {}
+        self.partial_lines: Dict[str, bytes] = {}
+        self.inotify_fd: Optional[int] = None
+        self.started = False
+
+    @staticmethod
+    def _open_inotify(directory: str) -> Optional[int]:
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c') or None, use_errno=True)
+            fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if fd < 0:
+                raise OSError(ctypes.get_errno(), 'inotify_init1')
+            mask = IN_MODIFY | IN_CREATE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE
+            if libc.inotify_add_watch(fd, os.fsencode(directory), mask) < 0:
+                errno = ctypes.get_errno()
+                os.close(fd)
+                raise OSError(errno, 'inotify_add_watch')
+            return fd
+        except (OSError, AttributeError) as e:
+            UtilsLog.warning(f'LogTailer: inotify no disponible en {directory}, se usará sondeo ({e})')
+            return None
+
+    def start(self):
+        """
+        Abre los ficheros existentes en la posición guardada o, si no se conocen,
+        al final (solo interesan las líneas nuevas)
+        """
+        self.inotify_fd = self._open_inotify(self.directory)
+        for path in glob.glob(os.path.join(self.directory, self.pattern)):
+            self._open(path, from_end=True)
+        self.started = True
+
+    @staticmethod
+    def _get_key(stat: os.stat_result) -> FileKey:
+        return stat.st_dev, stat.st_ino
+
+    def _open(self, path: str, from_end: bool):
+        if path in self.files:
+            return
+        try:
+            f = open(path, 'rb')
+            stat = os.fstat(f.fileno())
+            key = self._get_key(stat)
+
+            position = self.offset_store.get(key) if self.offset_store is not None else None
+            if position is None:
+                position = stat.st_size if from_end else 0
+            elif position > stat.st_size:
+                UtilsLog.info(f'LogTailer: {path} truncado mientras estaba parado, se lee desde el principio')
+                position = 0
+            f.seek(position)
+
+            self.files[path] = f
+            self.file_keys[path] = key
+            self.file_positions[path] = position
+            self._save_position(path)
+        except Exception as e:
+            UtilsLog.error(f'LogTailer: error abriendo el archivo {path} ({e})')
+
+    def _close(self, path: str, forget: bool = False):
+        """Con forget se descarta también la posición guardada (el fichero ya no se seguirá)"""
+        f = self.files.pop(path, None)
+        if f is not None:
+            f.close()
+        key = self.file_keys.pop(path, None)
+        if forget and key is not None and self.offset_store is not None:
+            self.offset_store.forget(key)
+        self.file_positions.pop(path, None)
+        self.partial_lines.pop(path, None)
+
+    def _save_position(self, path: str):
+        if self.offset_store is not None:
+            self.offset_store.set(self.file_keys[path], path, self.file_positions[path])
+
+    def _read(self, path: str) -> Optional[List[str]]:
+        """Líneas nuevas del fichero, o None si no ha crecido"""
+        f = self.files.get(path)
+        if f is None:
+            return None
+        try:
+            size = os.fstat(f.fileno()).st_size
+            if size < self.file_positions[path]:
+                # copytruncate o similar: el contenido nuevo empieza en 0
+                UtilsLog.info(f'LogTailer: {path} truncado, se lee desde el principio')
+                self.file_positions[path] = 0
+                self.partial_lines.pop(path, None)
+            if size == self.file_positions[path]:
+                return None
+
+            if not self.read_lines:
+                self.file_positions[path] = size
+                self._save_position(path)
+                return []
+
+            f.seek(self.file_positions[path])
+            data = self.partial_lines.pop(path, b'') + f.read()
+            self.file_positions[path] = f.tell()
+            self._save_position(path)
+        except Exception as e:
+            UtilsLog.error(f'LogTailer: error leyendo el archivo {path} ({e})')
+            return None
+
+        if not data:
+            return None
+
+        # La última línea puede estar a medio escribir: se guarda para la siguiente lectura
+        lines = data.split(b'\n')
+        if lines[-1]:
+            self.partial_lines[path] = lines[-1]
+        return [line.decode('utf-8', errors='replace') for line in lines[:-1] if line]
+
+    def _matches(self, name: str) -> bool:
+        return fnmatch.fnmatch(name, self.pattern)
+
+    def _read_inotify_events(self) -> Optional[Dict[str, int]]:
+        """Máscara de eventos acumulada por fichero, o None si la cola de inotify se ha desbordado"""
+        changed: Dict[str, int] = {}
+        while True:
+            try:
+                buffer = os.read(self.inotify_fd, 65536)
+            except BlockingIOError:
+                return changed
+
+            offset = 0
+            while offset < len(buffer):
+                _, mask, _, length = _INOTIFY_EVENT.unpack_from(buffer, offset)
+                offset += _INOTIFY_EVENT.size
+                name = buffer[offset:offset + length].rstrip(b'\0').decode('utf-8', errors='replace')
+                offset += length
+
+                if mask & IN_Q_OVERFLOW:
+                    return None
+                if name and self._matches(name):
+                    path = os.path.join(self.directory, name)
+                    changed[path] = changed.get(path, 0) | mask
+
+    def _wait_inotify(self, timeout: float) -> Dict[str, List[str]]:
+        readable, _, _ = select.select([self.inotify_fd], [], [], timeout)
+        if not readable:
+            return {}
+
+        changed = self._read_inotify_events()
+        if changed is None:
+            # Se han perdido eventos: se revisan todos los ficheros
+            return self._scan()
+
+        new_lines = {}
+        for path, mask in changed.items():
+            if mask & (IN_MOVED_FROM | IN_DELETE):
+                # Se leen las últimas líneas antes de soltar el fichero
+                lines = self._read(path)
+                if lines is not None:
+                    new_lines[path] = lines
+                self._close(path, forget=True)
+            if mask & (IN_CREATE | IN_MOVED_TO):
+                self._open(path, from_end=False)
+            if mask & (IN_MODIFY | IN_CREATE | IN_MOVED_TO) and path in self.files:
+                lines = self._read(path)
+                if lines is not None:
+                    new_lines[path] = new_lines.get(path, []) + lines
+        return new_lines
+
+    def _scan(self) -> Dict[str, List[str]]:
+        paths = set(glob.glob(os.path.join(self.directory, self.pattern)))
+        new_lines = {}
+        for path in list(self.files):
+            if path in paths and self._is_same_file(path):
+                continue
+            # Fichero borrado o rotado (el nombre apunta a otro inodo): se acaban de leer
+            # sus últimas líneas y, si hay uno nuevo con el mismo nombre, se abre desde el principio
+            lines = self._read(path)
+            if lines is not None:
+                new_lines[path] = lines
+            self._close(path, forget=True)
+
+        for path in paths:
+            if path not in self.files:
+                self._open(path, from_end=False)
+            lines = self._read(path)
+            if lines is not None:
+                new_lines[path] = new_lines.get(path, []) + lines
+        return new_lines
+
+    def _is_same_file(self, path: str) -> bool:
+        try:
+            return self._get_key(os.stat(path)) == self.file_keys.get(path)
+        except OSError:
+            return False
+
+    def wait(self, timeout: float) -> Dict[str, List[str]]:
+        """
+        Espera hasta timeout segundos y devuelve las líneas nuevas de cada fichero que ha crecido.
+        Con inotify vuelve en cuanto hay cambios; sin él espera el intervalo completo.
+        """
+        if not self.started:
+            # Primera vuelta: lo escrito desde la posición guardada se recoge sin esperar
+            self.start()
+            new_lines = self._scan()
+        elif self.inotify_fd is not None:
+            new_lines = self._wait_inotify(timeout)
+        else:
+            time.sleep(timeout)
+            new_lines = self._scan()
+
+        if self.offset_store is not None:
+            self.offset_store.flush()
+        return new_lines
+
+    def close(self):
+        if self.offset_store is not None:
+            self.offset_store.flush(force=True)
+        for path in list(self.files):
+            self._close(path)
+        if self.inotify_fd is not None:
+            os.close(self.inotify_fd)
+            self.inotify_fd = None
+        self.started = False
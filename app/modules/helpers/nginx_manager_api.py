@@ -7,8 +7,9 @@ from typing import TypedDict, List, cast
 import requests
 from urllib3.exceptions import InsecureRequestWarning
 
-from modules.helpers.auto_login import auto_login
+from modules.helpers.auto_login import auto_login, TokenManager
 from modules.helpers.conf import Conf
+from modules.helpers.http_session import HttpSession
 from utils.utils_log import UtilsLog
 
 requests.urllib3.disable_warnings(category=InsecureRequestWarning)
@@ -58,18 +59,21 @@ class NginxProxyModel(TypedDict):
 
 
 class NginxManagerApi:
-    def __init__(self, endpoint=None, username=None, password=None):
+    def __init__(self, endpoint=None, username=None, password=None, timeout=None):
         self.conf = Conf.get_conf()
         self.endpoint = endpoint if endpoint is not None else self.conf.get('NGINXMANAGER_ENDPOINT')
         self.username = username if username is not None else self.conf.get('NGINXMANAGER_USERNAME')
         self.password = password if password is not None else self.conf.get('NGINXMANAGER_PASSWORD')
+        self.timeout = timeout if timeout is not None else self.conf.get('NGINXMANAGER_TIMEOUT', 30)
+        self.http = HttpSession.get_session('nginxmanager', timeout=self.timeout, verify=False)
         self.token = None
+        self.token_manager = TokenManager(self)
 
     def login(self) -> bool:
         try:
             url = self.endpoint + '/tokens'
             login_data = {'identity': self.username, 'secret': self.password}
-            response = requests.post(url, json=login_data, verify=False)
+            response = self.http.post(url, json=login_data)
             data = response.json()
 
             if 'token' not in data:
@@ -104,7 +108,7 @@ class NginxManagerApi:
 
         url = f'{self.endpoint}/nginx/proxy-hosts'
         try:
-            response = requests.post(url, data=json.dumps(data), headers=self._get_headers())
+            response = self.http.post(url, data=json.dumps(data), headers=self._get_headers())
             response_data = response.json()
 
             if response.status_code != 200:
@@ -120,7 +124,7 @@ class NginxManagerApi:
     def delete_proxy_by_id(self, id) -> bool:
         url = f'{self.endpoint}/nginx/proxy-hosts/{id}'
         try:
-            response = requests.delete(url, headers=self._get_headers())
+            response = self.http.delete(url, headers=self._get_headers())
 
             if response.status_code != 200:
                 UtilsLog.error(f"NginxManagerApi (delete_proxy_by_id): {response.json()['error']['message']}")
@@ -135,7 +139,7 @@ class NginxManagerApi:
     def get_certificates(self) -> List[NginxManagerCertificate]:
         url = f'{self.endpoint}/nginx/certificates'
         try:
-            response = requests.get(url, headers=self._get_headers())
+            response = self.http.get(url, headers=self._get_headers())
             return response.json()
         except Exception as e:
             UtilsLog.error(f'Nginxmanager (get_certificates): {e}')
@@ -154,7 +158,7 @@ class NginxManagerApi:
     def get_proxies(self) -> List[NginxManagerProxy]:
         url = f'{self.endpoint}/nginx/proxy-hosts?expand=owner,certificate'
         try:
-            response = requests.get(url, headers=self._get_headers())
+            response = self.http.get(url, headers=self._get_headers())
             return cast(
                 list[NginxManagerProxy],
                 cast(object, [
@@ -1,4 +1,5 @@
 import json
+import re
 import sys
 from enum import Enum
 from typing import TypedDict, List, Optional
@@ -7,7 +8,9 @@ import requests
 from urllib3.exceptions import InsecureRequestWarning
 
 from modules.helpers.conf import Conf
-from modules.helpers.auto_login import auto_login
+from modules.helpers.auto_login import auto_login, TokenManager
+from modules.helpers.http_session import HttpSession
+from modules.helpers.portainer_inventory import PortainerInventory, invalidate_inventory
 from utils.utils_log import UtilsLog
 
 requests.urllib3.disable_warnings(category=InsecureRequestWarning)
@@ -46,15 +49,24 @@ class PortainerContainer(TypedDict):
     Names: List[str]
     Ports: List[PortainerContainerPort]
     ResourceControlId: int
+    State: str
+    Health: Optional[str]
+    ExitCode: Optional[int]
     Mounts: List[PortainerContainerMount]
 
 
+class PortainerStackEnv(TypedDict):
+    name: str
+    value: str
+
+
 class PortainerStack(TypedDict):
     Id: int
     Name: str
     EndpointId: int
     Status: int
     ResourceControlId: int
+    Env: List[PortainerStackEnv]
     Containers: List[PortainerContainer]
 
 
@@ -74,6 +86,27 @@ class PortainerVolume(TypedDict):
     Scope: str
 
 
+class PortainerSystemDfImage(TypedDict):
+    Id: str
+    RepoTags: List[str]
+    RepoDigests: List[str]
+    Created: int
+    Size: int
+    SharedSize: int
+    Containers: int
+
+
+class PortainerSystemDf(TypedDict):
+    LayersSize: int
+    Images: List[PortainerSystemDfImage]
+    Containers: List[dict]
+
+
+class PortainerPruneResult(TypedDict):
+    Deleted: int
+    SpaceReclaimed: int
+
+
 class PortainerApi:
     def __init__(self, endpoint=None, username=None, password=None, endpoint_id=None, timeout=None):
         self.conf = Conf.get_conf()
@@ -81,14 +114,17 @@ class PortainerApi:
         self.username = username if username is not None else self.conf.get('PORTAINER_USERNAME')
         self.password = password if password is not None else self.conf.get('PORTAINER_PASSWORD')
         self.endpoint_id = endpoint_id if endpoint_id is not None else self.conf.get('PORTAINER_ENDPOINT_ID')
-        self.timeout = timeout if timeout is not None else self.conf.get('PORTAINER_TIMEOUT')
+        self.timeout = timeout if timeout is not None else self.conf.get('PORTAINER_TIMEOUT', 30)
+        self.http = HttpSession.get_session('portainer', timeout=self.timeout, verify=False)
+        self.inventory = PortainerInventory(self)
         self.token = None
+        self.token_manager = TokenManager(self)
 
     def login(self) -> bool:
         url = self.endpoint + '/auth'
         login_data = {'Username': self.username, 'Password': self.password }
         try:
-            response = requests.post(url, json=login_data, verify=False)
+            response = self.http.post(url, json=login_data)
             data = response.json()
             if 'jwt' not in data:
                 UtilsLog.error(f'Portainer - login: Autenticación incorrecta')
@@ -103,10 +139,12 @@ class PortainerApi:
         return {'Authorization': 'Bearer ' + self.token}
 
     @auto_login
-    def delete_image_by_id(self, image_id: str) -> bool:
+    @invalidate_inventory
+    def delete_image_by_id(self, image_id: str, force: bool = False) -> bool:
         try:
             url = self.endpoint + f"/endpoints/{self.endpoint_id}/docker/images/{image_id}"
-            response = requests.delete(url, headers=self._get_headers(), verify=False)
+            params = {'force': 'true'} if force else None
+            response = self.http.delete(url, headers=self._get_headers(), params=params)
 
             if response.status_code not in [200, 204]:
                 UtilsLog.debug(f"Portainer (delete_image_by_id): {response.json()['message']}")
@@ -119,10 +157,11 @@ class PortainerApi:
             return False
 
     @auto_login
+    @invalidate_inventory
     def delete_container_by_id(self, container_id: str) -> bool:
         try:
             url = self.endpoint + f"/endpoints/{self.endpoint_id}/docker/containers/{container_id}"
-            response = requests.delete(url, headers=self._get_headers(), verify=False)
+            response = self.http.delete(url, headers=self._get_headers())
 
             if response.status_code not in [200, 204]:
                 UtilsLog.error(f"Portainer (delete_container_by_id): {response.json()['message']}")
@@ -135,6 +174,7 @@ class PortainerApi:
             return False
 
     @auto_login
+    @invalidate_inventory
     def download_latest_image_by_image_name(self, image_reference, with_dockerhub_auth=False):
         try:
             # Si es un SHA256, necesitamos obtener el nombre real de la imagen
@@ -164,12 +204,12 @@ class PortainerApi:
                 #     else:
                 #         UtilsLog.warning(f"Portainer (download_latest_image): No se pudo obtener autenticación para registry {registry_id}")
 
-            response = requests.post(
+            response = self.http.post(
                 url,
                 headers=headers,
                 params=params,
                 stream=True,
-                verify=False
+                timeout=None
             )
 
             if response.status_code != 200:
@@ -178,7 +218,7 @@ class PortainerApi:
                 return None
 
             last_line = None
-            for line in response.iter_lines():
+            for line in response.iter_lines(chunk_size=8192):
                 if line:
                     last_line = line
 
@@ -217,7 +257,7 @@ class PortainerApi:
         try:
             url = f"{self.endpoint}/endpoints/{self.endpoint_id}/docker/images/{image_sha}/json"
 
-            response = requests.get(url, headers=self._get_headers(), verify=False)
+            response = self.http.get(url, headers=self._get_headers())
 
             if response.status_code != 200:
                 UtilsLog.error(f"Portainer (_get_image_name_from_sha): Error obteniendo info de {image_sha}")
@@ -249,7 +289,7 @@ class PortainerApi:
         try:
             url = f"{self.endpoint}/registries/{registry_id}"
 
-            response = requests.get(url, headers=self._get_headers(), verify=False)
+            response = self.http.get(url, headers=self._get_headers())
 
             if response.status_code != 200:
                 UtilsLog.error(f"Portainer (_get_registry_auth): Error obteniendo registro {registry_id}")
@@ -280,7 +320,7 @@ class PortainerApi:
         try:
             url = f"{self.endpoint}/registries"
 
-            response = requests.get(url, headers=self._get_headers(), verify=False)
+            response = self.http.get(url, headers=self._get_headers())
 
             if response.status_code != 200:
                 UtilsLog.error("Portainer (get_dockerhub_registry_id): Error obteniendo registros")
@@ -301,18 +341,18 @@ class PortainerApi:
             return None
 
     @auto_login
-    def get_containers(self) -> List[PortainerContainer]:
+    def _fetch_containers(self, filters: dict = None) -> Optional[List[PortainerContainer]]:
 
-        containers = []
         url = self.endpoint + f"/endpoints/{self.endpoint_id}/docker/containers/json?all=true"
+        params = {'filters': json.dumps(filters)} if filters else None
         try:
-            response = requests.get(url, headers=self._get_headers(), verify=False)
+            response = self.http.get(url, headers=self._get_headers(), params=params)
 
             if response.status_code != 200:
                 UtilsLog.error(f"Portainer (get_containers): {response.json()['message']}")
-                return []
+                return None
 
-            containers += [
+            return [
                 PortainerContainer(
                     Id=container['Id'],
                     Image=container['Image'],
@@ -320,7 +360,10 @@ class PortainerApi:
                     Names=container['Names'],
                     Ports=container['Ports'],
                     ResourceControlId=container['Portainer']['ResourceControl']['Id'],
-                    Mounts=container['Mounts']
+                    Mounts=container['Mounts'],
+                    State=container['State'],
+                    Health=self._parse_health(container.get('Status', '')),
+                    ExitCode=self._parse_exit_code(container.get('Status', ''))
                 )
                 for container in response.json()
                 if 'Portainer' in container
@@ -328,15 +371,48 @@ class PortainerApi:
 
         except Exception as e:
             UtilsLog.error(f'Portainer (get_containers): {e}')
-            return containers
+            return None
+
+    @staticmethod
+    def _parse_health(status: str) -> Optional[str]:
+        """Estado del healthcheck a partir del Status de Docker, p.ej. 'Up 5 minutes (health: starting)'"""
+        match = re.search(r'\((?:health: )?(healthy|unhealthy|starting)\)', status)
+        return match.group(1) if match else None
 
-        return containers
+    @staticmethod
+    def _parse_exit_code(status: str) -> Optional[int]:
+        """Código de salida a partir del Status de Docker, p.ej. 'Exited (0) 5 minutes ago'"""
+        match = re.match(r'Exited \((-?\d+)\)', status)
+        return int(match.group(1)) if match else None
+
+    def get_containers(self, use_cache: bool = True) -> List[PortainerContainer]:
+        return self.inventory.get_containers(use_cache=use_cache)
+
+    def get_container_by_id(self, container_id: str) -> Optional[PortainerContainer]:
+        containers = self._fetch_containers(filters={'id': [container_id]})
+        return containers[0] if containers else None
+
+    @auto_login
+    def open_events_stream(self, since: Optional[int] = None, read_timeout: float = None):
+        url = self.endpoint + f"/endpoints/{self.endpoint_id}/docker/events"
+        params = {'filters': json.dumps({'type': ['container']})}
+        if since is not None:
+            params['since'] = since
+
+        response = self.http.get(url, headers=self._get_headers(), params=params, stream=True,
+                                 timeout=(self.timeout, read_timeout))
+        if response.status_code != 200:
+            message = response.json().get('message', response.status_code)
+            response.close()
+            raise Exception(f'Portainer (open_events_stream): {message}')
+
+        return response
 
     @auto_login
     def get_endpoints(self) -> List[PortainerEndpoint]:
         url = self.endpoint + '/endpoints'
         try:
-            response = requests.get(url, headers=self._get_headers(), verify=False)
+            response = self.http.get(url, headers=self._get_headers())
 
             if response.status_code != 200:
                 UtilsLog.error(f"Portainer (get_endpoints): {response.json()['message']}")
@@ -357,13 +433,44 @@ class PortainerApi:
             UtilsLog.error(f'Portainer (get_endpoints): {e}')
             return []
 
+    @auto_login
+    def get_system_df(self) -> Optional[PortainerSystemDf]:
+        try:
+            url = self.endpoint + f"/endpoints/{self.endpoint_id}/docker/system/df"
+            response = self.http.get(url, headers=self._get_headers(), params={'type': ['image', 'container']})
+
+            if response.status_code != 200:
+                UtilsLog.error(f"Portainer (get_system_df): {response.json()['message']}")
+                return None
+
+            data = response.json()
+            return PortainerSystemDf(
+                LayersSize=data.get('LayersSize') or 0,
+                Images=[
+                    PortainerSystemDfImage(
+                        Id=image['Id'],
+                        RepoTags=image.get('RepoTags') or [],
+                        RepoDigests=image.get('RepoDigests') or [],
+                        Created=image['Created'],
+                        Size=image['Size'],
+                        SharedSize=image['SharedSize'],
+                        Containers=image['Containers']
+                    )
+                    for image in data.get('Images') or []
+                ],
+                Containers=data.get('Containers') or []
+            )
+        except Exception as e:
+            UtilsLog.error(f'Portainer (get_system_df): {e}')
+            return None
+
     @auto_login
     def get_images(self) -> List[PortainerImage]:
 
         images = []
         url = self.endpoint + f"/endpoints/{self.endpoint_id}/docker/images/json?all=true"
         try:
-            response = requests.get(url, headers=self._get_headers(), verify=False)
+            response = self.http.get(url, headers=self._get_headers())
 
             if response.status_code != 200:
                 UtilsLog.error(f"Portainer (get_images): {response.json()['message']}")
@@ -390,7 +497,7 @@ class PortainerApi:
     def get_image_info_by_name(self, image_name) -> Optional[PortainerImage]:
         try:
             url = self.endpoint + f"/endpoints/{self.endpoint_id}/docker/images/{image_name}/json"
-            response = requests.get(url, headers=self._get_headers(), verify=False)
+            response = self.http.get(url, headers=self._get_headers())
 
             if response.status_code != 200:
                 UtilsLog.error(f"Portainer (get_image_info_by_name): {response.json()['message']}")
@@ -407,7 +514,7 @@ class PortainerApi:
         try:
             clean_id = image_id.replace('sha256:', '')
             url = self.endpoint + f'/endpoints/{self.endpoint_id}/docker/images/{clean_id}/json'
-            response = requests.get(url, headers=self._get_headers(), verify=False)
+            response = self.http.get(url, headers=self._get_headers())
 
             if response.status_code != 200:
                 UtilsLog.error(f"Portainer (get_image_info_by_id): {response.json()['message']}")
@@ -419,26 +526,71 @@ class PortainerApi:
             return None
 
     @auto_login
-    def get_stacks(self) -> List[PortainerStack]:
+    def get_registry_digest(self, image_name: str) -> Optional[str]:
+        """
+        Digest de la imagen en el registro (endpoint /distribution de Docker).
+        Solo consulta el manifiesto, no descarga capas ni consume cuota de pulls.
+        """
+        try:
+            url = self.endpoint + f'/endpoints/{self.endpoint_id}/docker/distribution/{image_name}/json'
+            response = self.http.get(url, headers=self._get_headers())
 
-        stacks = []
+            if response.status_code != 200:
+                UtilsLog.debug(f"Portainer (get_registry_digest): {image_name} -> {response.json().get('message')}")
+                return None
+
+            return response.json()['Descriptor']['digest']
+        except Exception as e:
+            UtilsLog.error(f'Portainer (get_registry_digest): {image_name} -> {e}')
+            return None
+
+    def image_has_update(self, image_name: str) -> Optional[bool]:
+        """
+        Compara los RepoDigests de la imagen local con el digest del registro.
+        Devuelve None si no se puede determinar (imagen local sin digest, registro
+        privado sin acceso, referencia por SHA...).
+        """
+        if image_name.startswith('sha256:'):
+            return None
+
+        registry_digest = self.get_registry_digest(image_name)
+        if registry_digest is None:
+            return None
+
+        image = self.get_image_info_by_name(image_name)
+        if image is None:
+            return None
+
+        local_digests = [digest.split('@')[-1] for digest in image.get('RepoDigests') or []]
+        if len(local_digests) == 0:
+            return None
+
+        return registry_digest not in local_digests
+
+    @staticmethod
+    def _to_stack(stack: dict) -> PortainerStack:
+        return PortainerStack(
+            Id=stack['Id'],
+            Name=stack['Name'],
+            EndpointId=stack['EndpointId'],
+            Status=stack['Status'],
+            ResourceControlId=stack['ResourceControl']['Id'],
+            Env=stack.get('Env') or [],
+            Containers=[]
+        )
+
+    @auto_login
+    def _fetch_stacks(self) -> Optional[List[PortainerStack]]:
 
         url = self.endpoint + '/stacks'
         try:
-            response = requests.get(url, headers=self._get_headers(),verify=False)
+            response = self.http.get(url, headers=self._get_headers())
             if response.status_code != 200:
                 UtilsLog.error(f"Portainer (get_stacks): {response.json()['message']}")
-                return []
+                return None
 
-            stacks += [
-                PortainerStack(
-                    Id=stack['Id'],
-                    Name=stack['Name'],
-                    EndpointId=stack['EndpointId'],
-                    Status=stack['Status'],
-                    ResourceControlId=stack['ResourceControl']['Id'],
-                    Containers=[]
-                )
+            return [
+                self._to_stack(stack)
                 for stack in response.json() if stack['EndpointId'] == self.endpoint_id
             ]
 
@@ -447,32 +599,109 @@ class PortainerApi:
         except Exception as e:
             UtilsLog.error(f'Portainer (get_stacks): {e}')
 
-        return stacks
+        return None
 
     @auto_login
-    def get_stack_with_containers(self, stack_name: str) -> Optional[PortainerStack]:
+    def _fetch_stack_by_id(self, stack_id: int) -> Optional[PortainerStack]:
+
+        url = self.endpoint + f'/stacks/{stack_id}'
         try:
-            stacks_with_containers = self.get_stacks_with_containers()
-            for stack in stacks_with_containers:
-                if stack['Name'] == stack_name:
-                    return stack
+            response = self.http.get(url, headers=self._get_headers())
+            if response.status_code != 200:
+                UtilsLog.error(f"Portainer (get_stack_by_id): {response.json()['message']}")
+                return None
+
+            return self._to_stack(response.json())
+
+        except Exception as e:
+            UtilsLog.error(f'Portainer (get_stack_by_id): {e}')
             return None
+
+    @auto_login
+    def get_stack_file(self, stack_id: int) -> Optional[str]:
+        """Contenido del docker-compose del stack"""
+        url = self.endpoint + f'/stacks/{stack_id}/file'
+        try:
+            response = self.http.get(url, headers=self._get_headers())
+            if response.status_code != 200:
+                UtilsLog.error(f"Portainer (get_stack_file): {response.json()['message']}")
+                return None
+
+            return response.json()['StackFileContent']
+
+        except Exception as e:
+            UtilsLog.error(f'Portainer (get_stack_file): {e}')
+            return None
+
+    def get_stacks(self, use_cache: bool = True) -> List[PortainerStack]:
+        return self.inventory.get_stacks(use_cache=use_cache)
+
+    def get_stack_by_id(self, stack_id: int) -> Optional[PortainerStack]:
+        return self.inventory.get_stack_by_id(stack_id)
+
+    def get_stack_by_name(self, stack_name: str) -> Optional[PortainerStack]:
+        return self.inventory.get_stack_by_name(stack_name)
+
+    def get_container_by_name(self, container_name: str) -> Optional[PortainerContainer]:
+        return self.inventory.get_container_by_name(container_name)
+
+    def get_stack_with_containers(self, stack_name: str, use_cache: bool = True) -> Optional[PortainerStack]:
+        try:
+            return self.inventory.get_stack_with_containers(stack_name, use_cache=use_cache)
         except Exception as e:
             UtilsLog.error(f'Portainer (get_stack_with_containers): {e}')
             return None
 
+    def get_stacks_with_containers(self, use_cache: bool = True) -> List[PortainerStack]:
+        return self.inventory.get_stacks_with_containers(use_cache=use_cache)
+
+    def wait_stack_ready(self, stack: PortainerStack, timeout: float) -> bool:
+        return self.inventory.wait_stack_ready(stack, timeout)
+
     @auto_login
-    def get_stacks_with_containers(self) -> List[PortainerStack]:
-        stacks = self.get_stacks()
-        containers = self.get_containers()
+    @invalidate_inventory
+    def _prune(self, resource: str, filters: dict) -> Optional[PortainerPruneResult]:
+        try:
+            url = self.endpoint + f'/endpoints/{self.endpoint_id}/docker/{resource}/prune'
+            params = {'filters': json.dumps(filters)} if filters else None
+            response = self.http.post(url, headers=self._get_headers(), params=params, timeout=None)
+
+            if response.status_code != 200:
+                UtilsLog.error(f"Portainer (prune {resource}): {response.json()['message']}")
+                return None
+
+            data = response.json()
+            deleted_key = {'images': 'ImagesDeleted', 'containers': 'ContainersDeleted',
+                           'volumes': 'VolumesDeleted', 'build': 'CachesDeleted'}[resource]
+            return PortainerPruneResult(
+                Deleted=len(data.get(deleted_key) or []),
+                SpaceReclaimed=data.get('SpaceReclaimed') or 0
+            )
+        except Exception as e:
+            UtilsLog.error(f'Portainer (prune {resource}): {e}')
+            return None
 
-        for stack in stacks:
-            stack['Containers'] = []
-            for container in containers:
-                if stack['ResourceControlId'] == container['ResourceControlId']:
-                    stack['Containers'].append(container)
+    @staticmethod
+    def _prune_filters(until: str = None, labels: List[str] = None, **extra) -> dict:
+        filters = {key: [value] for key, value in extra.items() if value is not None}
+        if until:
+            filters['until'] = [until]
+        if labels:
+            filters['label'] = labels
+        return filters
 
-        return stacks
+    def prune_images(self, dangling: bool = True, until: str = None, labels: List[str] = None) -> Optional[PortainerPruneResult]:
+        return self._prune('images', self._prune_filters(until, labels, dangling=str(dangling).lower()))
+
+    def prune_containers(self, until: str = None, labels: List[str] = None) -> Optional[PortainerPruneResult]:
+        return self._prune('containers', self._prune_filters(until, labels))
+
+    def prune_volumes(self, labels: List[str] = None) -> Optional[PortainerPruneResult]:
+        return self._prune('volumes', self._prune_filters(labels=labels))
+
+    def prune_build_cache(self, until: str = None) -> Optional[PortainerPruneResult]:
+        # /build/prune no admite el filtro label (solo until, id, parent, type, description, inuse y shared)
+        return self._prune('build', self._prune_filters(until))
 
     @auto_login
     def get_volumes(self) -> List[PortainerVolume]:
@@ -480,7 +709,7 @@ class PortainerApi:
         volumes = []
         url = self.endpoint + f"/endpoints/{self.endpoint_id}/docker/volumes"
         try:
-            response = requests.get(url, headers=self._get_headers(), verify=False)
+            response = self.http.get(url, headers=self._get_headers())
 
             if response.status_code != 200:
                 UtilsLog.error(f"Portainer (get_volumes): {response.json()['message']}")
@@ -504,10 +733,11 @@ class PortainerApi:
         return volumes
 
     @auto_login
+    @invalidate_inventory
     def start_stack_by_stack_id(self, stack_id) -> bool:
         try:
             url = self.endpoint + f'/stacks/{stack_id}/start?endpointId={self.endpoint_id}'
-            response = requests.post(url, headers=self._get_headers(), verify=False)
+            response = self.http.post(url, headers=self._get_headers())
             data = response.json()
 
             if 'message' in data and 'is already running' in data['message']:
@@ -524,17 +754,18 @@ class PortainerApi:
             return False
 
     @auto_login
+    @invalidate_inventory
     def stop_stack_by_stack_id(self, stack_id) -> bool:
         try:
             url = self.endpoint + f'/stacks/{stack_id}/stop?endpointId={self.endpoint_id}'
-            response = requests.post(url, headers=self._get_headers(), verify=False)
+            response = self.http.post(url, headers=self._get_headers())
 
             if response.status_code != 200:
                 UtilsLog.info(response.json())
                 UtilsLog.error(f"Portainer (stop_stack): {response.json()['message']}")
                 return False
 
-            return False
+            return True
         except Exception as e:
             UtilsLog.error(f'Portainer (stop_stack): {e}')
             return False
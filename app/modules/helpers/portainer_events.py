@@ -0,0 +1,148 @@
+import json
+import time
+from typing import TYPE_CHECKING, Callable, List, Optional, TypedDict
+
+from modules.helpers.conf import Conf
+from utils.utils_log import UtilsLog
+
+if TYPE_CHECKING:
+    from modules.helpers.portainer_api import PortainerApi
+
+# Acciones de contenedor que solo cambian su estado y se aplican sin pedir nada a Portainer
+CONTAINER_STATES_BY_ACTION = {
+    'start': 'running',
+    'unpause': 'running',
+    'restart': 'running',
+    'pause': 'paused',
+    'die': 'exited',
+    'stop': 'exited',
+    'kill': 'exited',
+}
+
+# Acciones que cambian la definición del contenedor: se vuelve a pedir solo ese contenedor
+CONTAINER_FETCH_ACTIONS = {'create', 'rename', 'update'}
+
+
+class DockerEventActor(TypedDict):
+    ID: str
+    Attributes: dict
+
+
+class DockerEvent(TypedDict):
+    Type: str
+    Action: str
+    Actor: DockerEventActor
+    time: int
+    timeNano: int
+
+
+class PortainerEvents:
+    """
+    Suscriptor del stream /docker/events de Docker a través de Portainer. Aplica
+    los eventos de contenedores al inventario de forma incremental, reconecta
+    con backoff exponencial y solo resincroniza todo el inventario cuando el
+    hueco sin eventos supera PORTAINER_EVENTS_MAX_GAP_IN_SECONDS.
+    """
+
+    def __init__(self, portainer_api: "PortainerApi"):
+        self.portainer_api = portainer_api
+        self.inventory = portainer_api.inventory
+        self.conf = Conf.get_conf()
+        self.listeners: List[Callable[[DockerEvent], None]] = []
+        self.last_event_time: Optional[int] = None
+        self.disconnected_at: Optional[float] = None
+
+    def add_listener(self, listener: Callable[[DockerEvent], None]):
+        self.listeners.append(listener)
+
+    def init(self):
+        backoff = 1
+        backoff_max = self.conf.get('PORTAINER_EVENTS_BACKOFF_MAX_IN_SECONDS', 60)
+
+        while True:
+            if not self.conf.get('PORTAINER_EVENTS_ENABLED', True):
+                self.inventory.set_live(False)
+                time.sleep(5)
+                continue
+
+            try:
+                since = self._prepare_since()
+                response = self.portainer_api.open_events_stream(
+                    since=since,
+                    read_timeout=self.conf.get('PORTAINER_EVENTS_READ_TIMEOUT_IN_SECONDS', 300)
+                )
+                UtilsLog.info('PortainerEvents: conectado al stream de eventos de Docker')
+                self.inventory.set_live(True)
+                self.disconnected_at = None
+                backoff = 1
+
+                with response:
+                    for line in response.iter_lines():
+                        if line:
+                            self.process_event(json.loads(line))
+
+            except Exception as e:
+                UtilsLog.error(f'PortainerEvents (init): {e}')
+
+            # Sin stream el inventario vuelve a caducar por TTL normal
+            self.inventory.set_live(False)
+            if self.disconnected_at is None:
+                self.disconnected_at = time.monotonic()
+
+            time.sleep(backoff)
+            backoff = min(backoff * 2, backoff_max)
+
+    def _prepare_since(self) -> Optional[int]:
+        """
+        Docker reenvía los eventos desde 'since' si siguen en su buffer. Si la
+        desconexión ha sido larga se asume hueco y se resincroniza completo.
+        """
+        max_gap = self.conf.get('PORTAINER_EVENTS_MAX_GAP_IN_SECONDS', 60)
+        gap = None if self.disconnected_at is None else time.monotonic() - self.disconnected_at
+
+        if self.last_event_time is None or gap is None or gap > max_gap:
+            UtilsLog.info('PortainerEvents: resincronizando inventario completo')
+            self.last_event_time = int(time.time())
+            self.inventory.refresh()
+
+        return self.last_event_time
+
+    def process_event(self, event: DockerEvent):
+        self.last_event_time = event.get('time', self.last_event_time)
+
+        try:
+            if event.get('Type') == 'container':
+                self._apply_container_event(event)
+        except Exception as e:
+            UtilsLog.error(f'PortainerEvents (process_event): {e}')
+
+        for listener in self.listeners:
+            try:
+                listener(event)
+            except Exception as e:
+                UtilsLog.error(f'PortainerEvents (listener): {e}')
+
+    def _apply_container_event(self, event: DockerEvent):
+        action = event.get('Action', '')
+        container_id = event['Actor']['ID']
+
+        if action == 'destroy':
+            self.inventory.remove_container(container_id)
+            return
+
+        # 'health_status: healthy', 'health_status: unhealthy', ...
+        if action.startswith('health_status'):
+            self.inventory.update_container_health(container_id, action.split(':', 1)[-1].strip())
+            return
+
+        if action in CONTAINER_STATES_BY_ACTION:
+            exit_code = (event['Actor'].get('Attributes') or {}).get('exitCode')
+            exit_code = int(exit_code) if exit_code is not None and action == 'die' else None
+            if self.inventory.update_container_state(container_id, CONTAINER_STATES_BY_ACTION[action], exit_code):
+                return
+        elif action not in CONTAINER_FETCH_ACTIONS:
+            return
+
+        container = self.portainer_api.get_container_by_id(container_id)
+        if container is not None:
+            self.inventory.upsert_container(container)
@@ -0,0 +1,417 @@
+import copy
+import functools
+import threading
+import time
+from typing import TYPE_CHECKING, Callable, Any, Dict, List, Optional, Set, TypedDict
+
+from modules.helpers.conf import Conf
+from utils.utils_log import UtilsLog
+
+if TYPE_CHECKING:
+    from modules.helpers.portainer_api import PortainerApi, PortainerStack, PortainerContainer
+
+
+def invalidate_inventory(func: Callable) -> Callable:
+    """
+    Decorador para las operaciones de PortainerApi que modifican stacks,
+    contenedores o imágenes: al terminar invalida el inventario compartido
+    (salvo que se mantenga al día con el stream de eventos).
+    """
+
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs) -> Any:
+        try:
+            return func(self, *args, **kwargs)
+        finally:
+            self.inventory.invalidate()
+
+    return wrapper
+
+
+class PortainerInventoryIndex:
+    """
+    Stacks y contenedores indexados por identificador de stack, nombre de stack,
+    identificador y nombre de contenedor y ResourceControlId. El cruce de stacks
+    con sus contenedores es O(stacks + contenedores).
+    """
+
+    def __init__(self, stacks: List["PortainerStack"], containers: List["PortainerContainer"]):
+        self.stacks_by_id: Dict[int, "PortainerStack"] = {}
+        self.stacks_by_name: Dict[str, "PortainerStack"] = {}
+        self.stacks_by_resource_control_id: Dict[int, "PortainerStack"] = {}
+        self.containers_by_id: Dict[str, "PortainerContainer"] = {}
+        self.containers_by_name: Dict[str, "PortainerContainer"] = {}
+        self.containers_by_resource_control_id: Dict[int, Dict[str, "PortainerContainer"]] = {}
+
+        for stack in stacks:
+            self.stacks_by_id[stack['Id']] = stack
+            self.stacks_by_name[stack['Name']] = stack
+            self.stacks_by_resource_control_id[stack['ResourceControlId']] = stack
+
+        for container in containers:
+            self.add_container(container)
+
+    @property
+    def stacks(self) -> List["PortainerStack"]:
+        return list(self.stacks_by_id.values())
+
+    @property
+    def containers(self) -> List["PortainerContainer"]:
+        return list(self.containers_by_id.values())
+
+    @staticmethod
+    def container_names(container: "PortainerContainer") -> List[str]:
+        return [name.lstrip('/') for name in container['Names']]
+
+    def add_container(self, container: "PortainerContainer"):
+        self.remove_container(container['Id'])
+        self.containers_by_id[container['Id']] = container
+        for name in self.container_names(container):
+            self.containers_by_name[name] = container
+        self.containers_by_resource_control_id.setdefault(container['ResourceControlId'], {})[container['Id']] = container
+
+    def remove_container(self, container_id: str):
+        container = self.containers_by_id.pop(container_id, None)
+        if container is None:
+            return
+        for name in self.container_names(container):
+            if self.containers_by_name.get(name) is container:
+                del self.containers_by_name[name]
+        by_resource_control_id = self.containers_by_resource_control_id.get(container['ResourceControlId'], {})
+        by_resource_control_id.pop(container_id, None)
+        if not by_resource_control_id:
+            self.containers_by_resource_control_id.pop(container['ResourceControlId'], None)
+
+    def update_stack_status(self, resource_control_id: int):
+        """
+        Deduce el Status del stack a partir de sus contenedores tras aplicar un evento:
+        con algún contenedor en marcha está arrancado (1) y sin contenedores está
+        parado (2, Portainer para los stacks con compose down). Si solo quedan
+        contenedores parados se mantiene el que tenía.
+        """
+        stack = self.stacks_by_resource_control_id.get(resource_control_id)
+        if stack is None:
+            return
+        containers = self.containers_by_resource_control_id.get(resource_control_id, {}).values()
+        if any(container['State'] == 'running' for container in containers):
+            stack['Status'] = 1
+        elif not containers:
+            stack['Status'] = 2
+
+    def get_containers_of_stack(self, stack: "PortainerStack") -> List["PortainerContainer"]:
+        return list(self.containers_by_resource_control_id.get(stack['ResourceControlId'], {}).values())
+
+    def get_stack_with_containers(self, stack: "PortainerStack") -> "PortainerStack":
+        stack = copy.deepcopy(stack)
+        stack['Containers'] = copy.deepcopy(self.get_containers_of_stack(stack))
+        return stack
+
+
+class PortainerInventorySnapshot(TypedDict):
+    index: PortainerInventoryIndex
+    fetched_at: float
+    version: int
+
+
+class PortainerInventory:
+    """
+    Caché en memoria de stacks y contenedores de Portainer compartida por todos
+    los monitores. Stacks y contenedores se obtienen juntos, de modo que todos
+    los hilos leen la misma foto del estado.
+
+    Mientras PortainerEvents está conectado al stream de eventos de Docker el
+    inventario se mantiene al día de forma incremental y solo se vuelve a
+    pedir completo cada PORTAINER_EVENTS_RESYNC_IN_SECONDS.
+    """
+
+    def __init__(self, portainer_api: "PortainerApi", ttl: float = None):
+        conf = Conf.get_conf()
+        self.portainer_api = portainer_api
+        self.ttl = ttl if ttl is not None else conf.get('PORTAINER_INVENTORY_TTL_IN_SECONDS', 15)
+        self.ttl_live = conf.get('PORTAINER_EVENTS_RESYNC_IN_SECONDS', 600)
+        self.live = False
+        self._snapshot: Optional[PortainerInventorySnapshot] = None
+        self._version = 0
+        self._changes = 0
+        self._lock = threading.RLock()
+        # Se notifica cada vez que cambia el inventario (foto nueva o evento aplicado)
+        self._changed = threading.Condition(self._lock)
+        self._refresh_lock = threading.Lock()
+        self.stacks_listeners: List[Callable[[Set[str]], None]] = []
+
+    def add_stacks_listener(self, listener: Callable[[Set[str]], None]):
+        """Se llama con los nombres de los stacks que aparecen o desaparecen entre dos fotos completas"""
+        self.stacks_listeners.append(listener)
+
+    def invalidate(self):
+        """
+        Fuerza una foto completa en la siguiente lectura. Con el stream de eventos conectado no
+        hace falta: los cambios de los contenedores llegan como eventos y se aplican sobre la
+        foto, y solo los contenedores de stacks desconocidos o las reconexiones la piden entera.
+        """
+        with self._lock:
+            if self.live:
+                return
+            self._version += 1
+
+    def set_live(self, live: bool):
+        self.live = live
+
+    def is_loaded(self) -> bool:
+        """Si se ha llegado a obtener alguna foto completa del inventario"""
+        return self._snapshot is not None
+
+    def _is_fresh(self, snapshot: Optional[PortainerInventorySnapshot]) -> bool:
+        ttl = self.ttl_live if self.live else self.ttl
+        return snapshot is not None \
+            and snapshot['version'] == self._version \
+            and time.monotonic() - snapshot['fetched_at'] < ttl
+
+    def _get_snapshot(self, force: bool = False) -> Optional[PortainerInventorySnapshot]:
+        snapshot = self._snapshot
+        if not force and self._is_fresh(snapshot):
+            return snapshot
+
+        requested_at = time.monotonic()
+        with self._refresh_lock:
+            # Otro hilo ha refrescado mientras se esperaba el lock: se reutiliza su resultado
+            snapshot = self._snapshot
+            if self._is_fresh(snapshot) and (not force or snapshot['fetched_at'] >= requested_at):
+                return snapshot
+
+            version = self._version
+            changes = self._changes
+            fetched_at = time.monotonic()
+            stacks = self.portainer_api._fetch_stacks()
+            containers = self.portainer_api._fetch_containers()
+
+            # Si alguna petición falla no se cachea nada para no propagar un inventario vacío
+            if stacks is None or containers is None:
+                return None
+
+            index = PortainerInventoryIndex(stacks, containers)
+            with self._lock:
+                previous = self._snapshot
+                # Si se han aplicado eventos durante la descarga, la foto puede no incluirlos:
+                # se guarda como caducada para que la siguiente lectura la vuelva a pedir
+                snapshot = PortainerInventorySnapshot(
+                    index=index,
+                    fetched_at=fetched_at,
+                    version=version if changes == self._changes else -1
+                )
+                self._snapshot = snapshot
+                self._changed.notify_all()
+
+            if previous is not None:
+                stack_names = previous['index'].stacks_by_name.keys() ^ index.stacks_by_name.keys()
+                if stack_names:
+                    for listener in self.stacks_listeners:
+                        try:
+                            listener(stack_names)
+                        except Exception as e:
+                            UtilsLog.error(f'PortainerInventory (stacks listener): {e}')
+            return snapshot
+
+    def refresh(self):
+        self._get_snapshot(force=True)
+
+    def get_stacks(self, use_cache: bool = True) -> List["PortainerStack"]:
+        snapshot = self._get_snapshot(force=not use_cache)
+        if snapshot is None:
+            return []
+        with self._lock:
+            return copy.deepcopy(snapshot['index'].stacks)
+
+    def get_containers(self, use_cache: bool = True) -> List["PortainerContainer"]:
+        snapshot = self._get_snapshot(force=not use_cache)
+        if snapshot is None:
+            return []
+        with self._lock:
+            return copy.deepcopy(snapshot['index'].containers)
+
+    def get_stacks_with_containers(self, use_cache: bool = True) -> List["PortainerStack"]:
+        snapshot = self._get_snapshot(force=not use_cache)
+        if snapshot is None:
+            return []
+        with self._lock:
+            index = snapshot['index']
+            return [index.get_stack_with_containers(stack) for stack in index.stacks]
+
+    def get_stack_by_id(self, stack_id: int) -> Optional["PortainerStack"]:
+        snapshot = self._get_snapshot()
+        if snapshot is None:
+            return None
+        with self._lock:
+            return copy.deepcopy(snapshot['index'].stacks_by_id.get(stack_id))
+
+    def get_stack_by_name(self, stack_name: str) -> Optional["PortainerStack"]:
+        snapshot = self._get_snapshot()
+        if snapshot is None:
+            return None
+        with self._lock:
+            return copy.deepcopy(snapshot['index'].stacks_by_name.get(stack_name))
+
+    def find_stack_by_name(self, stack_name: str) -> Optional["PortainerStack"]:
+        """Busca un stack en el inventario actual (aunque esté caducado) sin pedir nada a Portainer"""
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is None:
+                return None
+            return copy.deepcopy(snapshot['index'].stacks_by_name.get(stack_name))
+
+    def get_stack_by_resource_control_id(self, resource_control_id: int) -> Optional["PortainerStack"]:
+        snapshot = self._get_snapshot()
+        if snapshot is None:
+            return None
+        with self._lock:
+            return copy.deepcopy(snapshot['index'].stacks_by_resource_control_id.get(resource_control_id))
+
+    def get_container_by_name(self, container_name: str) -> Optional["PortainerContainer"]:
+        snapshot = self._get_snapshot()
+        if snapshot is None:
+            return None
+        with self._lock:
+            return copy.deepcopy(snapshot['index'].containers_by_name.get(container_name.lstrip('/')))
+
+    def get_stack_with_containers(self, stack_name: str, use_cache: bool = True) -> Optional["PortainerStack"]:
+        with self._lock:
+            snapshot = self._snapshot
+            if use_cache and self._is_fresh(snapshot):
+                stack = snapshot['index'].stacks_by_name.get(stack_name)
+                return snapshot['index'].get_stack_with_containers(stack) if stack is not None else None
+
+            stack_id = None
+            if snapshot is not None and stack_name in snapshot['index'].stacks_by_name:
+                stack_id = snapshot['index'].stacks_by_name[stack_name]['Id']
+
+        # Stack conocido: se piden solo el stack y sus contenedores en vez de todo el inventario
+        if stack_id is not None:
+            stack = self.portainer_api._fetch_stack_by_id(stack_id)
+            containers = self.portainer_api._fetch_containers(
+                filters={'label': [f'com.docker.compose.project={stack_name}']}
+            )
+            if stack is not None and containers is not None:
+                stack['Containers'] = [c for c in containers if c['ResourceControlId'] == stack['ResourceControlId']]
+                return stack
+
+        snapshot = self._get_snapshot(force=not use_cache)
+        if snapshot is None:
+            return None
+        with self._lock:
+            stack = snapshot['index'].stacks_by_name.get(stack_name)
+            return snapshot['index'].get_stack_with_containers(stack) if stack is not None else None
+
+    def find_container(self, container_id: str) -> Optional["PortainerContainer"]:
+        """Busca un contenedor en el inventario actual sin pedir nada a Portainer"""
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is None:
+                return None
+            return copy.deepcopy(snapshot['index'].containers_by_id.get(container_id))
+
+    def has_container(self, container_id: str) -> bool:
+        with self._lock:
+            snapshot = self._snapshot
+            return snapshot is not None and container_id in snapshot['index'].containers_by_id
+
+    def upsert_container(self, container: "PortainerContainer"):
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is None:
+                return
+            self._changes += 1
+
+            # Contenedor de un stack que no está en el inventario (stack nuevo): resincronizar
+            index = snapshot['index']
+            if container['ResourceControlId'] not in index.stacks_by_resource_control_id:
+                self._version += 1
+
+            index.add_container(container)
+            index.update_stack_status(container['ResourceControlId'])
+            self._changed.notify_all()
+
+    def update_container_state(self, container_id: str, state: str, exit_code: Optional[int] = None) -> bool:
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is None or container_id not in snapshot['index'].containers_by_id:
+                return False
+            self._changes += 1
+            container = snapshot['index'].containers_by_id[container_id]
+            container['State'] = state
+            if exit_code is not None:
+                container['ExitCode'] = exit_code
+            # Al arrancar, el healthcheck (si lo tiene) vuelve a empezar
+            if state == 'running':
+                container['ExitCode'] = None
+                if container.get('Health') is not None:
+                    container['Health'] = 'starting'
+            snapshot['index'].update_stack_status(container['ResourceControlId'])
+            self._changed.notify_all()
+            return True
+
+    def update_container_health(self, container_id: str, health: str) -> bool:
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is None or container_id not in snapshot['index'].containers_by_id:
+                return False
+            self._changes += 1
+            snapshot['index'].containers_by_id[container_id]['Health'] = health
+            self._changed.notify_all()
+            return True
+
+    def remove_container(self, container_id: str):
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is None:
+                return
+            self._changes += 1
+            container = snapshot['index'].containers_by_id.get(container_id)
+            snapshot['index'].remove_container(container_id)
+            if container is not None:
+                snapshot['index'].update_stack_status(container['ResourceControlId'])
+            self._changed.notify_all()
+
+    @staticmethod
+    def is_container_ready(container: "PortainerContainer") -> bool:
+        # Un contenedor de un solo uso (init, migraciones) que ha terminado bien también cuenta como listo
+        if container['State'] == 'exited':
+            return container.get('ExitCode') == 0
+        return container['State'] == 'running' and container.get('Health') in (None, 'healthy')
+
+    def _fetch_containers_of_stack(self, stack: "PortainerStack") -> Optional[List["PortainerContainer"]]:
+        containers = self.portainer_api._fetch_containers(
+            filters={'label': [f'com.docker.compose.project={stack["Name"]}']}
+        )
+        if containers is None:
+            return None
+        return [c for c in containers if c['ResourceControlId'] == stack['ResourceControlId']]
+
+    def wait_stack_ready(self, stack: "PortainerStack", timeout: float) -> bool:
+        """
+        Espera a que todos los contenedores del stack estén arrancados y, si tienen
+        healthcheck, sanos (los de un solo uso, terminados con código 0). Con el
+        stream de eventos conectado se despierta con cada cambio del inventario;
+        si no (o si no llega ningún cambio en PORTAINER_WAIT_START_STACK_POLL_IN_SECONDS)
+        consulta solo los contenedores del stack.
+        """
+        deadline = time.monotonic() + timeout
+        poll_interval = Conf.get_conf().get('PORTAINER_WAIT_START_STACK_POLL_IN_SECONDS', 2)
+        changed = False
+
+        while True:
+            containers = None
+            with self._lock:
+                if self.live and changed and self._snapshot is not None:
+                    containers = self._snapshot['index'].get_containers_of_stack(stack)
+            if containers is None:
+                containers = self._fetch_containers_of_stack(stack) or []
+
+            if len(containers) > 0 and all(self.is_container_ready(c) for c in containers):
+                return True
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+
+            with self._changed:
+                changed = self._changed.wait(min(remaining, poll_interval))
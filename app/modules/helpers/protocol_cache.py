@@ -0,0 +1,87 @@
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from modules.helpers.conf import Conf
+from modules.helpers.portainer_api import PortainerContainer, PortainerContainerPort
+from modules.helpers.sqlite import Sqlite
+from utils.utils_network import UtilsNetwork
+
+WEB_PROTOCOLS = ('http', 'https')
+
+
+class ProtocolCache:
+    """
+    Protocolo de cada puerto publicado, persistido en sqlite por (imagen del
+    contenedor, puerto privado): mientras la imagen no cambie la respuesta es la
+    misma, así que no se vuelve a sondear. 'none' no se guarda (el contenedor
+    puede estar arrancando) y 'tcp'/'udp' caducan a las
+    PROTOCOL_CACHE_NON_WEB_TTL_IN_SECONDS, por si el servicio web aún no
+    respondía por HTTP cuando se sondeó.
+    """
+
+    def __init__(self, sqlite: Sqlite):
+        self.sqlite = sqlite
+        self.non_web_ttl = Conf.get_conf().get('PROTOCOL_CACHE_NON_WEB_TTL_IN_SECONDS', 86400)
+        self.sniff_deadline = Conf.get_conf().get('PROTOCOL_SNIFF_DEADLINE_IN_SECONDS', 10)
+        self.sqlite.execute("""
+            CREATE TABLE IF NOT EXISTS protocol_cache (
+                image_id TEXT NOT NULL,
+                private_port INTEGER NOT NULL,
+                protocol TEXT NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (image_id, private_port)
+            )
+        """)
+        self.protocols: Dict[Tuple[str, int], Tuple[str, float]] = {
+            (image_id, private_port): (protocol, updated_at)
+            for image_id, private_port, protocol, updated_at in self.sqlite.fetchall(
+                "SELECT image_id, private_port, protocol, updated_at FROM protocol_cache"
+            )
+        }
+        self._lock = threading.Lock()
+
+    def get(self, image_id: str, private_port: int) -> Optional[str]:
+        with self._lock:
+            cached = self.protocols.get((image_id, private_port))
+        if cached is None:
+            return None
+        protocol, updated_at = cached
+        if protocol not in WEB_PROTOCOLS and time.time() - updated_at >= self.non_web_ttl:
+            return None
+        return protocol
+
+    def set(self, image_id: str, private_port: int, protocol: str):
+        if protocol == 'none':
+            return
+        updated_at = time.time()
+        with self._lock:
+            self.protocols[(image_id, private_port)] = (protocol, updated_at)
+        self.sqlite.execute("""
+            INSERT INTO protocol_cache (image_id, private_port, protocol, updated_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT(image_id, private_port) DO UPDATE SET
+                protocol = excluded.protocol, updated_at = excluded.updated_at
+        """, (image_id, private_port, protocol, updated_at))
+
+    def get_protocol(self, container: PortainerContainer, port: PortainerContainerPort) -> str:
+        """Protocolo del puerto publicado, sondeándolo solo si no está en la caché"""
+        return self.get_protocols([(container, port)])[0]
+
+    def get_protocols(self, container_ports: List[Tuple[PortainerContainer, PortainerContainerPort]]) -> List[str]:
+        """
+        Protocolo de cada puerto publicado, en el mismo orden. Los que no están
+        en la caché se sondean todos a la vez, con un único plazo de
+        PROTOCOL_SNIFF_DEADLINE_IN_SECONDS
+        """
+        protocols = [self.get(container['ImageID'], port['PrivatePort']) for container, port in container_ports]
+        misses = [(port['IP'], port['PublicPort'])
+                  for (container, port), protocol in zip(container_ports, protocols) if protocol is None]
+        if not misses:
+            return protocols
+
+        sniffed = UtilsNetwork.check_protocols(misses, self.sniff_deadline)
+        for i, (container, port) in enumerate(container_ports):
+            if protocols[i] is None:
+                protocols[i] = sniffed[(port['IP'], port['PublicPort'])]
+                self.set(container['ImageID'], port['PrivatePort'], protocols[i])
+        return protocols
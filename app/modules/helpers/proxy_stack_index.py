@@ -0,0 +1,93 @@
+import os
+import re
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from modules.helpers.conf import Conf
+from modules.helpers.nginx_manager_api import NginxManagerApi
+from utils.utils_log import UtilsLog
+
+# Nginx Proxy Manager escribe un access.log por proxy: proxy-host-<id>_access.log
+LOG_FILE_REGEX = re.compile(r'proxy-host-(\d+)_access\.log$')
+
+
+class ProxyStackIndex:
+    """
+    Índice fichero de log -> proxy de Nginx Proxy Manager -> stack. El nombre
+    del stack se obtiene una única vez a partir del dominio del proxy, de modo
+    que no hay que analizar las líneas del log. Se reconstruye cada
+    NGINXMANAGER_PROXY_INDEX_TTL_IN_SECONDS y cuando aparece un proxy nuevo.
+    """
+
+    def __init__(self, nginx_manager_api: NginxManagerApi, extract_stack_name: Callable[[str], Optional[str]],
+                 ttl: float = None):
+        self.nginx_manager_api = nginx_manager_api
+        self.extract_stack_name = extract_stack_name
+        self.ttl = ttl if ttl is not None else Conf.get_conf().get('NGINXMANAGER_PROXY_INDEX_TTL_IN_SECONDS', 300)
+        self.min_refresh_interval = 5
+        self.stack_names_by_proxy_id: Dict[int, Optional[str]] = {}
+        self.refreshed_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    def invalidate(self):
+        with self._lock:
+            self.refreshed_at = None
+
+    def refresh(self):
+        stack_names_by_proxy_id = {
+            proxy['id']: self.extract_stack_name(proxy['domain'])
+            for proxy in self.nginx_manager_api.get_proxies()
+        }
+        with self._lock:
+            self.stack_names_by_proxy_id = stack_names_by_proxy_id
+            self.refreshed_at = time.monotonic()
+        UtilsLog.debug(f'ProxyStackIndex: {len(stack_names_by_proxy_id)} proxies indexados')
+
+    def refresh_in_background(self):
+        """Refresca el índice en otro hilo, salvo que ya haya un refresco en curso"""
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def refresh():
+            try:
+                self.refresh()
+            except Exception as e:
+                UtilsLog.error(f'ProxyStackIndex (refresh): {e}')
+            finally:
+                with self._lock:
+                    self._refreshing = False
+
+        threading.Thread(target=refresh, name='ProxyStackIndexRefresh', daemon=True).start()
+
+    @staticmethod
+    def get_proxy_id_by_log_file(log_file: str) -> Optional[int]:
+        match = LOG_FILE_REGEX.search(os.path.basename(log_file))
+        return int(match.group(1)) if match else None
+
+    def get_stack_name_by_log_file(self, log_file: str, blocking: bool = True) -> Optional[str]:
+        """
+        Stack del fichero de log. Con blocking=False nunca espera a Nginx Proxy
+        Manager: responde con el índice actual y, si hace falta, lo refresca en
+        segundo plano (un proxy recién creado se resuelve en el siguiente acceso)
+        """
+        proxy_id = self.get_proxy_id_by_log_file(log_file)
+        if proxy_id is None:
+            return None
+
+        with self._lock:
+            age = None if self.refreshed_at is None else time.monotonic() - self.refreshed_at
+            is_known = proxy_id in self.stack_names_by_proxy_id
+
+        # Índice caducado, o proxy desconocido (recién creado) sin haber refrescado hace poco
+        if age is None or age >= self.ttl or (not is_known and age >= self.min_refresh_interval):
+            if blocking:
+                self.refresh()
+            else:
+                self.refresh_in_background()
+
+        with self._lock:
+            return self.stack_names_by_proxy_id.get(proxy_id)
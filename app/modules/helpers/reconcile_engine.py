@@ -0,0 +1,87 @@
+import bisect
+from typing import Any, Dict, Iterable, List, TypedDict
+
+from modules.helpers.portainer_api import PortainerStack
+
+
+class PrefixIndex:
+    """Conjunto de prefijos: indica si alguno es prefijo de un texto en O(longitudes distintas)"""
+
+    def __init__(self, prefixes: Iterable[str]):
+        self.prefixes = set(prefixes)
+        self.lengths = sorted({len(prefix) for prefix in self.prefixes})
+
+    def matches(self, value: str) -> bool:
+        for length in self.lengths:
+            if length > len(value):
+                return False
+            if value[:length] in self.prefixes:
+                return True
+        return False
+
+
+class SortedIndex:
+    """Textos ordenados: indica si alguno empieza por un prefijo en O(log n)"""
+
+    def __init__(self, values: Iterable[str]):
+        self.values = sorted(values)
+
+    def has_prefix(self, prefix: str) -> bool:
+        i = bisect.bisect_left(self.values, prefix)
+        return i < len(self.values) and self.values[i].startswith(prefix)
+
+
+class ReconcilePlan(TypedDict):
+    stacks_to_add: List[PortainerStack]
+    items_to_delete: List[Dict[str, Any]]
+    servers_fixed_to_add: List[Dict[str, Any]]
+
+
+class ReconcileEngine:
+    """
+    Calcula qué hay que añadir y eliminar en un backend de dominios (registros
+    de Dnsserver o proxies de Nginx Proxy Manager, ambos con 'domain') a partir
+    de los stacks de Portainer y los servidores fijos. Un dominio pertenece a un
+    stack si empieza por su nombre; se conservan también los dominios que son
+    prefijo del dominio de un servidor fijo.
+    """
+
+    @staticmethod
+    def plan(stacks: List[PortainerStack], items: List[Dict[str, Any]],
+             servers_fixed: List[Dict[str, Any]]) -> ReconcilePlan:
+        domains = SortedIndex(item['domain'] for item in items)
+        domains_exact = {item['domain'] for item in items}
+        stack_names = PrefixIndex(stack['Name'] for stack in stacks)
+        servers_fixed_prefixes = {
+            server_fixed['domain'][:i]
+            for server_fixed in servers_fixed
+            for i in range(len(server_fixed['domain']) + 1)
+        }
+
+        return ReconcilePlan(
+            stacks_to_add=[stack for stack in stacks if not domains.has_prefix(stack['Name'])],
+            items_to_delete=[
+                item for item in items
+                if not stack_names.matches(item['domain']) and item['domain'] not in servers_fixed_prefixes
+            ],
+            servers_fixed_to_add=[
+                server_fixed for server_fixed in servers_fixed if server_fixed['domain'] not in domains_exact
+            ]
+        )
+
+    @staticmethod
+    def plan_stack(stack_name: str, stacks: List[PortainerStack], items: List[Dict[str, Any]],
+                   servers_fixed: List[Dict[str, Any]]) -> ReconcilePlan:
+        """
+        Plan restringido a un stack: solo se tienen en cuenta sus dominios (los
+        que empiezan por su nombre) y el propio stack, si sigue existiendo. Los
+        servidores fijos solo se usan para no borrar sus dominios.
+        """
+        plan = ReconcileEngine.plan(
+            stacks, [item for item in items if item['domain'].startswith(stack_name)], servers_fixed
+        )
+        return ReconcilePlan(
+            stacks_to_add=[stack for stack in plan['stacks_to_add'] if stack['Name'] == stack_name],
+            items_to_delete=plan['items_to_delete'],
+            servers_fixed_to_add=[]
+        )
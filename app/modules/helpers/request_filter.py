@@ -0,0 +1,71 @@
+import re
+from typing import List, Optional, TypedDict
+
+from modules.helpers.conf import Conf
+
+# Formato de log 'proxy' de Nginx Proxy Manager:
+# [$time_local] $upstream_cache_status $upstream_status $status - $request_method $scheme $host "$request_uri"
+# [Client $remote_addr] [Length ...] [Gzip ...] [Sent-to $server] "$http_user_agent" "$http_referer"
+NGINXMANAGER_LOG_REGEX = re.compile(
+    r'^\[[^\]]*\] \S+ \S+ (?P<status>\d{3}) - (?P<method>\S+) \S+ (?P<host>\S+) "(?P<path>[^"]*)"'
+    r'.*?"(?P<user_agent>[^"]*)" "[^"]*"\s*$'
+)
+
+
+class NginxManagerLogRequest(TypedDict):
+    status: int
+    method: str
+    host: str
+    path: str
+    user_agent: str
+
+
+class RequestFilter:
+    """
+    Filtros sobre las peticiones de los access.log para que el tráfico de
+    escáneres y bots no cuente como actividad de un stack ni lo despierte. Una
+    petición se descarta si su ruta o user agent cumplen alguna de las
+    expresiones regulares configuradas o si su código de estado está en la lista.
+    """
+
+    def __init__(self, paths: List[str] = None, user_agents: List[str] = None, statuses: List[int] = None):
+        conf = Conf.get_conf()
+        paths = paths if paths is not None else conf.get('MONITOR_STACK_AWAKE_IGNORE_PATHS', [])
+        user_agents = user_agents if user_agents is not None else conf.get('MONITOR_STACK_AWAKE_IGNORE_USER_AGENTS', [])
+        statuses = statuses if statuses is not None else conf.get('MONITOR_STACK_AWAKE_IGNORE_STATUSES', [])
+        self.path_regex = re.compile('|'.join(f'(?:{p})' for p in paths)) if paths else None
+        self.user_agent_regex = re.compile('|'.join(f'(?:{u})' for u in user_agents), re.IGNORECASE) if user_agents else None
+        self.statuses = set(int(status) for status in statuses)
+
+    @property
+    def enabled(self) -> bool:
+        return self.path_regex is not None or self.user_agent_regex is not None or len(self.statuses) > 0
+
+    @staticmethod
+    def parse(line: str) -> Optional[NginxManagerLogRequest]:
+        match = NGINXMANAGER_LOG_REGEX.match(line)
+        if match is None:
+            return None
+        return NginxManagerLogRequest(
+            status=int(match.group('status')),
+            method=match.group('method'),
+            host=match.group('host'),
+            path=match.group('path'),
+            user_agent=match.group('user_agent')
+        )
+
+    def accepts(self, line: str) -> bool:
+        # Las líneas con otro formato se aceptan, como antes de existir los filtros
+        request = self.parse(line)
+        if request is None:
+            return True
+        if request['status'] in self.statuses:
+            return False
+        if self.path_regex is not None and self.path_regex.search(request['path']):
+            return False
+        if self.user_agent_regex is not None and self.user_agent_regex.search(request['user_agent']):
+            return False
+        return True
+
+    def accepts_any(self, lines: List[str]) -> bool:
+        return any(self.accepts(line) for line in lines)
@@ -0,0 +1,69 @@
+import heapq
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+
+class SleepScheduler:
+    """
+    Cola de vencimientos de inactividad por stack (min-heap). Cada acceso
+    reprograma el vencimiento de su stack; wait_expired duerme hasta el
+    vencimiento más próximo y devuelve exactamente los stacks vencidos. Las
+    entradas antiguas del heap se descartan al sacarlas (borrado perezoso).
+    """
+
+    def __init__(self):
+        self.deadlines: Dict[str, float] = {}
+        self.heap: List[Tuple[float, str]] = []
+        self._condition = threading.Condition()
+
+    def schedule(self, stack_name: str, deadline: float):
+        with self._condition:
+            self.deadlines[stack_name] = deadline
+            heapq.heappush(self.heap, (deadline, stack_name))
+            # Con mucho tráfico se acumulan entradas antiguas: se reconstruye el heap
+            if len(self.heap) > 4 * len(self.deadlines) + 64:
+                self.heap = [(d, name) for name, d in self.deadlines.items()]
+                heapq.heapify(self.heap)
+            # Nuevo vencimiento más próximo que el que se estaba esperando
+            if self.heap[0] == (deadline, stack_name):
+                self._condition.notify_all()
+
+    def unschedule(self, stack_name: str):
+        with self._condition:
+            self.deadlines.pop(stack_name, None)
+
+    def get_deadline(self, stack_name: str) -> Optional[float]:
+        with self._condition:
+            return self.deadlines.get(stack_name)
+
+    def _next_deadline(self) -> Optional[float]:
+        while self.heap:
+            deadline, stack_name = self.heap[0]
+            if self.deadlines.get(stack_name) == deadline:
+                return deadline
+            heapq.heappop(self.heap)
+        return None
+
+    def _pop_expired(self, now: float) -> List[str]:
+        expired = []
+        while True:
+            deadline = self._next_deadline()
+            if deadline is None or deadline > now:
+                return expired
+            _, stack_name = heapq.heappop(self.heap)
+            del self.deadlines[stack_name]
+            expired.append(stack_name)
+
+    def wait_expired(self, max_wait: float) -> List[str]:
+        """Espera como mucho max_wait segundos a que venza algún stack y devuelve los vencidos"""
+        end = time.time() + max_wait
+        with self._condition:
+            while True:
+                now = time.time()
+                expired = self._pop_expired(now)
+                if expired or now >= end:
+                    return expired
+                deadline = self._next_deadline()
+                timeout = end - now if deadline is None else min(deadline, end) - now
+                self._condition.wait(timeout)
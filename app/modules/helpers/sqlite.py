@@ -1,11 +1,14 @@
 import sqlite3
-from typing import Optional
+import threading
+from typing import Any, Iterable, List, Optional, Sequence
 
 from utils.utils_log import UtilsLog
 
 
 class Sqlite:
     def __init__(self, filename):
+        # La conexión se comparte entre los hilos de los monitores: todo acceso pasa por el lock
+        self._lock = threading.RLock()
         try:
             self.conn = sqlite3.connect(filename, check_same_thread=False)
             cur = self.conn.cursor()
@@ -21,9 +24,10 @@ class Sqlite:
 
     def get(self, key: str) -> Optional[str]:
         try:
-            cur = self.conn.cursor()
-            cur.execute("SELECT value FROM data where key = ?", (key,))
-            data = cur.fetchone()
+            with self._lock:
+                cur = self.conn.cursor()
+                cur.execute("SELECT value FROM data where key = ?", (key,))
+                data = cur.fetchone()
             return data
         except Exception as e:
             UtilsLog.error(f'Sqlite (get): {e}')
@@ -31,13 +35,14 @@ class Sqlite:
 
     def set(self, key: str, value: str) -> bool:
         try:
-            cur = self.conn.cursor()
-            cur.execute("""
-                INSERT INTO data (key, value)
-                VALUES (?, ?)
-                ON CONFLICT(key) DO UPDATE SET value = excluded.value
-            """, (key, value))
-            self.conn.commit()
+            with self._lock:
+                cur = self.conn.cursor()
+                cur.execute("""
+                    INSERT INTO data (key, value)
+                    VALUES (?, ?)
+                    ON CONFLICT(key) DO UPDATE SET value = excluded.value
+                """, (key, value))
+                self.conn.commit()
             return True
         except Exception as e:
             UtilsLog.error(f"Sqlite (set): {e}")
@@ -45,17 +50,48 @@ class Sqlite:
 
     def truncate(self) -> bool:
         try:
-            cur = self.conn.cursor()
-            cur.execute("DELETE FROM data")
-            self.conn.commit()
+            with self._lock:
+                cur = self.conn.cursor()
+                cur.execute("DELETE FROM data")
+                self.conn.commit()
             return True
         except Exception as e:
             UtilsLog.error(f"Sqlite (truncate): {e}")
             return False
 
+    def execute(self, sql: str, params: Sequence[Any] = ()) -> bool:
+        try:
+            with self._lock:
+                self.conn.execute(sql, params)
+                self.conn.commit()
+            return True
+        except Exception as e:
+            UtilsLog.error(f"Sqlite (execute): {e}")
+            return False
+
+    def executemany(self, sql: str, params: Iterable[Sequence[Any]]) -> bool:
+        """Ejecuta la sentencia para todos los parámetros en una única transacción"""
+        try:
+            with self._lock:
+                self.conn.executemany(sql, params)
+                self.conn.commit()
+            return True
+        except Exception as e:
+            UtilsLog.error(f"Sqlite (executemany): {e}")
+            return False
+
+    def fetchall(self, sql: str, params: Sequence[Any] = ()) -> List[tuple]:
+        try:
+            with self._lock:
+                return self.conn.execute(sql, params).fetchall()
+        except Exception as e:
+            UtilsLog.error(f"Sqlite (fetchall): {e}")
+            return []
+
     def close(self):
         try:
-            self.conn.close()
+            with self._lock:
+                self.conn.close()
         except Exception as e:
             UtilsLog.error(f'Sqlite (close): {e}')
             return False
@@ -0,0 +1,71 @@
+import time
+from enum import Enum
+from typing import List, TypedDict
+
+from modules.helpers.async_api import AsyncApi, AsyncPortainerApi
+from modules.helpers.conf import Conf
+from modules.helpers.portainer_api import PortainerStack
+from utils.utils_log import UtilsLog
+
+
+class StackLifecycleAction(Enum):
+    start = 'start'
+    stop = 'stop'
+
+
+class StackLifecycleResult(TypedDict):
+    Name: str
+    Action: StackLifecycleAction
+    Ok: bool
+    Duration: float
+
+
+class StackLifecycleExecutor:
+    """
+    Arranca o para un lote de stacks en paralelo, con un máximo de
+    STACK_LIFECYCLE_MAX_CONCURRENCY operaciones simultáneas contra Portainer, y
+    devuelve el resultado y la duración de cada stack.
+    """
+
+    def __init__(self, portainer_api_async: AsyncPortainerApi, max_concurrency: int = None):
+        self.portainer_api_async = portainer_api_async
+        self.max_concurrency = max_concurrency if max_concurrency is not None \
+            else Conf.get_conf().get('STACK_LIFECYCLE_MAX_CONCURRENCY', 4)
+
+    async def _run_one(self, stack: PortainerStack, action: StackLifecycleAction) -> StackLifecycleResult:
+        started_at = time.monotonic()
+        try:
+            if action == StackLifecycleAction.start:
+                ok = await self.portainer_api_async.start_stack_by_stack_id(stack['Id'])
+            else:
+                ok = await self.portainer_api_async.stop_stack_by_stack_id(stack['Id'])
+        except Exception as e:
+            UtilsLog.error(f'StackLifecycleExecutor ({action.value} {stack["Name"]}): {e}')
+            ok = False
+
+        return StackLifecycleResult(
+            Name=stack['Name'],
+            Action=action,
+            Ok=bool(ok),
+            Duration=time.monotonic() - started_at
+        )
+
+    def run(self, stacks: List[PortainerStack], action: StackLifecycleAction) -> List[StackLifecycleResult]:
+        if len(stacks) == 0:
+            return []
+
+        started_at = time.monotonic()
+        results = AsyncApi.run([self._run_one(stack, action) for stack in stacks], limit=self.max_concurrency)
+
+        num_ok = sum(1 for result in results if result['Ok'])
+        UtilsLog.info(
+            f'StackLifecycleExecutor: {action.value} de {len(results)} stacks '
+            f'({num_ok} correctos) en {time.monotonic() - started_at:.1f} segundos'
+        )
+        return results
+
+    def start(self, stacks: List[PortainerStack]) -> List[StackLifecycleResult]:
+        return self.run(stacks, StackLifecycleAction.start)
+
+    def stop(self, stacks: List[PortainerStack]) -> List[StackLifecycleResult]:
+        return self.run(stacks, StackLifecycleAction.stop)
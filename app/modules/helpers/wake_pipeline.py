@@ -0,0 +1,130 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Set
+
+from modules.helpers.conf import Conf
+from utils.utils_log import UtilsLog
+
+
+class WakeAdmissionController:
+    """
+    Control de admisión de arranques: como mucho MONITOR_STACK_AWAKE_MAX_CONCURRENT_STARTS
+    arranques simultáneos, un stack no se vuelve a intentar arrancar hasta pasados
+    MONITOR_STACK_AWAKE_COOLDOWN_IN_SECONDS y los stacks de
+    MONITOR_STACK_AWAKE_STACKS_PRIORITY (en su orden) se atienden antes que el resto.
+    """
+
+    def __init__(self, max_concurrent_starts: int = None, cooldown: float = None, stacks_priority: List[str] = None):
+        conf = Conf.get_conf()
+        self.max_concurrent_starts = max_concurrent_starts if max_concurrent_starts is not None \
+            else conf.get('MONITOR_STACK_AWAKE_MAX_CONCURRENT_STARTS', 2)
+        self.cooldown = cooldown if cooldown is not None else conf.get('MONITOR_STACK_AWAKE_COOLDOWN_IN_SECONDS', 60)
+        self.stacks_priority = stacks_priority if stacks_priority is not None \
+            else conf.get('MONITOR_STACK_AWAKE_STACKS_PRIORITY', [])
+        self.last_starts: Dict[str, float] = {}
+        self.semaphore = threading.BoundedSemaphore(self.max_concurrent_starts)
+        self._lock = threading.Lock()
+
+    def admit(self, stack_name: str) -> bool:
+        with self._lock:
+            last_start = self.last_starts.get(stack_name)
+            return last_start is None or time.monotonic() - last_start >= self.cooldown
+
+    def get_priority(self, stack_name: str) -> tuple:
+        if stack_name in self.stacks_priority:
+            return 0, self.stacks_priority.index(stack_name)
+        return 1, 0
+
+    def acquire(self):
+        self.semaphore.acquire()
+
+    def release(self, stack_name: str):
+        with self._lock:
+            self.last_starts[stack_name] = time.monotonic()
+        self.semaphore.release()
+
+
+class WakeQueue:
+    """
+    Cola acotada de stacks a arrancar. Un stack solo puede estar una vez en la
+    cola o en curso, de modo que el tráfico repetido mientras se arranca no
+    genera más peticiones. Si la cola está llena se descarta la petición (el
+    siguiente acceso al stack la volverá a encolar). Con control de admisión se
+    descartan los stacks en enfriamiento y se sirven primero los prioritarios.
+    """
+
+    def __init__(self, maxsize: int = 100, admission: Optional[WakeAdmissionController] = None):
+        self.maxsize = maxsize
+        self.admission = admission
+        self.pending: Dict[str, None] = OrderedDict()
+        self.in_progress: Set[str] = set()
+        self._condition = threading.Condition()
+
+    def put(self, stack_name: str) -> bool:
+        with self._condition:
+            if stack_name in self.pending or stack_name in self.in_progress:
+                return False
+            if self.admission is not None and not self.admission.admit(stack_name):
+                UtilsLog.debug(f"WakeQueue: {stack_name} arrancado hace menos de {self.admission.cooldown}s, se ignora")
+                return False
+            if len(self.pending) >= self.maxsize:
+                UtilsLog.warning(f"WakeQueue: cola llena, descartado el arranque de {stack_name}")
+                return False
+            self.pending[stack_name] = None
+            self._condition.notify()
+            return True
+
+    def get(self, timeout: float = None) -> Optional[str]:
+        with self._condition:
+            if not self._condition.wait_for(lambda: len(self.pending) > 0, timeout):
+                return None
+            if self.admission is None:
+                stack_name, _ = self.pending.popitem(last=False)
+            else:
+                # El más prioritario y, a igualdad, el más antiguo
+                stack_name = min(self.pending, key=self.admission.get_priority)
+                del self.pending[stack_name]
+            self.in_progress.add(stack_name)
+            return stack_name
+
+    def done(self, stack_name: str):
+        with self._condition:
+            self.in_progress.discard(stack_name)
+
+
+class WakeStarterPool:
+    """Hilos que consumen la WakeQueue y arrancan los stacks en paralelo"""
+
+    def __init__(self, queue: WakeQueue, start: Callable[[str], None], workers: int = 4):
+        self.queue = queue
+        self.start_stack = start
+        self.workers = workers
+        self.threads: List[threading.Thread] = []
+
+    def start(self):
+        if self.threads:
+            return
+        self.threads = [
+            threading.Thread(target=self._worker, name=f'WakeStarter-{i}', daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def _worker(self):
+        admission = self.queue.admission
+        while True:
+            # Se reserva el hueco antes de sacar de la cola, para que la prioridad se decida
+            # cuando de verdad se puede arrancar
+            if admission is not None:
+                admission.acquire()
+            stack_name = self.queue.get()
+            try:
+                self.start_stack(stack_name)
+            except Exception as e:
+                UtilsLog.error(f"WakeStarterPool ({stack_name}): {e}")
+            finally:
+                if admission is not None:
+                    admission.release(stack_name)
+                self.queue.done(stack_name)
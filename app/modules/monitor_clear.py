@@ -1,7 +1,11 @@
 import time
+from datetime import datetime
+from typing import Dict, List, Set, Tuple
 
 from manager import Manager
 from modules.helpers.conf import Conf
+from modules.helpers.portainer_api import PortainerSystemDfImage
+from utils.utils_file import UtilsFile
 from utils.utils_log import UtilsLog
 
 
@@ -15,17 +19,139 @@ class MonitorClear:
         while True:
             UtilsLog.info(f"Arrancado MonitorClear")
             while self.conf.get('MONITOR_CLEAR_ENABLED'):
-                while self.clear_images() != 0:
-                    time.sleep(1)
+                try:
+                    self.clear()
+                    if self.conf.get('MONITOR_CLEAR_DISK_BUDGET_IN_GB', 0) > 0:
+                        self.evict_images(dry_run=self.conf.get('MONITOR_CLEAR_DISK_BUDGET_DRY_RUN', False))
+                except Exception as e:
+                    UtilsLog.error(f"Error en MonitorClear: {str(e)}")
                 tiempo = self.conf.get('MONITOR_CLEAR_TIME_CHECK_IN_MINUTES')
                 UtilsLog.info(f"Finalizado MonitorClear, esperando {tiempo} minutos")
                 time.sleep(tiempo * 60)
             time.sleep(5)
 
-    def clear_images(self) -> int:
-        num_deleted = 0
-        for image in self.manager.portainer_api.get_images():
-            if len(image['RepoTags']) == 0 and self.manager.portainer_api.delete_image_by_id(image['Id']):
-                UtilsLog.info(f'Eliminada imagen huérfana {image["Id"]}')
-                num_deleted += 1
-        return num_deleted
+    def clear(self) -> int:
+        """
+        Limpieza mediante los endpoints prune de Docker: una petición por tipo de
+        recurso en lugar de una por imagen. Devuelve los bytes liberados.
+        """
+        until = self.conf.get('MONITOR_CLEAR_PRUNE_UNTIL', '') or None
+        labels = self.conf.get('MONITOR_CLEAR_PRUNE_LABELS', [])
+        portainer_api = self.manager.portainer_api
+
+        prunes = []
+        if self.conf.get('MONITOR_CLEAR_PRUNE_CONTAINERS', False):
+            prunes.append(('contenedores', lambda: portainer_api.prune_containers(until=until, labels=labels)))
+        if self.conf.get('MONITOR_CLEAR_PRUNE_IMAGES', True):
+            dangling = self.conf.get('MONITOR_CLEAR_PRUNE_IMAGES_DANGLING', True)
+            prunes.append(('imágenes', lambda: portainer_api.prune_images(dangling=dangling, until=until, labels=labels)))
+        if self.conf.get('MONITOR_CLEAR_PRUNE_VOLUMES', False):
+            prunes.append(('volúmenes', lambda: portainer_api.prune_volumes(labels=labels)))
+        if self.conf.get('MONITOR_CLEAR_PRUNE_BUILD_CACHE', True):
+            prunes.append(('caché de build', lambda: portainer_api.prune_build_cache(until=until)))
+
+        space_reclaimed = 0
+        for name, prune in prunes:
+            result = prune()
+            if result is None:
+                continue
+            space_reclaimed += result['SpaceReclaimed']
+            if result['Deleted'] > 0 or result['SpaceReclaimed'] > 0:
+                UtilsLog.info(f"MonitorClear: eliminados {result['Deleted']} {name} "
+                              f"({UtilsFile.size_to_human(result['SpaceReclaimed'])})")
+
+        UtilsLog.info(f"MonitorClear: liberados {UtilsFile.size_to_human(space_reclaimed)}")
+        return space_reclaimed
+
+    def get_last_use_of_images(self, images: List[PortainerSystemDfImage]) -> Dict[str, datetime]:
+        """
+        Último uso conocido de cada imagen: arranque de un contenedor o acceso a un
+        stack que la usa. Si no se conoce, su fecha de creación.
+        """
+        common = self.manager.common
+        last_use_of_images, images_of_stacks = common.get_images_usage()
+        last_uses = {image_id: [last_use] for image_id, last_use in last_use_of_images.items()}
+        for stack_name, image_ids in images_of_stacks.items():
+            last_access = common.last_accesses_to_stacks.get(stack_name, None)
+            if last_access is None:
+                continue
+            for image_id in image_ids:
+                last_uses.setdefault(image_id, []).append(last_access)
+        return {
+            image['Id']: max(last_uses[image['Id']]) if image['Id'] in last_uses
+            else datetime.fromtimestamp(image['Created'])
+            for image in images
+        }
+
+    def get_built_images(self) -> Tuple[Set[str], Set[str]]:
+        """
+        Imágenes que construyen los stacks en local (build): sus RepoTags y, para los
+        stacks cuyo compose no se puede interpretar, los Id de todas sus imágenes conocidas.
+        """
+        common = self.manager.common
+        _, images_of_stacks = common.get_images_usage()
+        built_images, built_image_ids = set(), set()
+        for stack in self.manager.portainer_api.get_stacks():
+            stack_built_images = common.compose_resolver.get_built_images(stack)
+            if stack_built_images is None:
+                built_image_ids |= images_of_stacks.get(stack['Name'], set())
+            else:
+                built_images |= stack_built_images
+        return built_images, built_image_ids
+
+    def evict_images(self, dry_run: bool = False) -> int:
+        """
+        Elimina las imágenes no usadas por ningún contenedor, de la usada hace más
+        tiempo a la más reciente (y a igualdad, la más grande primero), hasta que el
+        espacio ocupado por las imágenes baja del presupuesto configurado. Devuelve
+        los bytes liberados (o que se liberarían en modo dry-run).
+        """
+        budget = int(self.conf.get('MONITOR_CLEAR_DISK_BUDGET_IN_GB', 0) * 1024 ** 3)
+        system_df = self.manager.portainer_api.get_system_df()
+        if system_df is None:
+            return 0
+
+        usage = system_df['LayersSize']
+        if usage <= budget:
+            UtilsLog.debug(f"MonitorClear: imágenes ocupan {UtilsFile.size_to_human(usage)}, dentro del presupuesto")
+            return 0
+
+        # Se aprovecha para conocer las imágenes de los stacks arrancados
+        for stack in self.manager.portainer_api.get_stacks_with_containers():
+            self.manager.common.register_images_of_stack(stack)
+
+        image_ids_in_use = {container['ImageID'] for container in system_df['Containers']}
+        built_images, built_image_ids = self.get_built_images()
+        # Un stack dormido no tiene contenedores: sin RepoDigests (construida o sin registro) o construida
+        # por un stack, la imagen no se podría volver a descargar al despertarlo
+        candidates = [
+            image for image in system_df['Images']
+            if image['Containers'] <= 0 and image['Id'] not in image_ids_in_use
+            and image['RepoDigests'] and image['Id'] not in built_image_ids
+            and not built_images.intersection(image['RepoTags'])
+        ]
+        last_uses = self.get_last_use_of_images(candidates)
+        candidates.sort(key=lambda image: (last_uses[image['Id']], -image['Size']))
+
+        reclaimed = 0
+        for image in candidates:
+            if usage - reclaimed <= budget:
+                break
+
+            # Las capas compartidas con otras imágenes no se liberan al eliminarla
+            size = image['Size'] - max(image['SharedSize'], 0)
+            name = image['RepoTags'][0] if image['RepoTags'] else image['Id']
+            last_use = last_uses[image['Id']]
+
+            if dry_run:
+                UtilsLog.info(f"MonitorClear (dry-run): se eliminaría {name} "
+                              f"({UtilsFile.size_to_human(size)}, último uso {last_use})")
+                reclaimed += size
+            elif self.manager.portainer_api.delete_image_by_id(image['Id']):
+                UtilsLog.info(f"MonitorClear: eliminada imagen {name} "
+                              f"({UtilsFile.size_to_human(size)}, último uso {last_use})")
+                reclaimed += size
+
+        UtilsLog.info(f"MonitorClear{' (dry-run)' if dry_run else ''}: imágenes ocupan {UtilsFile.size_to_human(usage)}, "
+                      f"presupuesto {UtilsFile.size_to_human(budget)}, liberados {UtilsFile.size_to_human(reclaimed)}")
+        return reclaimed
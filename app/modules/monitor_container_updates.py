@@ -1,9 +1,10 @@
 import time
-from typing import List
+from typing import Dict, List, Optional, Tuple
 
 from manager import Manager
 from modules.helpers.conf import Conf
 from modules.helpers.cron_manager import start_cron
+from modules.helpers.image_pull_scheduler import ImagePullScheduler
 from modules.helpers.portainer_api import PortainerStack
 from utils.utils_log import UtilsLog
 from utils.utils_telegram import UtilsTelegram
@@ -28,39 +29,100 @@ class MonitorContainerUpdates:
 
     def update_images(self):
         try:
-            stacks: List[PortainerStack] = self.manager.portainer_api.get_stacks_with_containers()
-            for stack in stacks:
-
-                is_stopped = False
-                if stack['Status'] == 2:
-                    self.manager.portainer_api.start_stack_by_stack_id(stack['Id'])
-                    is_stopped = True
-                    time.sleep(1)
-                    stack = self.manager.portainer_api.get_stack_with_containers(stack['Name'])
-                    if stack is None:
-                        continue
-
-                is_updated = False
-                for container in stack['Containers']:
-                    image_id_local = container['ImageID']
-                    image_name = container['Image']
-
-                    self.manager.portainer_api.download_latest_image_by_image_name(image_name, with_dockerhub_auth=True)
-                    image = self.manager.portainer_api.get_image_info_by_name(image_name)
-                    if image is not None:
-                        if image_id_local != image['Id']:
-                            msg = f'{stack["Name"]} ({image_name}) actualizado'
-                            UtilsLog.info(msg)
-                            UtilsTelegram.enviar_mensaje(msg)
-                            is_updated = True
-
-                if is_stopped:
-                    self.manager.portainer_api.stop_stack_by_stack_id(stack['Id'])
-
-                # Si está en funcionamiento y se actualiza, se reinicia
-                if not is_stopped and is_updated:
-                    self.manager.portainer_api.stop_stack_by_stack_id(stack['Id'])
-                    time.sleep(1)
-                    self.manager.portainer_api.start_stack_by_stack_id(stack['Id'])
+            stacks = self.get_stacks_with_images()
+
+            # Cada imagen se comprueba/descarga una única vez aunque la usen varios stacks, en paralelo
+            # y por orden de prioridad; cada stack se reinicia en cuanto terminan sus imágenes
+            scheduler = ImagePullScheduler(
+                self.update_image,
+                max_concurrency=self.conf.get('MONITOR_CONTAINER_UPDATES_MAX_CONCURRENT_PULLS', 4),
+                max_concurrency_per_registry=self.conf.get('MONITOR_CONTAINER_UPDATES_MAX_CONCURRENT_PULLS_PER_REGISTRY', 2)
+            )
+            stacks_by_name = {}
+            for stack, is_stopped in stacks:
+                stacks_by_name[stack['Name']] = (stack, is_stopped)
+                scheduler.add_stack(
+                    stack['Name'],
+                    self.get_stack_priority(stack, is_stopped),
+                    [container['Image'] for container in stack['Containers']]
+                )
+
+            results = scheduler.run(
+                on_stack_done=lambda stack_name, stack_results: self.apply_updates_to_stack(
+                    *stacks_by_name[stack_name],
+                    {image_name: result[1] for image_name, result in stack_results.items() if result is not None}
+                )
+            )
+
+            num_images = sum(len(stack['Containers']) for stack, _ in stacks)
+            num_pulled = sum(1 for result in results.values() if result is not None and result[0])
+            UtilsLog.info(
+                f"MonitorContainerUpdates: {len(results)} imágenes únicas comprobadas, "
+                f"{num_pulled} descargadas, {num_images - len(results)} descargas ahorradas"
+            )
         except Exception as e:
             UtilsLog.error(f"Error en update_images: {str(e)}")
+
+    def get_stack_priority(self, stack: PortainerStack, is_stopped: bool) -> Tuple[int, int]:
+        """Primero los stacks configurados (en su orden), después los arrancados y por último los parados"""
+        stacks_priority = self.conf.get('MONITOR_CONTAINER_UPDATES_STACKS_PRIORITY', [])
+        if stack['Name'] in stacks_priority:
+            return 0, stacks_priority.index(stack['Name'])
+        return (2, 0) if is_stopped else (1, 0)
+
+    def get_stacks_with_images(self) -> List[Tuple[PortainerStack, bool]]:
+        """
+        Stacks con sus contenedores. Los stacks parados no tienen contenedores, así
+        que se arrancan un momento para conocer sus imágenes y se vuelven a parar.
+        """
+        stacks = []
+        for stack in self.manager.portainer_api.get_stacks_with_containers():
+            is_stopped = False
+            if stack['Status'] == 2:
+                stack_id = stack['Id']
+                self.manager.portainer_api.start_stack_by_stack_id(stack_id)
+                is_stopped = True
+                time.sleep(1)
+                stack = self.manager.portainer_api.get_stack_with_containers(stack['Name'])
+                self.manager.portainer_api.stop_stack_by_stack_id(stack_id)
+                if stack is None:
+                    continue
+            stacks.append((stack, is_stopped))
+        return stacks
+
+    def update_image(self, image_name: str) -> Tuple[bool, Optional[str]]:
+        """
+        Descarga la última versión de la imagen si ha cambiado. Devuelve si se ha
+        descargado y el identificador de la imagen local (tras la descarga, si la hay).
+        """
+        # Solo se descarga la imagen si el digest del registro difiere del local
+        # (si no se puede comprobar se descarga como antes)
+        if self.conf.get('MONITOR_CONTAINER_UPDATES_CHECK_DIGEST', True) \
+                and self.manager.portainer_api.image_has_update(image_name) is False:
+            UtilsLog.debug(f'{image_name} sin cambios en el registro')
+            is_pulled = False
+        else:
+            self.manager.portainer_api.download_latest_image_by_image_name(image_name, with_dockerhub_auth=True)
+            is_pulled = True
+
+        # Aunque no se descargue se devuelve la imagen local: un contenedor puede seguir con una anterior
+        # (descarga manual o de otra herramienta, reinicio fallido...)
+        image = self.manager.portainer_api.get_image_info_by_name(image_name)
+        return is_pulled, image['Id'] if image is not None else None
+
+    def apply_updates_to_stack(self, stack: PortainerStack, is_stopped: bool, latest_image_ids: Dict[str, Optional[str]]):
+        is_updated = False
+        for container in stack['Containers']:
+            image_name = container['Image']
+            latest_image_id = latest_image_ids.get(image_name)
+            if latest_image_id is not None and latest_image_id != container['ImageID']:
+                msg = f'{stack["Name"]} ({image_name}) actualizado'
+                UtilsLog.info(msg)
+                UtilsTelegram.enviar_mensaje(msg)
+                is_updated = True
+
+        # Si está en funcionamiento y se actualiza, se reinicia
+        if not is_stopped and is_updated:
+            self.manager.portainer_api.stop_stack_by_stack_id(stack['Id'])
+            time.sleep(1)
+            self.manager.portainer_api.start_stack_by_stack_id(stack['Id'])
@@ -1,85 +1,144 @@
 import time
+from typing import Iterable, List, Optional
 
 from manager import Manager
+from modules.helpers.async_api import AsyncApi
 from modules.helpers.conf import Conf
+from modules.helpers.portainer_api import PortainerStack
+from modules.helpers.portainer_events import DockerEvent
+from modules.helpers.reconcile_engine import ReconcileEngine, ReconcilePlan
+from modules.helpers.sleep_scheduler import SleepScheduler
 from utils.utils_log import UtilsLog
 
+# Acciones de contenedor que pueden indicar que un stack se ha creado, eliminado o renombrado
+STACK_CHANGE_ACTIONS = {'create', 'destroy', 'rename'}
+
 
 class MonitorDnsserverAndNginxManager:
 
     def __init__(self, manager: Manager):
         self.manager = manager
         self.conf = Conf.get_conf()
+        # Stacks pendientes de reconciliar; cada aviso retrasa el suyo para agrupar ráfagas de eventos
+        self.pending_stacks = SleepScheduler()
+        self.manager.portainer_events.add_listener(self.on_docker_event)
+        self.manager.portainer_api.inventory.add_stacks_listener(self.on_stacks_changed)
+
+    def on_docker_event(self, event: DockerEvent):
+        if event.get('Type') != 'container' or event.get('Action') not in STACK_CHANGE_ACTIONS:
+            return
+        stack_name = (event['Actor'].get('Attributes') or {}).get('com.docker.compose.project')
+        if not stack_name:
+            return
+        # Dormir y despertar un stack (compose down/up) destruye y crea sus contenedores sin cambiar sus
+        # dominios: create/destroy solo cuentan para stacks que el inventario aún no conoce. La eliminación
+        # de un stack conocido llega por on_stacks_changed con la siguiente foto completa
+        if event['Action'] != 'rename' and self.manager.portainer_api.inventory.find_stack_by_name(stack_name):
+            return
+        self.notify_stack_changed(stack_name)
+
+    def on_stacks_changed(self, stack_names: Iterable[str]):
+        for stack_name in stack_names:
+            self.notify_stack_changed(stack_name)
+
+    def notify_stack_changed(self, stack_name: str):
+        """Programa la reconciliación solo de los dominios de un stack creado, eliminado o cambiado"""
+        delay = self.conf.get('MONITOR_STACK_DNSSERVER_AND_NGINXMANAGER_STACK_CHANGE_DELAY_IN_SECONDS', 10)
+        self.pending_stacks.schedule(stack_name, time.time() + delay)
 
     def init(self):
 
         while True:
             while self.conf.get('MONITOR_STACK_DNSSERVER_AND_NGINXMANAGER_ENABLED'):
+
+                # La pasada completa es la red de seguridad; entre pasadas solo se reconcilian
+                # los stacks de los que llega aviso
                 UtilsLog.info(f"Arrancado MonitorDnsserverAndNginxManager")
                 self.check_portainer_and_dnsserver()
                 self.check_portainer_and_nginx_manager()
                 tiempo = self.conf.get('MONITOR_STACK_DNSSERVER_AND_NGINXMANAGER_TIME_CHECK_STACKS_IN_MINUTES')
                 UtilsLog.info(f"Finalizado MonitorDnsserverAndNginxManager, esperando {tiempo} minutos")
-                time.sleep(tiempo * 60)
+
+                full_check_at = time.time() + tiempo * 60
+                while self.conf.get('MONITOR_STACK_DNSSERVER_AND_NGINXMANAGER_ENABLED') and time.time() < full_check_at:
+                    for stack_name in self.pending_stacks.wait_expired(min(full_check_at - time.time(), 60)):
+                        self.check_stack(stack_name)
+
             time.sleep(5)
 
-    def check_portainer_and_dnsserver(self):
+    def check_stack(self, stack_name: str):
+        portainer_stacks = self.get_stack(stack_name)
+        if portainer_stacks is None:
+            UtilsLog.error(f"MonitorDnsserverAndNginxManager: no se ha podido obtener el stack {stack_name}")
+            return
+        UtilsLog.info(f"MonitorDnsserverAndNginxManager: reconciliando stack {stack_name}")
+        self.check_portainer_and_dnsserver(stack_name, portainer_stacks)
+        self.check_portainer_and_nginx_manager(stack_name, portainer_stacks)
+
+    def get_stack(self, stack_name: str) -> Optional[List[PortainerStack]]:
+        """
+        El stack con sus contenedores recién pedidos a Portainer (solo ese stack y sus
+        contenedores si el inventario lo conoce), como lista para el plan: vacía si el
+        stack ya no existe y None si no se ha podido obtener.
+        """
+        portainer_api = self.manager.portainer_api
+        stack = portainer_api.get_stack_with_containers(stack_name, use_cache=False)
+        if stack is not None:
+            return [stack]
+        # Solo se da por eliminado si el inventario se ha podido pedir y ya no lo incluye
+        if not portainer_api.inventory.is_loaded() or portainer_api.inventory.find_stack_by_name(stack_name):
+            return None
+        return []
+
+    def get_plan(self, items, stack_name: Optional[str] = None,
+                 portainer_stacks: Optional[List[PortainerStack]] = None) -> ReconcilePlan:
+        """Plan de todos los stacks o, con stack_name, solo de los dominios de ese stack"""
+        servers_fixed = self.conf.get('MONITOR_STACK_DNSSERVER_AND_NGINXMANAGER_SERVERS_FIXED')
+        if stack_name is None:
+            return ReconcileEngine.plan(self.manager.portainer_api.get_stacks_with_containers(), items, servers_fixed)
+        return ReconcileEngine.plan_stack(stack_name, portainer_stacks, items, servers_fixed)
+
+    def check_portainer_and_dnsserver(self, stack_name: Optional[str] = None,
+                                      portainer_stacks: Optional[List[PortainerStack]] = None):
 
         dnsserver_records = self.manager.dnsserver_api.get_records(self.conf.get('DOMAIN'))
-        portainer_stacks = self.manager.portainer_api.get_stacks_with_containers()
+        plan = self.get_plan(dnsserver_records, stack_name, portainer_stacks)
 
-        # Buscar los dominios que son necesarios incluir en dnsserver
-        for stack in portainer_stacks:
-            if not any(d['domain'].startswith(stack['Name']) for d in dnsserver_records):
-                self.manager.common.dnsserver_add_domain_from_portainer_stack(stack)
+        # Dominios que son necesarios incluir en dnsserver
+        for stack in plan['stacks_to_add']:
+            self.manager.common.dnsserver_add_domain_from_portainer_stack(stack)
 
-        # Buscar los dominios que son necesarios eliminar en dnsserver
-        servers_fixed = self.conf.get('MONITOR_STACK_DNSSERVER_AND_NGINXMANAGER_SERVERS_FIXED')
-        for dnsserver_record in dnsserver_records:
-            found = any(dnsserver_record['domain'].startswith(portainer_stack['Name']) for portainer_stack in portainer_stacks) \
-                    or any(server_fixed['domain'].startswith(dnsserver_record['domain']) for server_fixed in servers_fixed)
-            if not found:
-                self.manager.common.dnsserver_delete_domain(dnsserver_record)
+        # Dominios que son necesarios eliminar en dnsserver (se eliminan de forma concurrente)
+        AsyncApi.run(self.manager.common.dnsserver_delete_domain_async(r) for r in plan['items_to_delete'])
 
         # Agregar servidores fijos si no lo están ya
-        for server_fixed in servers_fixed:
-            if not any(server_fixed['domain'] == dns['domain'] for dns in dnsserver_records):
-                if self.manager.dnsserver_api.add_record(domain=server_fixed['domain']):
-                    UtilsLog.info(f"Agregado dominio de servidor fijo en dnsserver: {server_fixed['domain']}")
+        for server_fixed in plan['servers_fixed_to_add']:
+            if self.manager.dnsserver_api.add_record(domain=server_fixed['domain']):
+                UtilsLog.info(f"Agregado dominio de servidor fijo en dnsserver: {server_fixed['domain']}")
 
-    def check_portainer_and_nginx_manager(self):
+    def check_portainer_and_nginx_manager(self, stack_name: Optional[str] = None,
+                                          portainer_stacks: Optional[List[PortainerStack]] = None):
 
         nginx_proxies = self.manager.nginx_manager_api.get_proxies()
-        portainer_stacks = self.manager.portainer_api.get_stacks_with_containers()
-
-        # Buscar los dominios que son necesarios incluir en nginx proxy manager
-        for stack in portainer_stacks:
-            is_found = any(
-                proxy["domain"].startswith(stack["Name"])
-                for proxy in nginx_proxies
-            )
+        plan = self.get_plan(nginx_proxies, stack_name, portainer_stacks)
 
-            if not is_found:
-                self.manager.common.nginxmanager_add_proxy_from_portainer_stack(stack)
+        # Dominios que son necesarios incluir en nginx proxy manager
+        for stack in plan['stacks_to_add']:
+            self.manager.common.nginxmanager_add_proxy_from_portainer_stack(stack)
 
-        # Buscar los dominios que son necesarios eliminar en nginx proxy manager
-        servers_fixed = self.conf.get('MONITOR_STACK_DNSSERVER_AND_NGINXMANAGER_SERVERS_FIXED')
-        for nginx_proxy in nginx_proxies:
-            if not any(nginx_proxy['domain'].startswith(stack['Name']) for stack in portainer_stacks) \
-                    and not any(server_fixed['domain'].startswith(nginx_proxy['domain']) for server_fixed in servers_fixed):
-                self.manager.common.nginxmanager_delete_proxy(nginx_proxy)
+        # Dominios que son necesarios eliminar en nginx proxy manager (se eliminan de forma concurrente)
+        AsyncApi.run(self.manager.common.nginxmanager_delete_proxy_async(p) for p in plan['items_to_delete'])
 
         # Agregar servidores fijos si no lo están ya
-        for server_fixed in servers_fixed:
-            if not any(server_fixed['domain'] == p['domain'] for p in nginx_proxies):
-                certificate_id = self.manager.nginx_manager_api.get_certificate_id_by_name(self.conf.get('DOMAIN'))
-                self.manager.nginx_manager_api.add_proxy(
-                    subdomain=server_fixed['domain'],
-                    protocol_nginx='https',
-                    protocol_target=server_fixed['protocol_target'],
-                    ip=server_fixed["ip"],
-                    port=server_fixed["port"],
-                    certificate_id=certificate_id
-                )
-                UtilsLog.info(f"Agregado dominio de servidor fijo en nginx proxy manager: {server_fixed['domain']}")
-
+        if plan['servers_fixed_to_add']:
+            certificate_id = self.manager.nginx_manager_api.get_certificate_id_by_name(self.conf.get('DOMAIN'))
+        for server_fixed in plan['servers_fixed_to_add']:
+            self.manager.nginx_manager_api.add_proxy(
+                subdomain=server_fixed['domain'],
+                protocol_nginx='https',
+                protocol_target=server_fixed['protocol_target'],
+                ip=server_fixed["ip"],
+                port=server_fixed["port"],
+                certificate_id=certificate_id
+            )
+            UtilsLog.info(f"Agregado dominio de servidor fijo en nginx proxy manager: {server_fixed['domain']}")
@@ -1,12 +1,12 @@
-import glob
-import os
 import time
-from datetime import datetime
-from typing import List
+from typing import Optional
 
 from manager import Manager
 from modules.helpers.conf import Conf
-from modules.helpers.portainer_api import PortainerStack
+from modules.helpers.log_tailer import LogTailer
+from modules.helpers.proxy_stack_index import ProxyStackIndex
+from modules.helpers.request_filter import RequestFilter
+from modules.helpers.wake_pipeline import WakeQueue, WakeStarterPool, WakeAdmissionController
 from utils.utils_log import UtilsLog
 
 
@@ -14,66 +14,77 @@ class MonitorStackAwake:
 
     def __init__(self, manager: Manager):
         self.manager = manager
-        self.file_positions = {}
         self.conf = Conf.get_conf()
+        # Sin filtros de peticiones basta con saber qué ficheros han crecido, sin leer las líneas
+        self.request_filter = RequestFilter()
+        self.tailer = LogTailer(
+            '/logs', 'proxy-host-*_access.log', read_lines=self.request_filter.enabled,
+            offset_store=self.manager.log_offset_store
+        )
+        self.wake_queue = WakeQueue(
+            self.conf.get('MONITOR_STACK_AWAKE_WAKE_QUEUE_SIZE', 100),
+            admission=WakeAdmissionController()
+        )
+        self.starter_pool = WakeStarterPool(
+            self.wake_queue, self.start_stack, workers=self.conf.get('MONITOR_STACK_AWAKE_STARTERS', 4)
+        )
+        self.proxy_stack_index = ProxyStackIndex(
+            self.manager.nginx_manager_api,
+            self.manager.common.nginxmanager_extract_container_name_from_log
+        )
 
     def init(self):
 
-        log_dir = '/logs'
-        pattern = os.path.join(log_dir, "proxy-host-*_access.log")
-
         while True:
 
             UtilsLog.info(f"Arrancado MonitorStackAwake")
+            self.starter_pool.start()
             while self.conf.get('MONITOR_STACK_AWAKE_ENABLED'):
-                stacks = self.manager.portainer_api.get_stacks()
-                log_files = glob.glob(pattern)
-                for log_file in log_files:
-                    if len(self.process_log(log_file, stacks)) > 0:
-                        stacks = self.manager.portainer_api.get_stacks()
-                tiempo = self.conf.get('MONITOR_STACK_AWAKE_TIME_CHECK_LOG_IN_SECONDS')
-                time.sleep(tiempo)
+                # Con inotify vuelve en cuanto se escriben los logs; si no, tras el intervalo de sondeo
+                # Los arranques se encolan y los hace el pool de arranque: la lectura nunca espera a Portainer
+                log_files = self.tailer.wait(self.conf.get('MONITOR_STACK_AWAKE_TIME_CHECK_LOG_IN_SECONDS'))
+                for log_file, lines in log_files.items():
+                    # Solo peticiones de bots/escáneres: no cuentan como actividad
+                    if self.request_filter.enabled and not self.request_filter.accepts_any(lines):
+                        continue
+                    stack_name = self.process_log(log_file)
+                    if stack_name is not None:
+                        self.wake_queue.put(stack_name)
 
             time.sleep(5)
 
-    def process_log(self, log_file, stacks: List[PortainerStack]) -> list[str]:
-
-        stacks_started = []
-
-        if log_file not in self.file_positions:
-            try:
-                self.file_positions[log_file] = os.path.getsize(log_file)
-            except Exception as e:
-                UtilsLog.error(f'MonitorStackSleep (process_log): error abriendo el archivo {log_file} ({e})')
-                self.file_positions[log_file] = 0
-
+    def process_log(self, log_file: str) -> Optional[str]:
+        """
+        El fichero de log ha crecido: registra el acceso a su stack y lo devuelve
+        si puede estar parado para arrancarlo. Solo consulta cachés (índice de
+        proxies e inventario), nunca espera a Portainer ni a Nginx Proxy Manager
+        """
         try:
-            with open(log_file, "r") as f:
-                f.seek(self.file_positions[log_file])
-                for line in f:
+            stack_name = self.proxy_stack_index.get_stack_name_by_log_file(log_file, blocking=False)
+            if stack_name is None:
+                return None
 
-                    stack_names = [s["Name"] for s in stacks if "Name" in s]
-                    stack_name = self.manager.common.nginxmanager_extract_container_name_from_log(line)
+            self.manager.common.register_access_to_stack(stack_name)
 
-                    # Se ha detectado tráfico de un stack: se arranca si no lo está
-                    if stack_name in stack_names and stack_name not in stacks_started:
-                        self.manager.common.last_accesses_to_stacks[stack_name] = datetime.now()
+            # Si stack no está arrancado (Status = 1 es arrancado), se arranca. Si no está en el
+            # inventario también se encola: el pool de arranque lo comprueba contra Portainer
+            stack = self.manager.portainer_api.inventory.find_stack_by_name(stack_name)
+            if stack is None or stack["Status"] != 1:
+                UtilsLog.info(f"MonitorStackSleep (process_log): Detectado tráfico en stack {stack_name}")
+                return stack_name
 
-                        # Si stack no está arrancado (Status = 1 es arrancado), se arranca
-                        stack = next((s for s in stacks if s.get("Name") == stack_name), None)
-                        if stack is not None and stack["Status"] != 1:
-                            UtilsLog.info(f"MonitorStackSleep (process_log): Detectado tráfico en stack {stack_name}")
-                            self.manager.common.portainer_start_stack(stack)
-                            stacks_started.append(stack_name)
-                            UtilsLog.info(f"MonitorStackSleep (process_log): iniciado stack {stack_name}")
-                            time.sleep(1)
-
-                self.file_positions[log_file] = f.tell()
-
-        except FileNotFoundError:
-            UtilsLog.error(f"MonitorStackSleep (process_log): archivo {log_file} no encontrado")
         except Exception as e:
             UtilsLog.error(f"MonitorStackSleep (process_log): {e}")
 
-        return stacks_started
+        return None
+
+    def start_stack(self, stack_name: str):
+        stack = self.manager.portainer_api.get_stack_by_name(stack_name)
+        if stack is None or stack["Status"] == 1:
+            return
 
+        for result in self.manager.stack_lifecycle_executor.start([stack]):
+            if result['Ok']:
+                UtilsLog.info(f"MonitorStackSleep (process_log): iniciado stack {result['Name']} en {result['Duration']:.1f}s")
+            else:
+                UtilsLog.error(f"MonitorStackSleep (process_log): no se ha podido iniciar el stack {result['Name']}")
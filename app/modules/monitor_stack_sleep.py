@@ -1,9 +1,11 @@
 import time
 from datetime import timedelta, datetime
+from typing import List
 
 from manager import Manager
 from modules.helpers.conf import Conf
 from modules.helpers.portainer_api import PortainerStack
+from modules.helpers.sleep_scheduler import SleepScheduler
 from utils.utils_log import UtilsLog
 
 
@@ -12,36 +14,75 @@ class MonitorStackSleep:
     def __init__(self, manager: Manager):
         self.manager = manager
         self.conf = Conf.get_conf()
+        self.scheduler = SleepScheduler()
+        self.manager.common.last_accesses_to_stacks.add_listener(self.on_access_to_stack)
+
+    def get_time_without_activity(self) -> timedelta:
+        return timedelta(minutes=self.conf.get('MONITOR_STACK_SLEEP_TIME_WITHOUT_ACTIVITY_BEFORE_STOP_IN_MINUTES'))
+
+    def on_access_to_stack(self, stack_name: str, last_access: datetime):
+        self.scheduler.schedule(stack_name, (last_access + self.get_time_without_activity()).timestamp())
 
     def init(self):
 
         while True:
             while self.conf.get('MONITOR_STACK_SLEEP_ENABLED'):
 
+                # El listado completo solo se hace cada MONITOR_STACK_SLEEP_TIME_CHECK_STACKS_IN_MINUTES
+                # (stacks arrancados a mano, cambios de configuración); entre medias se duerme hasta el
+                # siguiente vencimiento y se paran exactamente los stacks vencidos
                 UtilsLog.info(f"Arrancado MonitorStackSleep")
-                for stack in self.manager.portainer_api.get_stacks():
-                    self.process_stack(stack)
+                self.schedule_stacks()
 
                 tiempo = self.conf.get('MONITOR_STACK_SLEEP_TIME_CHECK_STACKS_IN_MINUTES')
-                UtilsLog.info(f"Finalizado MonitorStackSleep, esperando {tiempo} minutos")
-                time.sleep(tiempo * 60)
+                resync_at = time.time() + tiempo * 60
+                while self.conf.get('MONITOR_STACK_SLEEP_ENABLED') and time.time() < resync_at:
+                    expired = self.scheduler.wait_expired(min(resync_at - time.time(), 60))
+                    if expired:
+                        self.stop_stacks_by_name(expired)
+
+                UtilsLog.info(f"Finalizado MonitorStackSleep, resincronizando stacks")
 
             time.sleep(5)
 
-    def process_stack(self, stack: PortainerStack):
+    def schedule_stacks(self):
+        """Programa el vencimiento de inactividad de todos los stacks arrancados"""
+        now = datetime.now()
+        for stack in self.manager.portainer_api.get_stacks():
+            if stack['Status'] != 1 or stack['Name'] in self.conf.get('MONITOR_STACK_SLEEP_STACKS_FIXED'):
+                self.scheduler.unschedule(stack['Name'])
+                continue
+
+            # Sin accesos conocidos vence ya, como hasta ahora
+            last_access = self.manager.common.last_accesses_to_stacks.get(stack['Name'], None)
+            deadline = now if last_access is None else last_access + self.get_time_without_activity()
+            self.scheduler.schedule(stack['Name'], deadline.timestamp())
+
+    def stop_stacks_by_name(self, stack_names: List[str]):
+        # Se comprueba de nuevo cada stack por si se ha parado, fijado o accedido mientras tanto
+        stacks = [self.manager.portainer_api.get_stack_by_name(stack_name) for stack_name in stack_names]
+        self.stop_stacks([stack for stack in stacks if stack is not None and self.process_stack(stack)])
+
+    def process_stack(self, stack: PortainerStack) -> bool:
+        """Indica si el stack debe pararse por inactividad"""
         status_active = stack['Status'] == 1
         name_stack = stack["Name"]
         last_access = self.manager.common.last_accesses_to_stacks.get(stack['Name'], None)
         last_active_expired = last_access is None or (
-                datetime.now() - last_access >= timedelta(minutes=self.conf.get('MONITOR_STACK_SLEEP_TIME_WITHOUT_ACTIVITY_BEFORE_STOP_IN_MINUTES'))
+                datetime.now() - last_access >= self.get_time_without_activity()
         )
         not_fixed_stack = name_stack not in self.conf.get('MONITOR_STACK_SLEEP_STACKS_FIXED')
 
         if self.conf.get('DEBUG'):
             UtilsLog.info(f'{name_stack}: {last_access}, fixed: {not not_fixed_stack}')
 
-        if status_active and last_active_expired and not_fixed_stack:
-            self.manager.common.portainer_stop_stack(stack)
+        return status_active and last_active_expired and not_fixed_stack
+
+    def stop_stacks(self, stacks: List[PortainerStack]):
+        for result in self.manager.stack_lifecycle_executor.stop(stacks):
+            if not result['Ok']:
+                UtilsLog.error(f"Stack {result['Name']} no se ha podido parar")
+                continue
+            last_access = self.manager.common.last_accesses_to_stacks.get(result['Name'], None)
             last_access = 'desconocido' if last_access is None else last_access
-            UtilsLog.info(f"Stack {name_stack} parado (último acceso {last_access})")
-            time.sleep(1)
+            UtilsLog.info(f"Stack {result['Name']} parado en {result['Duration']:.1f}s (último acceso {last_access})")
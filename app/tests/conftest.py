@@ -0,0 +1,25 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.helpers.conf import Conf  # noqa: E402
+from modules.helpers.sqlite import Sqlite  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def conf():
+    # Configuración en memoria: solo cuentan las variables de entorno de cada test (monkeypatch.setenv)
+    Conf._instance = None
+    instance = Conf.__new__(Conf)
+    instance.sqlite = Sqlite(':memory:')
+    instance._Conf__initialized = True
+    yield instance
+    Conf._instance = None
+
+
+@pytest.fixture
+def sqlite() -> Sqlite:
+    return Sqlite(':memory:')
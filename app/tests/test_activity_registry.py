@@ -0,0 +1,79 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+from modules.helpers.activity_registry import ActivityRegistry
+
+NOW = datetime(2026, 1, 1, 12, 0, 0)
+
+
+def test_record_keeps_latest_access(sqlite):
+    registry = ActivityRegistry(sqlite, flush_interval=3600)
+
+    registry.record('web', NOW)
+    registry.record('web', NOW - timedelta(minutes=5))
+    registry['db'] = NOW
+
+    assert registry.get('web') == NOW
+    assert registry['db'] == NOW
+    assert registry.get('missing') is None
+    assert 'web' in registry and 'missing' not in registry
+    assert len(registry) == 2
+    assert sorted(registry.items()) == [('db', NOW), ('web', NOW)]
+
+
+def test_listeners_only_get_newer_accesses(sqlite):
+    registry = ActivityRegistry(sqlite, flush_interval=3600)
+    accesses = []
+    registry.add_listener(lambda stack_name, when: accesses.append((stack_name, when)))
+
+    registry.record('web', NOW)
+    registry.record('web', NOW)
+    registry.record('web', NOW + timedelta(seconds=1))
+
+    assert accesses == [('web', NOW), ('web', NOW + timedelta(seconds=1))]
+
+
+def test_persisted_only_on_flush(sqlite):
+    registry = ActivityRegistry(sqlite, flush_interval=3600)
+    registry.record('web', NOW)
+
+    assert ActivityRegistry(sqlite).get('web') is None
+
+    registry.flush()
+    assert ActivityRegistry(sqlite).get('web') == NOW
+
+
+def test_write_behind_batches_changes(sqlite):
+    registry = ActivityRegistry(sqlite, flush_interval=0.1)
+    writes = []
+    executemany = sqlite.executemany
+    sqlite.executemany = lambda query, rows: writes.append(rows) or executemany(query, rows)
+
+    registry.record('web', NOW)
+    registry.record('db', NOW)
+    registry.record('web', NOW + timedelta(seconds=1))
+    time.sleep(0.3)
+
+    assert len(writes) == 1
+    assert sorted(writes[0]) == [('db', NOW.timestamp()), ('web', (NOW + timedelta(seconds=1)).timestamp())]
+    assert ActivityRegistry(sqlite).get('web') == NOW + timedelta(seconds=1)
+
+
+def test_concurrent_records(sqlite):
+    registry = ActivityRegistry(sqlite, flush_interval=3600)
+
+    def record(offset):
+        for i in range(100):
+            registry.record(f'stack-{i % 10}', NOW + timedelta(seconds=offset + i))
+
+    threads = [threading.Thread(target=record, args=(offset,)) for offset in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    registry.flush()
+
+    reloaded = ActivityRegistry(sqlite)
+    assert len(reloaded) == 10
+    assert reloaded.get('stack-9') == NOW + timedelta(seconds=7 + 99)
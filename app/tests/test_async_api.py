@@ -0,0 +1,69 @@
+import copy
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from modules.helpers.async_api import AsyncApi
+
+
+class FakeApi:
+
+    def __init__(self):
+        self.http = SimpleNamespace(pool_size=4)
+        self.endpoint = 'http://localhost'
+        self.threads = set()
+
+    def delete_record(self, domain: str) -> bool:
+        self.threads.add(threading.current_thread().name)
+        time.sleep(0.05)
+        return domain.endswith('.lan')
+
+    def fail(self):
+        raise ValueError('error')
+
+
+@pytest.fixture
+def async_api() -> AsyncApi:
+    return AsyncApi(FakeApi())
+
+
+def test_methods_run_concurrently_in_pool(async_api):
+    started_at = time.monotonic()
+
+    results = AsyncApi.run(async_api.delete_record(f'{i}.lan') for i in range(4))
+
+    assert results == [True] * 4
+    assert time.monotonic() - started_at < 0.15
+    assert all(name.startswith('FakeApi') for name in async_api.api.threads)
+
+
+def test_exceptions_are_returned(async_api):
+    results = AsyncApi.run([async_api.fail(), async_api.delete_record('a.com')])
+
+    assert isinstance(results[0], ValueError)
+    assert results[1] is False
+
+
+def test_limit(async_api):
+    started_at = time.monotonic()
+
+    AsyncApi.run((async_api.delete_record('a.lan') for _ in range(4)), limit=1)
+
+    assert time.monotonic() - started_at >= 0.2
+
+
+@pytest.mark.parametrize('name', ['endpoint', 'missing', '_private'])
+def test_only_public_methods(async_api, name):
+    with pytest.raises(AttributeError):
+        getattr(async_api, name)
+
+
+def test_copy_without_api_does_not_recurse(async_api):
+    instance = AsyncApi.__new__(AsyncApi)
+
+    with pytest.raises(AttributeError):
+        instance.delete_record
+
+    assert copy.copy(async_api).api is async_api.api
@@ -0,0 +1,144 @@
+import base64
+import json
+import threading
+import time
+
+import pytest
+
+from modules.helpers.auto_login import TokenManager, auto_login
+from modules.helpers.http_session import HttpSession
+
+
+def jwt(exp: float) -> str:
+    payload = base64.urlsafe_b64encode(json.dumps({'exp': exp}).encode()).decode().rstrip('=')
+    return f'header.{payload}.signature'
+
+
+class FakeApi:
+
+    def __init__(self, login_delay: float = 0, jwt_ttl: float = None):
+        self.token = None
+        self.logins = 0
+        self.login_delay = login_delay
+        self.jwt_ttl = jwt_ttl
+        self.login_ok = True
+        # Token que el servicio acepta; al cambiarlo se simula que ha invalidado la sesión
+        self.valid_token = None
+        self.calls = []
+        self.call_delay = 0
+        self.token_manager = TokenManager(self, session_ttl=300)
+
+    def login(self) -> bool:
+        time.sleep(self.login_delay)
+        if not self.login_ok:
+            return False
+        self.logins += 1
+        self.token = jwt(time.time() + self.jwt_ttl) if self.jwt_ttl is not None else f'token-{self.logins}'
+        self.valid_token = self.token
+        return True
+
+    @auto_login
+    def get(self) -> str:
+        thread_name = threading.current_thread().name
+        self.calls.append((thread_name, self.token))
+        time.sleep(self.call_delay)
+        if self.token != self.valid_token or thread_name.startswith('rejected'):
+            # Lo que haría HttpSession.request al recibir un 401
+            HttpSession._state.unauthorized = True
+            return 'unauthorized'
+        return 'ok'
+
+
+@pytest.fixture
+def api():
+    api = FakeApi()
+    yield api
+    if api.token_manager._timer is not None:
+        api.token_manager._timer.cancel()
+
+
+def test_get_jwt_expiration():
+    assert TokenManager.get_jwt_expiration(jwt(1234567890)) == 1234567890
+    assert TokenManager.get_jwt_expiration('opaque-token') is None
+    assert TokenManager.get_jwt_expiration('a.not-base64.c') is None
+
+
+def test_login_once_and_reuse(api):
+    assert api.get() == 'ok'
+    assert api.get() == 'ok'
+    assert api.logins == 1
+
+
+def test_expiration_from_jwt_and_refresh_margin(api, monkeypatch):
+    api.jwt_ttl = 3600
+    api.token_manager.ensure()
+    assert api.token_manager.expires_at == pytest.approx(time.time() + 3600, abs=2)
+
+    # Dentro del margen de renovación el token ya no se considera válido
+    api.token_manager.expires_at = time.time() + api.token_manager.refresh_margin - 1
+    assert not api.token_manager.is_valid()
+    api.get()
+    assert api.logins == 2
+
+
+def test_opaque_token_uses_session_ttl(api):
+    api.token_manager.ensure()
+
+    assert api.token_manager.expires_at == pytest.approx(time.time() + 300, abs=2)
+
+
+def test_concurrent_refresh_is_single_flight(api):
+    api.login_delay = 0.1
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(api.get())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == ['ok'] * 8
+    assert api.logins == 1
+
+
+def test_unauthorized_retries_once_with_new_token(api):
+    api.get()
+    # El servicio invalida la sesión
+    api.valid_token = None
+
+    assert api.get() == 'ok'
+    assert api.logins == 2
+    assert [token for _, token in api.calls] == ['token-1', 'token-1', 'token-2']
+
+
+def test_unauthorized_is_retried_only_once(api):
+    thread = threading.Thread(target=api.get, name='rejected')
+    thread.start()
+    thread.join()
+
+    assert len(api.calls) == 2
+    assert api.logins == 2
+
+
+def test_unauthorized_flag_is_per_thread(api):
+    api.token_manager.ensure()
+    api.call_delay = 0.05
+    threads = [threading.Thread(target=api.get, name='rejected')] + [
+        threading.Thread(target=api.get, name=f'ok-{i}') for i in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Solo el hilo que ha recibido el 401 repite la llamada
+    names = [name for name, _ in api.calls]
+    assert names.count('rejected') == 2
+    assert all(names.count(f'ok-{i}') == 1 for i in range(4))
+
+
+def test_failed_login_raises(api):
+    api.login_ok = False
+
+    with pytest.raises(Exception, match='login'):
+        api.get()
+    assert api.calls == []
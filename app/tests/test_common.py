@@ -0,0 +1,60 @@
+from types import SimpleNamespace
+
+import pytest
+
+from modules.helpers.common import Common
+from modules.helpers.compose_resolver import ComposeResolver
+from modules.helpers.conf import Conf
+from modules.helpers.protocol_cache import ProtocolCache
+
+COMPOSE = """
+services:
+  web:
+    image: nginx:latest
+    ports:
+      - "10.0.2.1:10080:80"
+      - "10081:81"
+      - "0.0.0.0:10082:82"
+"""
+
+
+class FakePortainerApi:
+
+    def __init__(self):
+        self.started = []
+
+    def get_stack_file(self, stack_id):
+        return COMPOSE
+
+    def get_images(self):
+        return [{'Id': 'sha256:nginx', 'RepoTags': ['nginx:latest']}]
+
+    def start_stack_by_stack_id(self, stack_id):
+        self.started.append(stack_id)
+
+
+@pytest.fixture
+def common(monkeypatch, sqlite) -> Common:
+    monkeypatch.setenv('PORT_INIT_HTTP_OR_HTTPS', '10000')
+    monkeypatch.setenv('PORT_END_HTTP_OR_HTTPS', '20000')
+    portainer_api = FakePortainerApi()
+    instance = Common.__new__(Common)
+    instance.manager = SimpleNamespace(portainer_api=portainer_api)
+    instance.conf = Conf.get_conf()
+    instance.compose_resolver = ComposeResolver(portainer_api)
+    instance.protocol_cache = ProtocolCache(sqlite)
+    return instance
+
+
+def test_static_web_ports_skip_ports_published_on_all_interfaces(common):
+    # Protocolos conocidos de la imagen para los tres puertos internos
+    for private_port in (80, 81, 82):
+        common.protocol_cache.set('sha256:nginx', private_port, 'http')
+    stack = {'Id': 1, 'Name': 'Web', 'Env': [], 'ResourceControlId': 7}
+
+    web_ports = common.get_stack_web_ports(stack, is_stopped=True)
+
+    assert [(port['IP'], port['PublicPort'], protocol) for _, port, protocol in web_ports] == [
+        ('10.0.2.1', 10080, 'http')
+    ]
+    assert common.manager.portainer_api.started == []
@@ -0,0 +1,122 @@
+import pytest
+
+from modules.helpers.compose_resolver import ComposeResolver, ComposeUnresolvable
+
+ENV = {'PORT': '9000', 'HOST': '10.0.2.1', 'EMPTY': ''}
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('${PORT}', '9000'),
+    ('$PORT:80', '9000:80'),
+    ('${MISSING:-8081}', '8081'),
+    ('${EMPTY:-7000}', '7000'),
+    ('${EMPTY-7000}', ''),
+    ('${PORT:+set}', 'set'),
+    ('${MISSING:+set}', ''),
+    ('${MISSING:-${PORT}}', '9000'),
+    ('a$$b', 'a$b'),
+    (80, 80),
+    (None, None),
+])
+def test_interpolate(value, expected):
+    assert ComposeResolver.interpolate(value, ENV) == expected
+
+
+@pytest.mark.parametrize('value', ['${MISSING}', '$MISSING', '${EMPTY:?error}', '${MISSING?error}'])
+def test_interpolate_unresolvable(value):
+    with pytest.raises(ComposeUnresolvable):
+        ComposeResolver.interpolate(value, ENV)
+
+
+def ports(entry):
+    return [(p['IP'], p['PublicPort'], p['PrivatePort'], p['Type']) for p in ComposeResolver.parse_ports(entry, ENV)]
+
+
+@pytest.mark.parametrize('entry, expected', [
+    ('10.0.2.1:10092:80', [('10.0.2.1', 10092, 80, 'tcp')]),
+    ('8080:80/udp', [('0.0.0.0', 8080, 80, 'udp')]),
+    ('8000-8001:80-81', [('0.0.0.0', 8000, 80, 'tcp'), ('0.0.0.0', 8001, 81, 'tcp')]),
+    ('[::1]:8080:80', [('::1', 8080, 80, 'tcp')]),
+    ('${HOST}:${PORT}:80', [('10.0.2.1', 9000, 80, 'tcp')]),
+    ({'target': 80, 'published': '8082', 'host_ip': '10.0.0.1'}, [('10.0.0.1', 8082, 80, 'tcp')]),
+    ({'target': 53, 'published': '${PORT}', 'protocol': 'udp'}, [('0.0.0.0', 9000, 53, 'udp')]),
+])
+def test_parse_ports(entry, expected):
+    assert ports(entry) == expected
+
+
+@pytest.mark.parametrize('entry', ['80', 80, '127.0.0.1::80', {'target': 80}, '8000-8002:80-81', '${MISSING}:80'])
+def test_parse_ports_unresolvable(entry):
+    with pytest.raises(ComposeUnresolvable):
+        ComposeResolver.parse_ports(entry, ENV)
+
+
+@pytest.mark.parametrize('entry', ['a:b:c:d', 'web:80'])
+def test_parse_ports_invalid(entry):
+    with pytest.raises(ValueError):
+        ComposeResolver.parse_ports(entry, ENV)
+
+
+@pytest.mark.parametrize('image, expected', [
+    ('nginx', 'nginx:latest'),
+    ('docker.io/library/nginx:1.2', 'nginx:1.2'),
+    ('ghcr.io/owner/app', 'ghcr.io/owner/app:latest'),
+    ('localhost:5000/app', 'localhost:5000/app:latest'),
+])
+def test_normalize_image(image, expected):
+    assert ComposeResolver._normalize_image(image) == expected
+
+
+class FakePortainerApi:
+    def __init__(self, content, images):
+        self.content = content
+        self.images = images
+
+    def get_stack_file(self, stack_id):
+        return self.content
+
+    def get_images(self):
+        return self.images
+
+
+STACK = {'Id': 1, 'Name': 'web1', 'ResourceControlId': 3, 'Env': [{'name': 'PORT', 'value': '10093'}], 'Containers': []}
+IMAGES = [{'Id': 'sha256:nginx', 'RepoTags': ['nginx:latest']}, {'Id': 'sha256:built', 'RepoTags': ['web1-api:latest']}]
+
+
+def test_resolve():
+    content = """
+services:
+  front:
+    image: nginx
+    container_name: web1-1
+    ports:
+      - 10.0.2.1:${PORT}:80
+  api:
+    build: .
+  debug:
+    image: busybox
+    profiles: [debug]
+"""
+    stack = ComposeResolver(FakePortainerApi(content, IMAGES)).resolve(STACK)
+    front, api = stack['Containers']
+    assert front['Names'] == ['/web1-1']
+    assert front['ImageID'] == 'sha256:nginx'
+    assert [(p['IP'], p['PublicPort'], p['PrivatePort']) for p in front['Ports']] == [('10.0.2.1', 10093, 80)]
+    assert api['Names'] == ['/web1-api-1']
+    assert api['ImageID'] == 'sha256:built'
+    assert STACK['Containers'] == []
+
+
+@pytest.mark.parametrize('content', [
+    'services:\n  a:\n    image: redis\n',
+    'services:\n  a:\n    image: nginx\n    deploy:\n      replicas: 2\n',
+    'services:\n  a:\n    image: nginx\n    ports: ["80"]\n',
+    'services:\n  a:\n    extends: {file: base.yml, service: a}\n',
+    'services: [',
+])
+def test_resolve_unresolvable(content):
+    assert ComposeResolver(FakePortainerApi(content, IMAGES)).resolve(STACK) is None
+
+
+def test_resolve_without_stack_file():
+    assert ComposeResolver(FakePortainerApi(None, IMAGES)).resolve(STACK) is None
@@ -0,0 +1,170 @@
+import os
+
+import pytest
+
+from modules.helpers.log_offset_store import LogOffsetStore
+from modules.helpers.log_tailer import LogTailer
+
+PATTERN = 'proxy-host-*_access.log'
+
+
+@pytest.fixture(params=['inotify', 'polling'])
+def mode(request, monkeypatch):
+    if request.param == 'polling':
+        monkeypatch.setattr(LogTailer, '_open_inotify', staticmethod(lambda directory: None))
+    return request.param
+
+
+def write(path, text: str, mode: str = 'a'):
+    with open(path, mode) as f:
+        f.write(text)
+
+
+def tailer_for(tmp_path, store=None, read_lines=True) -> LogTailer:
+    tailer = LogTailer(str(tmp_path), PATTERN, read_lines=read_lines, offset_store=store)
+    tailer.wait(0)
+    return tailer
+
+
+def wait(tailer: LogTailer) -> dict:
+    # Con inotify vuelve en cuanto hay eventos; sondeando, tras el intervalo
+    return {os.path.basename(path): lines for path, lines in tailer.wait(0.05).items() if lines is not None}
+
+
+def test_only_new_lines_from_existing_files(tmp_path, mode):
+    log = tmp_path / 'proxy-host-1_access.log'
+    write(log, 'old\n')
+    write(tmp_path / 'other.log', 'ignored\n')
+    tailer = tailer_for(tmp_path)
+
+    write(log, 'new 1\nnew 2\n')
+
+    assert wait(tailer) == {'proxy-host-1_access.log': ['new 1', 'new 2']}
+    assert wait(tailer) == {}
+    tailer.close()
+
+
+def test_partial_line_is_kept_for_next_read(tmp_path, mode):
+    log = tmp_path / 'proxy-host-1_access.log'
+    write(log, '')
+    tailer = tailer_for(tmp_path)
+
+    write(log, 'first\nsec')
+    assert wait(tailer) == {'proxy-host-1_access.log': ['first']}
+    write(log, 'ond\n')
+    assert wait(tailer) == {'proxy-host-1_access.log': ['second']}
+    tailer.close()
+
+
+def test_new_file_is_read_from_start(tmp_path, mode):
+    tailer = tailer_for(tmp_path)
+
+    write(tmp_path / 'proxy-host-2_access.log', 'a\nb\n')
+
+    assert wait(tailer) == {'proxy-host-2_access.log': ['a', 'b']}
+    tailer.close()
+
+
+def test_truncation(tmp_path, mode):
+    log = tmp_path / 'proxy-host-1_access.log'
+    write(log, 'old line that is long\n')
+    tailer = tailer_for(tmp_path)
+
+    # copytruncate: mismo inodo, tamaño menor que la posición
+    write(log, 'short\n', mode='w')
+
+    assert wait(tailer) == {'proxy-host-1_access.log': ['short']}
+    tailer.close()
+
+
+def test_rotation_reads_tail_of_old_file_and_new_from_start(tmp_path, mode):
+    log = tmp_path / 'proxy-host-1_access.log'
+    write(log, '')
+    tailer = tailer_for(tmp_path)
+
+    write(log, 'before rotation\n')
+    os.rename(log, tmp_path / 'proxy-host-1_access.log.1')
+    write(log, 'after rotation\n')
+
+    lines = {}
+    for _ in range(3):
+        for name, new_lines in wait(tailer).items():
+            lines.setdefault(name, []).extend(new_lines)
+    assert lines == {'proxy-host-1_access.log': ['before rotation', 'after rotation']}
+    tailer.close()
+
+
+def test_read_lines_false_only_reports_grown_files(tmp_path, mode):
+    log = tmp_path / 'proxy-host-1_access.log'
+    write(log, '')
+    tailer = tailer_for(tmp_path, read_lines=False)
+
+    write(log, 'a\nb\n')
+
+    assert wait(tailer) == {'proxy-host-1_access.log': []}
+    assert wait(tailer) == {}
+    tailer.close()
+
+
+def test_restart_continues_from_saved_position(tmp_path, sqlite):
+    log = tmp_path / 'proxy-host-1_access.log'
+    write(log, 'old\n')
+    tailer = tailer_for(tmp_path, LogOffsetStore(sqlite, flush_interval=3600))
+    write(log, 'read\n')
+    wait(tailer)
+    tailer.close()
+
+    write(log, 'while stopped\n')
+    tailer = LogTailer(str(tmp_path), PATTERN, offset_store=LogOffsetStore(sqlite))
+
+    assert {os.path.basename(p): lines for p, lines in tailer.wait(0).items()} == {
+        'proxy-host-1_access.log': ['while stopped']
+    }
+    tailer.close()
+
+
+def test_truncated_while_stopped_is_read_from_start(tmp_path, sqlite):
+    log = tmp_path / 'proxy-host-1_access.log'
+    write(log, 'a long line before stopping\n')
+    tailer_for(tmp_path, LogOffsetStore(sqlite)).close()
+
+    write(log, 'new\n', mode='w')
+    tailer = LogTailer(str(tmp_path), PATTERN, offset_store=LogOffsetStore(sqlite))
+
+    assert {os.path.basename(p): lines for p, lines in tailer.wait(0).items()} == {
+        'proxy-host-1_access.log': ['new']
+    }
+    tailer.close()
+
+
+def test_replaced_while_stopped_is_not_confused_with_old_file(tmp_path, sqlite):
+    log = tmp_path / 'proxy-host-1_access.log'
+    write(log, 'x' * 100 + '\n')
+    tailer_for(tmp_path, LogOffsetStore(sqlite)).close()
+
+    # Otro inodo con el mismo nombre (se crea antes de sustituir para que no reutilice el inodo):
+    # la posición guardada no se le aplica
+    write(tmp_path / 'new.log', 'y' * 200 + '\n')
+    os.replace(tmp_path / 'new.log', log)
+    tailer = LogTailer(str(tmp_path), PATTERN, offset_store=LogOffsetStore(sqlite))
+    tailer.wait(0)
+    write(log, 'next\n')
+
+    assert wait(tailer) == {'proxy-host-1_access.log': ['next']}
+    tailer.close()
+
+
+def test_offset_store_write_behind(sqlite):
+    store = LogOffsetStore(sqlite, flush_interval=3600)
+    store.set((1, 2), '/logs/a.log', 10)
+
+    store.flush()
+    assert LogOffsetStore(sqlite).get((1, 2)) is None
+
+    store.flush(force=True)
+    assert LogOffsetStore(sqlite).get((1, 2)) == 10
+
+    store.forget((1, 2))
+    assert store.get((1, 2)) is None
+    store.flush(force=True)
+    assert LogOffsetStore(sqlite).get((1, 2)) is None
@@ -0,0 +1,150 @@
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from modules.helpers.compose_resolver import ComposeResolver
+from modules.helpers.conf import Conf
+from modules.monitor_clear import MonitorClear
+
+GB = 1024 ** 3
+
+COMPOSE_BUILD = """
+services:
+  app:
+    build: .
+  named:
+    build: ./named
+    image: custom/named:1.0
+  db:
+    image: postgres:16
+"""
+
+
+def image(image_id, repo_tag, created, repo_digests=True):
+    return {
+        'Id': image_id,
+        'RepoTags': [repo_tag],
+        'RepoDigests': [f'{repo_tag.split(":")[0]}@sha256:{image_id}'] if repo_digests else [],
+        'Created': created,
+        'Size': GB,
+        'SharedSize': 0,
+        'Containers': 0,
+    }
+
+
+class FakePortainerApi:
+
+    def __init__(self, images, stack_files):
+        self.images = images
+        self.stack_files = stack_files
+        self.deleted = []
+
+    def get_system_df(self):
+        return {'LayersSize': len(self.images) * GB, 'Images': self.images, 'Containers': []}
+
+    def get_stacks_with_containers(self):
+        return []
+
+    def get_stacks(self):
+        return [{'Id': stack_id, 'Name': name, 'Env': []} for stack_id, (name, _) in self.stack_files.items()]
+
+    def get_stack_file(self, stack_id):
+        return self.stack_files[stack_id][1]
+
+    def delete_image_by_id(self, image_id, force=False):
+        assert not force
+        self.deleted.append(image_id)
+        return True
+
+
+class FakeCommon:
+
+    def __init__(self, portainer_api, last_use_of_images=None, images_of_stacks=None, last_accesses=None):
+        self.compose_resolver = ComposeResolver(portainer_api)
+        self.last_use_of_images = last_use_of_images or {}
+        self.images_of_stacks = images_of_stacks or {}
+        self.last_accesses_to_stacks = last_accesses or {}
+        self.usage_snapshots = 0
+
+    def get_images_usage(self):
+        self.usage_snapshots += 1
+        return dict(self.last_use_of_images), dict(self.images_of_stacks)
+
+    def register_images_of_stack(self, stack):
+        pass
+
+
+def monitor(portainer_api, common) -> MonitorClear:
+    monitor_clear = MonitorClear.__new__(MonitorClear)
+    monitor_clear.manager = SimpleNamespace(portainer_api=portainer_api, common=common)
+    monitor_clear.conf = Conf.get_conf()
+    return monitor_clear
+
+
+@pytest.fixture(autouse=True)
+def budget(monkeypatch):
+    monkeypatch.setenv('MONITOR_CLEAR_DISK_BUDGET_IN_GB', '1')
+
+
+def setup(images, stack_files=None, **kwargs):
+    portainer_api = FakePortainerApi(images, stack_files or {})
+    common = FakeCommon(portainer_api, **kwargs)
+    return portainer_api, common, monitor(portainer_api, common)
+
+
+def test_evicts_least_recently_used_until_budget():
+    images = [image('a', 'a:1', 100), image('b', 'b:1', 300), image('c', 'c:1', 200)]
+    portainer_api, _, monitor_clear = setup(images)
+
+    assert monitor_clear.evict_images() == 2 * GB
+    assert portainer_api.deleted == ['a', 'c']
+
+
+def test_last_use_from_stack_access_and_single_snapshot():
+    images = [image('a', 'a:1', 100), image('b', 'b:1', 300), image('c', 'c:1', 200)]
+    portainer_api, common, monitor_clear = setup(
+        images,
+        images_of_stacks={'web': {'a'}},
+        last_accesses={'web': datetime.now()},
+        last_use_of_images={'c': datetime.fromtimestamp(50)},
+    )
+
+    monitor_clear.evict_images()
+
+    assert portainer_api.deleted == ['c', 'b']
+    # Una para get_built_images y otra para el último uso, no una por imagen
+    assert common.usage_snapshots == 2
+
+
+def test_keeps_images_without_repo_digests_and_built_by_stacks():
+    images = [
+        image('built', 'shop-app:latest', 100),
+        image('named', 'custom/named:1.0', 100),
+        image('local', 'local:1', 100, repo_digests=False),
+        image('postgres', 'postgres:16', 200),
+        image('other', 'other:1', 300),
+    ]
+    portainer_api, _, monitor_clear = setup(images, stack_files={1: ('Shop', COMPOSE_BUILD)})
+
+    monitor_clear.evict_images()
+
+    assert portainer_api.deleted == ['postgres', 'other']
+
+
+def test_keeps_known_images_of_stacks_with_unreadable_compose():
+    images = [image('a', 'a:1', 100), image('b', 'b:1', 200)]
+    portainer_api, _, monitor_clear = setup(
+        images, stack_files={1: ('Broken', 'services: [')}, images_of_stacks={'Broken': {'a'}}
+    )
+
+    monitor_clear.evict_images()
+
+    assert portainer_api.deleted == ['b']
+
+
+def test_dry_run_deletes_nothing():
+    portainer_api, _, monitor_clear = setup([image('a', 'a:1', 100), image('b', 'b:1', 200)])
+
+    assert monitor_clear.evict_images(dry_run=True) == GB
+    assert portainer_api.deleted == []
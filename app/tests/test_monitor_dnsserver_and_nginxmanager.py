@@ -0,0 +1,94 @@
+from types import SimpleNamespace
+
+import pytest
+
+from modules.helpers.sleep_scheduler import SleepScheduler
+from modules.monitor_dnsserver_and_nginxmanager import MonitorDnsserverAndNginxManager
+
+
+class FakeInventory:
+
+    def __init__(self, stack_names, loaded=True):
+        self.stack_names = set(stack_names)
+        self.loaded = loaded
+
+    def find_stack_by_name(self, stack_name):
+        return {'Name': stack_name} if stack_name in self.stack_names else None
+
+    def is_loaded(self):
+        return self.loaded
+
+
+class FakePortainerApi:
+
+    def __init__(self, inventory, stacks):
+        self.inventory = inventory
+        self.stacks = stacks
+        self.stack_fetches = []
+
+    def get_stack_with_containers(self, stack_name, use_cache=True):
+        self.stack_fetches.append((stack_name, use_cache))
+        return self.stacks.get(stack_name)
+
+    def get_stacks_with_containers(self, use_cache=True):
+        raise AssertionError('un stack concreto no debe pedir todos los stacks')
+
+
+def monitor(portainer_api) -> MonitorDnsserverAndNginxManager:
+    monitor_dns = MonitorDnsserverAndNginxManager.__new__(MonitorDnsserverAndNginxManager)
+    monitor_dns.manager = SimpleNamespace(portainer_api=portainer_api)
+    monitor_dns.conf = SimpleNamespace(get=lambda key, default=None: default)
+    monitor_dns.pending_stacks = SleepScheduler()
+    return monitor_dns
+
+
+def event(action, stack_name):
+    return {
+        'Type': 'container',
+        'Action': action,
+        'Actor': {'ID': 'c1', 'Attributes': {'com.docker.compose.project': stack_name}},
+    }
+
+
+@pytest.mark.parametrize('action, stack_name, expected', [
+    # Dormir/despertar un stack conocido no cambia sus dominios
+    ('create', 'known', False),
+    ('destroy', 'known', False),
+    ('rename', 'known', True),
+    ('create', 'new', True),
+    ('destroy', 'new', True),
+    ('start', 'new', False),
+])
+def test_on_docker_event(action, stack_name, expected):
+    monitor_dns = monitor(FakePortainerApi(FakeInventory({'known'}), {}))
+
+    monitor_dns.on_docker_event(event(action, stack_name))
+
+    assert (monitor_dns.pending_stacks.get_deadline(stack_name) is not None) == expected
+
+
+def test_check_stack_fetches_stack_once_for_both_checks():
+    stack = {'Name': 'web', 'Containers': []}
+    portainer_api = FakePortainerApi(FakeInventory({'web'}), {'web': stack})
+    monitor_dns = monitor(portainer_api)
+    checks = []
+    monitor_dns.check_portainer_and_dnsserver = lambda *args: checks.append(('dns', args))
+    monitor_dns.check_portainer_and_nginx_manager = lambda *args: checks.append(('nginx', args))
+
+    monitor_dns.check_stack('web')
+
+    assert portainer_api.stack_fetches == [('web', False)]
+    assert checks == [('dns', ('web', [stack])), ('nginx', ('web', [stack]))]
+
+
+@pytest.mark.parametrize('known, loaded, expected', [
+    (False, True, []),
+    # Sigue en el inventario o no se ha podido pedir nunca: no se da por eliminado
+    (True, True, None),
+    (False, False, None),
+])
+def test_get_stack_missing(known, loaded, expected):
+    inventory = FakeInventory({'web'} if known else set(), loaded=loaded)
+    monitor_dns = monitor(FakePortainerApi(inventory, {}))
+
+    assert monitor_dns.get_stack('web') == expected
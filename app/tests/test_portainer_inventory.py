@@ -0,0 +1,205 @@
+import threading
+import time
+
+import pytest
+
+from modules.helpers.portainer_events import PortainerEvents
+from modules.helpers.portainer_inventory import PortainerInventory
+
+
+def stack(stack_id, name, status=1):
+    return {'Id': stack_id, 'Name': name, 'Status': status, 'ResourceControlId': stack_id * 10, 'EndpointId': 1}
+
+
+def container(container_id, name, resource_control_id, state='running', health=None):
+    return {
+        'Id': container_id,
+        'Names': [f'/{name}'],
+        'ResourceControlId': resource_control_id,
+        'State': state,
+        'Health': health,
+        'ExitCode': None,
+        'ImageID': 'sha256:image',
+        'Image': 'image:latest',
+        'Ports': [],
+        'Mounts': [],
+    }
+
+
+class FakePortainerApi:
+
+    def __init__(self):
+        self.stacks = [stack(1, 'web'), stack(2, 'db', status=2)]
+        self.containers = [container('c1', 'web-app-1', 10)]
+        self.full_fetches = 0
+        self.container_fetches = []
+        self.fail = False
+        self.inventory = PortainerInventory(self, ttl=60)
+
+    def _fetch_stacks(self):
+        self.full_fetches += 1
+        return None if self.fail else [dict(s) for s in self.stacks]
+
+    def _fetch_containers(self, filters=None):
+        return None if self.fail else [dict(c) for c in self.containers]
+
+    def get_container_by_id(self, container_id):
+        self.container_fetches.append(container_id)
+        return next((dict(c) for c in self.containers if c['Id'] == container_id), None)
+
+
+@pytest.fixture
+def portainer_api() -> FakePortainerApi:
+    return FakePortainerApi()
+
+
+def event(action, container_id, **attributes):
+    return {'Type': 'container', 'Action': action, 'Actor': {'ID': container_id, 'Attributes': attributes}}
+
+
+def test_snapshot_is_cached_until_ttl(portainer_api):
+    inventory = portainer_api.inventory
+
+    assert [s['Name'] for s in inventory.get_stacks()] == ['web', 'db']
+    inventory.get_stack_by_name('web')
+    inventory.get_stacks_with_containers()
+    assert portainer_api.full_fetches == 1
+
+    inventory.get_stacks(use_cache=False)
+    assert portainer_api.full_fetches == 2
+
+    inventory.ttl = 0
+    inventory.get_stacks()
+    assert portainer_api.full_fetches == 3
+
+
+def test_readers_get_copies(portainer_api):
+    inventory = portainer_api.inventory
+
+    inventory.get_stacks()[0]['Name'] = 'changed'
+
+    assert inventory.get_stack_by_name('web') is not None
+
+
+def test_invalidate_forces_full_fetch_only_without_events(portainer_api):
+    inventory = portainer_api.inventory
+    inventory.get_stacks()
+
+    inventory.set_live(True)
+    inventory.invalidate()
+    inventory.get_stacks()
+    assert portainer_api.full_fetches == 1
+
+    inventory.set_live(False)
+    inventory.invalidate()
+    inventory.get_stacks()
+    assert portainer_api.full_fetches == 2
+
+
+def test_live_uses_resync_interval_as_ttl(portainer_api):
+    inventory = portainer_api.inventory
+    inventory.ttl, inventory.ttl_live = 0, 600
+    inventory.get_stacks()
+
+    inventory.set_live(True)
+    inventory.get_stacks()
+    assert portainer_api.full_fetches == 1
+
+    inventory.set_live(False)
+    inventory.get_stacks()
+    assert portainer_api.full_fetches == 2
+
+
+def test_failed_fetch_is_not_cached(portainer_api):
+    inventory = portainer_api.inventory
+    portainer_api.fail = True
+
+    assert inventory.get_stacks() == []
+    assert not inventory.is_loaded()
+
+    portainer_api.fail = False
+    assert len(inventory.get_stacks()) == 2
+
+
+def test_events_update_snapshot_without_refetch(portainer_api):
+    inventory = portainer_api.inventory
+    inventory.set_live(True)
+    inventory.get_stacks()
+    events = PortainerEvents(portainer_api)
+
+    events.process_event(event('die', 'c1', exitCode='0'))
+    web = inventory.get_stack_with_containers('web')
+    assert web['Containers'][0]['State'] == 'exited'
+    assert web['Containers'][0]['ExitCode'] == 0
+
+    events.process_event(event('destroy', 'c1'))
+    assert inventory.get_stack_by_name('web')['Status'] == 2
+
+    # Contenedor nuevo de un stack conocido (compose up): solo se pide ese contenedor
+    portainer_api.containers = [container('c2', 'web-app-1', 10, state='created')]
+    events.process_event(event('create', 'c2'))
+    events.process_event(event('start', 'c2'))
+    web = inventory.get_stack_with_containers('web')
+    assert [(c['Id'], c['State']) for c in web['Containers']] == [('c2', 'running')]
+    assert web['Status'] == 1
+
+    events.process_event(event('health_status: healthy', 'c2'))
+    assert inventory.find_container('c2')['Health'] == 'healthy'
+
+    assert portainer_api.full_fetches == 1
+    assert portainer_api.container_fetches == ['c2']
+
+
+def test_container_of_unknown_stack_forces_full_fetch(portainer_api):
+    inventory = portainer_api.inventory
+    inventory.set_live(True)
+    inventory.get_stacks()
+
+    portainer_api.stacks.append(stack(3, 'new'))
+    portainer_api.containers.append(container('c3', 'new-app-1', 30))
+    PortainerEvents(portainer_api).process_event(event('create', 'c3'))
+
+    assert inventory.get_stack_by_name('new') is not None
+    assert portainer_api.full_fetches == 2
+
+
+def test_stacks_listener_gets_added_and_removed_stacks(portainer_api):
+    inventory = portainer_api.inventory
+    changes = []
+    inventory.add_stacks_listener(changes.append)
+    inventory.get_stacks()
+
+    portainer_api.stacks = [stack(1, 'web'), stack(3, 'new')]
+    inventory.refresh()
+
+    assert changes == [{'db', 'new'}]
+
+
+def test_wait_stack_ready_wakes_on_events(portainer_api, monkeypatch):
+    monkeypatch.setenv('PORTAINER_WAIT_START_STACK_POLL_IN_SECONDS', '5')
+    inventory = portainer_api.inventory
+    inventory.set_live(True)
+    inventory.get_stacks()
+    portainer_api.containers = [container('c1', 'web-app-1', 10, health='starting')]
+    inventory.update_container_health('c1', 'starting')
+
+    started_at = time.monotonic()
+    threading.Timer(0.1, inventory.update_container_health, ('c1', 'healthy')).start()
+
+    assert inventory.wait_stack_ready(stack(1, 'web'), timeout=2)
+    assert time.monotonic() - started_at < 1
+
+
+@pytest.mark.parametrize('state, health, exit_code, expected', [
+    ('running', None, None, True),
+    ('running', 'starting', None, False),
+    ('running', 'healthy', None, True),
+    ('exited', None, 0, True),
+    ('exited', None, 1, False),
+    ('created', None, None, False),
+])
+def test_is_container_ready(state, health, exit_code, expected):
+    c = container('c1', 'web-app-1', 10, state=state, health=health)
+    c['ExitCode'] = exit_code
+
+    assert PortainerInventory.is_container_ready(c) == expected
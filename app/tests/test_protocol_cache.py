@@ -0,0 +1,60 @@
+from modules.helpers.protocol_cache import ProtocolCache
+from utils.utils_network import UtilsNetwork
+
+
+def container(image_id='sha256:a'):
+    return {'ImageID': image_id}
+
+
+def port(private_port, public_port=None):
+    return {'IP': '10.0.2.1', 'PrivatePort': private_port, 'PublicPort': public_port or private_port + 10000}
+
+
+def test_web_protocols_do_not_expire(sqlite, monkeypatch):
+    monkeypatch.setenv('PROTOCOL_CACHE_NON_WEB_TTL_IN_SECONDS', '0')
+    cache = ProtocolCache(sqlite)
+    cache.set('sha256:a', 80, 'https')
+    assert cache.get('sha256:a', 80) == 'https'
+
+
+def test_non_web_protocols_expire(sqlite, monkeypatch):
+    monkeypatch.setenv('PROTOCOL_CACHE_NON_WEB_TTL_IN_SECONDS', '0')
+    cache = ProtocolCache(sqlite)
+    cache.set('sha256:a', 5432, 'tcp')
+    assert cache.get('sha256:a', 5432) is None
+
+    monkeypatch.setenv('PROTOCOL_CACHE_NON_WEB_TTL_IN_SECONDS', '3600')
+    cache = ProtocolCache(sqlite)
+    assert cache.get('sha256:a', 5432) == 'tcp'
+
+
+def test_none_is_not_cached(sqlite):
+    cache = ProtocolCache(sqlite)
+    cache.set('sha256:a', 80, 'none')
+    assert cache.get('sha256:a', 80) is None
+
+
+def test_persisted_between_instances(sqlite):
+    ProtocolCache(sqlite).set('sha256:a', 80, 'http')
+    assert ProtocolCache(sqlite).get('sha256:a', 80) == 'http'
+
+
+def test_get_protocols_sniffs_only_misses_in_one_batch(sqlite, monkeypatch):
+    calls = []
+
+    def check_protocols(targets, deadline=10, timeout=2):
+        calls.append(list(targets))
+        return {target: 'http' for target in targets}
+
+    monkeypatch.setattr(UtilsNetwork, 'check_protocols', staticmethod(check_protocols))
+    cache = ProtocolCache(sqlite)
+    cache.set('sha256:a', 443, 'https')
+
+    container_ports = [(container(), port(80)), (container(), port(443)), (container('sha256:b'), port(80, 10081))]
+    assert cache.get_protocols(container_ports) == ['http', 'https', 'http']
+    assert calls == [[('10.0.2.1', 10080), ('10.0.2.1', 10081)]]
+    assert cache.get('sha256:b', 80) == 'http'
+
+    # Ya está todo en la caché: no se vuelve a sondear
+    assert cache.get_protocols(container_ports) == ['http', 'https', 'http']
+    assert len(calls) == 1
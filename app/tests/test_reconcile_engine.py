@@ -0,0 +1,64 @@
+from benchmarks.bench_reconcile import build_data, naive_plan
+from modules.helpers.reconcile_engine import PrefixIndex, ReconcileEngine, SortedIndex
+
+STACKS = [{'Name': 'app-1'}, {'Name': 'app-12'}, {'Name': 'web-3'}]
+ITEMS = [{'domain': 'app-1-x-80.d'}, {'domain': 'app-12-x-80.d'}, {'domain': 'gone-4-x-80.d'}, {'domain': 'fixed.d'}]
+SERVERS_FIXED = [{'domain': 'fixed.d'}, {'domain': 'other.d'}]
+
+
+def test_prefix_index():
+    index = PrefixIndex(['app', 'web-3'])
+    assert index.matches('app-1-x.d')
+    assert index.matches('web-3')
+    assert not index.matches('ap')
+    assert not index.matches('db-1')
+
+
+def test_sorted_index():
+    index = SortedIndex(['b-1', 'a-2', 'c-3'])
+    assert index.has_prefix('a')
+    assert index.has_prefix('c-3')
+    assert not index.has_prefix('d')
+    assert not index.has_prefix('c-33')
+
+
+def test_plan():
+    plan = ReconcileEngine.plan(STACKS, ITEMS, SERVERS_FIXED)
+    assert [stack['Name'] for stack in plan['stacks_to_add']] == ['web-3']
+    assert plan['items_to_delete'] == [{'domain': 'gone-4-x-80.d'}]
+    assert plan['servers_fixed_to_add'] == [{'domain': 'other.d'}]
+
+
+def test_plan_keeps_prefixes_of_fixed_servers():
+    plan = ReconcileEngine.plan([], [{'domain': 'fixed'}], [{'domain': 'fixed.d'}])
+    assert plan['items_to_delete'] == []
+
+
+def test_plan_matches_naive_plan():
+    stacks, items, servers_fixed = build_data(50, 3, 40)
+    assert ReconcileEngine.plan(stacks, items, servers_fixed) == naive_plan(stacks, items, servers_fixed)
+
+
+def test_plan_stack_existing_with_domains():
+    plan = ReconcileEngine.plan_stack('app-1', STACKS, ITEMS, SERVERS_FIXED)
+    assert plan == {'stacks_to_add': [], 'items_to_delete': [], 'servers_fixed_to_add': []}
+
+
+def test_plan_stack_without_domains():
+    plan = ReconcileEngine.plan_stack('web-3', STACKS, ITEMS, SERVERS_FIXED)
+    assert [stack['Name'] for stack in plan['stacks_to_add']] == ['web-3']
+    assert plan['items_to_delete'] == []
+
+
+def test_plan_stack_removed():
+    plan = ReconcileEngine.plan_stack('gone-4', STACKS, ITEMS, SERVERS_FIXED)
+    assert plan['stacks_to_add'] == []
+    assert plan['items_to_delete'] == [{'domain': 'gone-4-x-80.d'}]
+    assert plan['servers_fixed_to_add'] == []
+
+
+def test_plan_stack_keeps_domains_of_other_stacks():
+    # 'app-12-...' empieza por 'app-1', pero pertenece a un stack que sigue existiendo
+    stacks = [{'Name': 'app-12'}]
+    plan = ReconcileEngine.plan_stack('app-1', stacks, ITEMS, SERVERS_FIXED)
+    assert plan['items_to_delete'] == [{'domain': 'app-1-x-80.d'}]
@@ -0,0 +1,47 @@
+from modules.helpers.request_filter import RequestFilter
+
+
+def log_line(status=200, path='/index.html', user_agent='Mozilla/5.0'):
+    return (f'[18/Oct/2026:10:00:00 +0000] - {status} {status} - GET https app-1-local-10092.example.com "{path}" '
+            f'[Client 1.2.3.4] [Length 512] [Gzip -] [Sent-to 10.0.2.1] "{user_agent}" "-"')
+
+
+def test_parse():
+    request = RequestFilter.parse(log_line(404, '/a?b=1', 'curl/8.0'))
+    assert request == {
+        'status': 404, 'method': 'GET', 'host': 'app-1-local-10092.example.com', 'path': '/a?b=1',
+        'user_agent': 'curl/8.0'
+    }
+
+
+def test_parse_unknown_format():
+    assert RequestFilter.parse('no es una línea de nginx') is None
+
+
+def test_disabled_without_filters():
+    request_filter = RequestFilter(paths=[], user_agents=[], statuses=[])
+    assert not request_filter.enabled
+    assert request_filter.accepts(log_line(404, '/wp-login.php', 'bot'))
+
+
+def test_filters():
+    request_filter = RequestFilter(paths=[r'^/wp-', r'\.env$'], user_agents=['bot', 'zgrab'], statuses=[400, 444])
+    assert request_filter.enabled
+    assert request_filter.accepts(log_line())
+    assert not request_filter.accepts(log_line(path='/wp-login.php'))
+    assert not request_filter.accepts(log_line(path='/app/.env'))
+    assert not request_filter.accepts(log_line(user_agent='Mozilla/5.0 (compatible; Googlebot/2.1)'))
+    assert not request_filter.accepts(log_line(user_agent='ZGRAB/0.x'))
+    assert not request_filter.accepts(log_line(status=444))
+
+
+def test_unknown_lines_are_accepted():
+    request_filter = RequestFilter(paths=['.*'], user_agents=[], statuses=[])
+    assert request_filter.accepts('línea con otro formato')
+
+
+def test_accepts_any():
+    request_filter = RequestFilter(paths=[], user_agents=['bot'], statuses=[])
+    assert not request_filter.accepts_any([log_line(user_agent='bot'), log_line(user_agent='bot/2')])
+    assert request_filter.accepts_any([log_line(user_agent='bot'), log_line()])
+    assert not request_filter.accepts_any([])
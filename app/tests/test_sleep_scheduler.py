@@ -0,0 +1,54 @@
+import threading
+import time
+
+from modules.helpers.sleep_scheduler import SleepScheduler
+
+
+def test_returns_only_expired_stacks():
+    scheduler = SleepScheduler()
+    now = time.time()
+    scheduler.schedule('a', now - 2)
+    scheduler.schedule('b', now - 1)
+    scheduler.schedule('c', now + 60)
+    assert scheduler.wait_expired(0) == ['a', 'b']
+    assert scheduler.wait_expired(0) == []
+    assert scheduler.get_deadline('c') == now + 60
+
+
+def test_reschedule_replaces_deadline():
+    scheduler = SleepScheduler()
+    scheduler.schedule('a', time.time() - 1)
+    scheduler.schedule('a', time.time() + 60)
+    assert scheduler.wait_expired(0) == []
+
+
+def test_unschedule():
+    scheduler = SleepScheduler()
+    scheduler.schedule('a', time.time() - 1)
+    scheduler.unschedule('a')
+    assert scheduler.wait_expired(0) == []
+    assert scheduler.get_deadline('a') is None
+
+
+def test_waits_until_deadline():
+    scheduler = SleepScheduler()
+    scheduler.schedule('a', time.time() + 0.2)
+    start = time.monotonic()
+    assert scheduler.wait_expired(5) == ['a']
+    assert 0.15 <= time.monotonic() - start < 2
+
+
+def test_wakes_up_on_earlier_deadline():
+    scheduler = SleepScheduler()
+    scheduler.schedule('late', time.time() + 60)
+    threading.Timer(0.1, lambda: scheduler.schedule('soon', time.time())).start()
+    start = time.monotonic()
+    assert scheduler.wait_expired(5) == ['soon']
+    assert time.monotonic() - start < 2
+
+
+def test_compacts_stale_heap_entries():
+    scheduler = SleepScheduler()
+    for i in range(1000):
+        scheduler.schedule('a', time.time() + 60 + i)
+    assert len(scheduler.heap) <= 4 * len(scheduler.deadlines) + 64 + 1
@@ -0,0 +1,111 @@
+import http.server
+import socket
+import threading
+
+import pytest
+
+from utils.utils_network import UtilsNetwork
+
+
+@pytest.mark.parametrize('response, scheme, expected', [
+    (b'HTTP/1.1 200 OK\r\nContent-Type: text/html\r\n\r\n<html>', 'http', 'http'),
+    (b'HTTP/1.1 200 OK\r\n\r\n', 'https', 'https'),
+    (b'HTTP/1.1 301 Moved Permanently\r\nLocation: https://example.com/\r\n\r\n', 'http', 'https'),
+    (b'HTTP/1.1 302 Found\r\nlocation: https://example.com/\r\n\r\n', 'http', 'https'),
+    (b'HTTP/1.1 302 Found\r\nLocation: http://example.com/login\r\n\r\n', 'http', 'http'),
+    (b'HTTP/1.0 400 Bad Request\r\n\r\n', 'http', 'http'),
+    (b'HTTP/1.1 400 Bad Request\r\n\r\n<center>The plain HTTP request was sent to HTTPS port</center>', 'http', 'https'),
+    (b'HTTP/1.1 400 Bad Request\r\nX-Proto: https\r\n\r\nmalformed request', 'http', 'http'),
+    (b'HTTP/1.1 200 OK\r\nX-Location: https://example.com/\r\n\r\n', 'http', 'http'),
+    (b'SSH-2.0-OpenSSH_9.6\r\n', 'http', None),
+    (b'', 'http', None),
+])
+def test_classify_http_response(response, scheme, expected):
+    assert UtilsNetwork._classify_http_response(response, scheme) == expected
+
+
+class OkHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(200)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class RedirectHandler(OkHandler):
+    def do_GET(self):
+        self.send_response(301)
+        self.send_header('Location', 'https://example.com/')
+        self.end_headers()
+
+
+class HttpsPortHandler(OkHandler):
+    def do_GET(self):
+        body = b'<html><center>The plain HTTP request was sent to HTTPS port</center></html>'
+        self.send_response(400)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class StrictHandler(RedirectHandler):
+    """
+    No contesta al ClientHello y responde 400 si la petición no llega limpia, como un servidor
+    que espera más datos antes de analizar la petición
+    """
+
+    def handle_one_request(self):
+        first = self.rfile.peek(1)[:1]
+        if first == b'\x16':
+            self.rfile.read1(65536)
+            self.rfile.read1(65536)
+            self.wfile.write(b'HTTP/1.1 400 Bad Request\r\nConnection: close\r\n\r\n')
+            self.close_connection = True
+            return
+        super().handle_one_request()
+
+
+@pytest.fixture
+def serve():
+    servers = []
+
+    def serve(handler) -> int:
+        server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server.server_address[1]
+
+    yield serve
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def test_check_protocols(serve):
+    silent = socket.socket()
+    silent.bind(('127.0.0.1', 0))
+    silent.listen()
+    try:
+        targets = {
+            ('127.0.0.1', serve(OkHandler)): 'http',
+            ('127.0.0.1', serve(RedirectHandler)): 'https',
+            ('127.0.0.1', serve(HttpsPortHandler)): 'https',
+            ('127.0.0.1', serve(StrictHandler)): 'https',
+            ('127.0.0.1', silent.getsockname()[1]): 'tcp',
+            ('0.0.0.0', 80): 'none',
+        }
+        assert UtilsNetwork.check_protocols(targets, deadline=10, timeout=0.5) == targets
+    finally:
+        silent.close()
+
+
+def test_check_protocols_deadline():
+    silent = socket.socket()
+    silent.bind(('127.0.0.1', 0))
+    silent.listen()
+    try:
+        target = ('127.0.0.1', silent.getsockname()[1])
+        assert UtilsNetwork.check_protocols([target], deadline=0.2, timeout=5) == {target: 'none'}
+    finally:
+        silent.close()
@@ -0,0 +1,128 @@
+import threading
+import time
+
+from modules.helpers.wake_pipeline import WakeAdmissionController, WakeQueue, WakeStarterPool
+
+
+def test_queue_is_fifo_and_deduplicates():
+    queue = WakeQueue()
+
+    assert queue.put('web')
+    assert queue.put('db')
+    assert not queue.put('web')
+
+    assert queue.get(timeout=0) == 'web'
+    assert queue.get(timeout=0) == 'db'
+    assert queue.get(timeout=0) is None
+
+
+def test_stack_in_progress_is_not_queued_again():
+    queue = WakeQueue()
+    queue.put('web')
+    queue.get(timeout=0)
+
+    assert not queue.put('web')
+    queue.done('web')
+    assert queue.put('web')
+
+
+def test_full_queue_drops_requests():
+    queue = WakeQueue(maxsize=2)
+
+    assert queue.put('a') and queue.put('b')
+    assert not queue.put('c')
+    assert [queue.get(timeout=0), queue.get(timeout=0)] == ['a', 'b']
+
+
+def test_get_waits_for_put():
+    queue = WakeQueue()
+    threading.Timer(0.05, queue.put, ('web',)).start()
+
+    assert queue.get(timeout=1) == 'web'
+
+
+def test_starter_pool_starts_stacks_in_parallel():
+    queue = WakeQueue()
+    started = []
+    barrier = threading.Barrier(3, timeout=1)
+
+    def start(stack_name):
+        # Los tres arranques tienen que estar en curso a la vez para pasar la barrera
+        barrier.wait()
+        started.append(stack_name)
+
+    WakeStarterPool(queue, start, workers=3).start()
+    for stack_name in ('a', 'b', 'c'):
+        queue.put(stack_name)
+
+    deadline = time.monotonic() + 1
+    while len(started) < 3 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert sorted(started) == ['a', 'b', 'c']
+
+
+def test_starter_pool_survives_errors_and_releases_stack():
+    queue = WakeQueue()
+    calls = []
+
+    def start(stack_name):
+        calls.append(stack_name)
+        raise RuntimeError('error')
+
+    WakeStarterPool(queue, start, workers=1).start()
+    queue.put('web')
+
+    deadline = time.monotonic() + 1
+    while (not calls or queue.in_progress) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert calls == ['web']
+    assert queue.put('web')
+
+
+def test_admission_cooldown():
+    admission = WakeAdmissionController(max_concurrent_starts=1, cooldown=0.1, stacks_priority=[])
+    queue = WakeQueue(admission=admission)
+
+    assert queue.put('web')
+    admission.acquire()
+    queue.done(queue.get(timeout=0))
+    admission.release('web')
+
+    # Recién arrancado: se descarta hasta que pasa el enfriamiento
+    assert not queue.put('web')
+    time.sleep(0.1)
+    assert queue.put('web')
+
+
+def test_admission_priority_then_fifo():
+    admission = WakeAdmissionController(max_concurrent_starts=1, cooldown=0, stacks_priority=['db', 'proxy'])
+    queue = WakeQueue(admission=admission)
+    for stack_name in ('a', 'proxy', 'b', 'db'):
+        queue.put(stack_name)
+
+    assert [queue.get(timeout=0) for _ in range(4)] == ['db', 'proxy', 'a', 'b']
+
+
+def test_admission_limits_concurrent_starts():
+    admission = WakeAdmissionController(max_concurrent_starts=2, cooldown=0, stacks_priority=[])
+    queue = WakeQueue(admission=admission)
+    running, max_running = [], []
+    lock = threading.Lock()
+
+    def start(stack_name):
+        with lock:
+            running.append(stack_name)
+            max_running.append(len(running))
+        time.sleep(0.05)
+        with lock:
+            running.remove(stack_name)
+
+    WakeStarterPool(queue, start, workers=4).start()
+    for i in range(6):
+        queue.put(f'stack-{i}')
+
+    deadline = time.monotonic() + 2
+    while (len(max_running) < 6 or queue.in_progress) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(max_running) == 6
+    assert max(max_running) == 2
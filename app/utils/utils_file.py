@@ -6,4 +6,12 @@ class UtilsFile:
 
     @staticmethod
     def exists_directory(directory):
-        return os.path.exists(directory)
\ No newline at end of file
+        return os.path.exists(directory)
+
+    @staticmethod
+    def size_to_human(size_in_bytes: int) -> str:
+        size = float(size_in_bytes)
+        for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
+            if abs(size) < 1024 or unit == 'TB':
+                return f'{size:.1f} {unit}'
+            size /= 1024
@@ -1,6 +1,10 @@
+import asyncio
+import ipaddress
+import re
 import socket
+import ssl
 import statistics
-from typing import Union, List, Literal
+from typing import Union, List, Literal, Dict, Iterable, Optional, Tuple
 
 import ntplib
 import requests
@@ -14,6 +18,10 @@ import warnings
 
 warnings.filterwarnings('ignore', message='Unverified HTTPS request')
 
+REDIRECTION_STATUS_CODES = (301, 302, 303, 307, 308)
+
+HTTP_BAD_REQUEST_REGEX = re.compile(rb'HTTP/\S+ 400 ')
+
 
 class UtilsNetwork:
 
@@ -201,3 +209,193 @@ class UtilsNetwork:
             'http' if UtilsNetwork.check_http(host, port) else \
             'tcp' if UtilsNetwork.check_tcp(host, port) else \
             'udp' if UtilsNetwork.check_udp(host, port) else 'none'
+
+    @staticmethod
+    def _parse_http_response(response: bytes) -> Tuple[Optional[int], str]:
+        """Código de estado y cabecera Location de la respuesta HTTP (None si no es HTTP)"""
+        head = response.split(b'\r\n\r\n', 1)[0].decode('latin-1')
+        lines = head.split('\r\n')
+        parts = lines[0].split(' ')
+        if not parts[0].startswith('HTTP/') or len(parts) < 2 or not parts[1].isdigit():
+            return None, ''
+        location = ''
+        for line in lines[1:]:
+            name, _, value = line.partition(':')
+            if name.strip().lower() == 'location':
+                location = value.strip()
+        return int(parts[1]), location
+
+    @staticmethod
+    def _classify_http_response(response: bytes, scheme: Literal['https', 'http']) -> Optional[str]:
+        """
+        Mismo criterio que check_protocol: una redirección a https es 'https'
+        aunque el puerto hable HTTP plano, igual que un 400 que avisa de que el
+        puerto espera HTTPS (p. ej. "The plain HTTP request was sent to HTTPS
+        port" de nginx); el resto de respuestas, el esquema con el que se ha
+        hablado
+        """
+        status, location = UtilsNetwork._parse_http_response(response)
+        if status is None:
+            return None
+        if status in REDIRECTION_STATUS_CODES and location.startswith('https'):
+            return 'https'
+        if status == 400 and b'https' in response.partition(b'\r\n\r\n')[2].lower():
+            return 'https'
+        return scheme
+
+    @staticmethod
+    def _http_request(host, port) -> bytes:
+        return f'GET / HTTP/1.1\r\nHost: {host}:{port}\r\nConnection: close\r\n\r\n'.encode()
+
+    @staticmethod
+    async def _read_http_head(read, timeout: float) -> bytes:
+        """
+        Lee hasta el final de las cabeceras (en un 400, también el cuerpo, que puede
+        indicar que el puerto es HTTPS), el cierre de la conexión o el timeout
+        """
+        response = b''
+        try:
+            while (b'\r\n\r\n' not in response or HTTP_BAD_REQUEST_REGEX.match(response)) and len(response) < 65536:
+                chunk = await asyncio.wait_for(read(), timeout)
+                if not chunk:
+                    break
+                response += chunk
+        except (asyncio.TimeoutError, ConnectionError, ssl.SSLError):
+            pass
+        return response
+
+    @staticmethod
+    async def _sniff_tls(host, port, reader, writer, tls: ssl.SSLObject,
+                         incoming: ssl.MemoryBIO, outgoing: ssl.MemoryBIO, data: bytes, timeout: float) -> str:
+        """Termina el handshake TLS sobre la conexión abierta y hace la petición HTTP cifrada"""
+        try:
+            while True:
+                incoming.write(data)
+                try:
+                    tls.do_handshake()
+                    break
+                except ssl.SSLWantReadError:
+                    if outgoing.pending:
+                        writer.write(outgoing.read())
+                        await writer.drain()
+                    data = await asyncio.wait_for(reader.read(4096), timeout)
+                    if not data:
+                        return 'https'
+            tls.write(UtilsNetwork._http_request(host, port))
+            writer.write(outgoing.read())
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError, ssl.SSLError):
+            # El servidor ha contestado con registros TLS: es https aunque no se complete
+            return 'https'
+
+        async def read_tls() -> bytes:
+            while True:
+                try:
+                    return tls.read(4096)
+                except ssl.SSLWantReadError:
+                    chunk = await reader.read(4096)
+                    if not chunk:
+                        return b''
+                    incoming.write(chunk)
+                except ssl.SSLZeroReturnError:
+                    return b''
+
+        response = await UtilsNetwork._read_http_head(read_tls, timeout)
+        return UtilsNetwork._classify_http_response(response, 'https') or 'https'
+
+    @staticmethod
+    async def _sniff_http(host, port, timeout: float) -> Optional[str]:
+        """Petición HTTP plana en una conexión nueva; None si no se puede conectar"""
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+        except (asyncio.TimeoutError, OSError):
+            return None
+        try:
+            writer.write(UtilsNetwork._http_request(host, port))
+            await writer.drain()
+            response = await UtilsNetwork._read_http_head(lambda: reader.read(4096), timeout)
+        except ConnectionError:
+            response = b''
+        finally:
+            writer.close()
+        return UtilsNetwork._classify_http_response(response, 'http') or 'tcp'
+
+    @staticmethod
+    async def sniff_protocol(host, port, timeout: float = 2) -> str:
+        """
+        Variante rápida de check_protocol: envía un ClientHello TLS
+        (ssl.MemoryBIO) y, si el servidor contesta con TLS, sigue con HTTPS
+        sobre el mismo socket. Si no, la petición HTTP plana va en una conexión
+        nueva: en la misma, el servidor la recibiría detrás del ClientHello y
+        contestaría a una petición mal formada.
+        """
+        if host == '0.0.0.0':
+            return 'none'
+
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+        except (asyncio.TimeoutError, OSError):
+            return 'udp' if UtilsNetwork.check_udp(host, port) else 'none'
+
+        try:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+            try:
+                ipaddress.ip_address(host)
+                server_hostname = None
+            except ValueError:
+                server_hostname = host
+            incoming, outgoing = ssl.MemoryBIO(), ssl.MemoryBIO()
+            tls = context.wrap_bio(incoming, outgoing, server_hostname=server_hostname)
+            try:
+                tls.do_handshake()
+            except ssl.SSLWantReadError:
+                pass
+
+            try:
+                writer.write(outgoing.read())
+                await writer.drain()
+                data = await asyncio.wait_for(reader.read(4096), timeout)
+            except asyncio.TimeoutError:
+                # Sin respuesta al ClientHello: puede ser HTTP esperando más datos o un servicio TCP
+                data = None
+            except ConnectionError:
+                data = b''
+
+            # Registro TLS de handshake (0x16) o de alerta (0x15)
+            if data and data[0] in (0x15, 0x16):
+                return await UtilsNetwork._sniff_tls(host, port, reader, writer, tls, incoming, outgoing, data,
+                                                     timeout)
+        finally:
+            writer.close()
+
+        # Sin respuesta TLS al ClientHello (silencio, un 400 de un servidor HTTP o cierre de la conexión)
+        protocol = await UtilsNetwork._sniff_http(host, port, timeout)
+        if protocol is None:
+            return 'http' if data and data.startswith(b'HTTP/') else 'tcp'
+        return protocol
+
+    @staticmethod
+    async def sniff_protocols(targets: Iterable[Tuple[str, int]], deadline: float,
+                              timeout: float = 2) -> Dict[Tuple[str, int], str]:
+        """Clasifica todos los puertos a la vez; los que no terminan antes de deadline quedan en 'none'"""
+        targets = list(dict.fromkeys(targets))
+        if not targets:
+            return {}
+        tasks = {asyncio.ensure_future(UtilsNetwork.sniff_protocol(host, port, timeout)): (host, port)
+                 for host, port in targets}
+        done, pending = await asyncio.wait(tasks, timeout=deadline)
+        for task in pending:
+            task.cancel()
+        protocols = {target: 'none' for target in targets}
+        for task in done:
+            if task.exception() is None:
+                protocols[tasks[task]] = task.result()
+        return protocols
+
+    @staticmethod
+    def check_protocols(targets: Iterable[Tuple[str, int]], deadline: float = 10,
+                        timeout: float = 2) -> Dict[Tuple[str, int], str]:
+        """Punto de entrada síncrono de sniff_protocols para los monitores, que se ejecutan en hilos"""
+        return asyncio.run(UtilsNetwork.sniff_protocols(targets, deadline, timeout))